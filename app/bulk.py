@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+批量登记（bulk certify）：一次请求导入一份 NDJSON 清单，每行一个 cert：
+
+    {"cert_id": "A-0001", "file_path": "/archive/a.mp4", "case_id": "...", "title": "...", "owner": "..."}
+    {"cert_id": "A-0002", "sha256": "<hex>", "title": "..."}     # 已知摘要时可以不给 file_path
+
+按块（BULK_CHUNK，默认 2000 行）处理，每块：
+- 缺 sha256 的文件交给 FileHasher.digest_many 并发求摘要（走文件指纹缓存）；
+- 叶子一次追加进当天的 Merkle 批次（日根锚定，不再一 cert 一次上链）；
+- 证据 / 业务字段 / 回执交给 Storage.write_batch 一次写入（sqlite 下为一个事务里的 executemany）；
+- 可选 TSA 时间戳：整块并发提交（连接池 / 并发上限 / 对冲），回执一个事务落库。
+单行出错（JSON 不合法、缺 cert_id、文件不存在）只记入 failed，不影响同块其它行。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app import rfc3161, tsa_client
+from app.db_executor import executor as db_executor
+
+BULK_CHUNK = 2000
+MAX_ERRORS = 100
+META_FIELDS = ("case_id", "title", "owner", "source", "notes")
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+_SHA256_RE = re.compile(r"[0-9a-fA-F]{64}")
+
+
+def _is_sha256(v) -> bool:
+    # 不用 bytes.fromhex：它会跳过空白，"aa aa ..." 这种 64 字符的串也能通过
+    return isinstance(v, str) and _SHA256_RE.fullmatch(v) is not None
+
+
+def parse_manifest(lines: Iterable) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """逐行解析：(行号, item, None) 或 (行号, None, 错误)；空行跳过"""
+    for n, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8-sig" if n == 1 else "utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            yield n, None, f"invalid json: {e}"
+            continue
+        if isinstance(item, dict) and isinstance(item.get("sha256"), str):
+            item["sha256"] = item["sha256"].strip().lower()
+        if not isinstance(item, dict) or not str(item.get("cert_id") or "").strip():
+            yield n, None, "cert_id required"
+        elif not item.get("file_path") and not item.get("sha256"):
+            yield n, None, "file_path or sha256 required"
+        elif item.get("sha256") and not _is_sha256(item["sha256"]):
+            yield n, None, "sha256 must be 64 hex chars"
+        else:
+            item["cert_id"] = str(item["cert_id"]).strip()
+            yield n, item, None
+
+
+def chunked(it: Iterable, size: int) -> Iterator[list]:
+    buf = []
+    for x in it:
+        buf.append(x)
+        if len(buf) >= size:
+            yield buf
+            buf = []
+    if buf:
+        yield buf
+
+
+class BulkCertifier:
+    """
+    storage: app.storage.Storage；ledger: MerkleLedger；hasher: FileHasher；
+    on_receipts(list[(cert_id, item)])：回执已落库后调用，main.py 用它同步内存回执表 / 失效页面缓存。
+    """
+
+    def __init__(self, storage, ledger, hasher, on_receipts: Optional[Callable[[list], None]] = None):
+        self.storage = storage
+        self.ledger = ledger
+        self.hasher = hasher
+        self.on_receipts = on_receipts
+
+    def _digests(self, items: List[dict], errors: list) -> List[Tuple[dict, str]]:
+        need = list(dict.fromkeys(it["file_path"] for it in items if not it.get("sha256")))
+        hashed = self.hasher.digest_many(need, ("sha256",)) if need else {}
+        out = []
+        for it in items:
+            if it.get("sha256"):
+                out.append((it, str(it["sha256"]).lower()))
+                continue
+            d = hashed.get(it["file_path"], {})
+            if "sha256" in d:
+                out.append((it, d["sha256"]))
+            else:
+                errors.append({"cert_id": it["cert_id"], "error": d.get("error", "hash failed")})
+        return out
+
+    def certify_chunk(self, items: List[dict]) -> dict:
+        """同步处理一块（放在线程池里跑）；返回 {"ok": [(cert_id, sha256)], "errors": [...]}"""
+        errors: list = []
+        ok = self._digests(items, errors)
+        if not ok:
+            return {"ok": [], "errors": errors}
+        day, first = self.ledger.add_many([(it["cert_id"], digest) for it, digest in ok])
+        now = _now()
+        receipts = [(it["cert_id"], {"provider": "chain", "status": "pending",
+                                     "txid": f"merkle:{day}#{first + j}", "time": now})
+                    for j, (it, _) in enumerate(ok)]
+        # 清单里没给的字段不写，已有值保留
+        self.storage.write_batch(
+            evidence=[{"cert_id": it["cert_id"], "sha256": digest,
+                       **{f: it[f] for f in ("file_path", *META_FIELDS) if it.get(f) is not None}}
+                      for it, digest in ok],
+            receipts=[(cert_id, r["provider"], r["status"], r["txid"], r["time"]) for cert_id, r in receipts],
+            create=True)
+        if self.on_receipts is not None:
+            self.on_receipts(receipts)
+        return {"ok": [(it["cert_id"], digest) for it, digest in ok], "errors": errors}
+
+    async def stamp_chunk(self, ok: List[Tuple[str, str]], store: Callable[[list], list]) -> dict:
+        """整块并发申请 TSA 时间戳；核对通过的回执交给 store（upgrade25._store_tokens）一次落库"""
+        client = tsa_client.client
+
+        async def one(cert_id: str, digest: str):
+            tsq = rfc3161.build_tsq(bytes.fromhex(digest), "sha256")
+            tsr = (await client.submit_hedged(tsq))[0][1]
+            nonce = rfc3161.parse_tsq(tsq)["nonce"]
+            check = rfc3161.verify_tsr(tsr, digest, nonce=nonce)
+            if not check["ok"]:
+                raise tsa_client.TSAError(check["reason"])
+            return cert_id, tsr, rfc3161.parse_tsr(tsr)
+
+        results = await asyncio.gather(*(one(c, d) for c, d in ok), return_exceptions=True)
+        tokens = [r for r in results if not isinstance(r, BaseException)]
+        errors = [{"cert_id": c, "error": f"tsa: {r}"} for (c, _), r in zip(ok, results)
+                  if isinstance(r, BaseException)]
+        if tokens:
+            await db_executor.run(store, tokens)
+        return {"stamped": len(tokens), "errors": errors}
+
+
+class Progress:
+    """累计计数；每块结束输出一行 NDJSON"""
+
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.done = self.failed = self.stamped = self.tsa_failed = self.chunks = 0
+        self.errors: List[Dict] = []
+
+    def add_errors(self, errors: List[Dict], tsa: bool = False) -> None:
+        """登记失败的行（tsa=True 表示 cert 已登记、只是时间戳没拿到）；明细最多留 MAX_ERRORS 条"""
+        if tsa:
+            self.tsa_failed += len(errors)
+        else:
+            self.failed += len(errors)
+        self.errors.extend(errors[:max(0, MAX_ERRORS - len(self.errors))])
+
+    def snapshot(self, final: bool = False) -> dict:
+        elapsed = time.perf_counter() - self.t0
+        out = {"done": self.done, "failed": self.failed, "stamped": self.stamped, "tsa_failed": self.tsa_failed,
+               "chunks": self.chunks,
+               "elapsed_s": round(elapsed, 3), "certs_per_s": round(self.done / elapsed, 1) if elapsed else None}
+        if final:
+            out.update({"final": True, "errors": self.errors})
+        return out
+
+    def line(self, final: bool = False) -> bytes:
+        return (json.dumps(self.snapshot(final), ensure_ascii=False) + "\n").encode("utf-8")
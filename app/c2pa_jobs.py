@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+"""
+C2PA 写签任务队列：任务落 SQLite（c2pa_jobs 表），由有界进程池执行 c2patool。
+
+- submit() 只登记任务并立即返回 job id，请求线程不等 c2patool；
+- 后台调度线程按空闲 worker 数从表里领取 queued 任务（UPDATE ... RETURNING），交给进程池；
+- 去重键 (输入文件 sha256, claim 哈希, 签名证书指纹)：相同的活已经完成 / 正在做时直接返回那个任务；
+- 完成（成功或失败）后依次调用 on_done 里的 fn(job)，main.py 用它写回执；
+- 进程重启后把残留的 running 任务放回 queued 重跑（c2patool 带 -f，输出会被覆盖）；
+- worker 进程意外退出（BrokenProcessPool）时重建进程池，受影响的任务放回 queued，
+  同一任务累计领取 C2PA_MAX_ATTEMPTS 次（默认 3）仍打断进程池才记为 failed。
+
+并发：C2PA_WORKERS（默认 min(4, CPU)）；c2patool 路径：C2PA_TOOL；单个任务超时：C2PA_TIMEOUT 秒。
+构造 C2PAQueue 不碰数据库，第一次提交 / 查询时才把表结构迁移挂到连接池上。
+假定只有一个进程在消费这张表（与 receipt_writer 相同的部署前提）。
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from app import schema
+from app.hashing import hasher
+from app.sqlite_pool import pool as sqlite_pool
+
+logger = logging.getLogger("verify-upgrade")
+
+# 任务结束后依次调用 fn(job: dict)
+on_done: list = []
+
+SQL_CREATE_C2PA_JOBS = """
+    CREATE TABLE IF NOT EXISTS c2pa_jobs (
+        id           INTEGER PRIMARY KEY AUTOINCREMENT,
+        cert_id      TEXT,
+        file_path    TEXT NOT NULL,
+        out_path     TEXT NOT NULL,
+        signer_cert  TEXT NOT NULL,
+        signer_key   TEXT NOT NULL,
+        claim_path   TEXT,
+        input_sha256 TEXT NOT NULL,
+        claim_hash   TEXT NOT NULL,
+        signer       TEXT NOT NULL,
+        status       TEXT NOT NULL DEFAULT 'queued',
+        attempts     INTEGER NOT NULL DEFAULT 0,
+        out_sha256   TEXT,
+        error        TEXT,
+        elapsed_ms   REAL,
+        created_at   TEXT,
+        started_at   TEXT,
+        finished_at  TEXT
+    )
+"""
+SQL_CREATE_C2PA_JOBS_DEDUP = """
+    CREATE INDEX IF NOT EXISTS idx_c2pa_jobs_dedup ON c2pa_jobs (input_sha256, claim_hash, signer, status)
+"""
+SQL_CREATE_C2PA_JOBS_STATUS = "CREATE INDEX IF NOT EXISTS idx_c2pa_jobs_status ON c2pa_jobs (status, id)"
+SQL_INSERT_C2PA_JOB = """
+    INSERT INTO c2pa_jobs (cert_id, file_path, out_path, signer_cert, signer_key, claim_path,
+                           input_sha256, claim_hash, signer, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+# 已完成的优先，其次是还在排队 / 执行的；失败的不算，可以重新提交
+SQL_SELECT_C2PA_DEDUP = """
+    SELECT id FROM c2pa_jobs
+    WHERE input_sha256 = ? AND claim_hash = ? AND signer = ? AND status IN ('done', 'running', 'queued')
+    ORDER BY status = 'done' DESC, id DESC LIMIT 1
+"""
+SQL_CLAIM_C2PA_JOBS = """
+    UPDATE c2pa_jobs SET status = 'running', attempts = attempts + 1, started_at = ?
+    WHERE id IN (SELECT id FROM c2pa_jobs WHERE status = 'queued' ORDER BY id LIMIT ?)
+    RETURNING id, file_path, out_path, signer_cert, signer_key, claim_path
+"""
+SQL_FINISH_C2PA_JOB = """
+    UPDATE c2pa_jobs SET status = ?, out_sha256 = ?, error = ?, elapsed_ms = ?, finished_at = ?
+    WHERE id = ?
+"""
+SQL_REQUEUE_C2PA_RUNNING = "UPDATE c2pa_jobs SET status = 'queued' WHERE status = 'running'"
+# 进程池坏掉时把已领取的任务放回队列；没交给进程池的把 attempts 退回去（第一个参数 1），已经在跑的不退（0）
+SQL_REQUEUE_C2PA_JOB = "UPDATE c2pa_jobs SET status = 'queued', attempts = attempts - ?, started_at = NULL WHERE id = ?"
+SQL_SELECT_C2PA_JOB = "SELECT * FROM c2pa_jobs WHERE id = ?"
+SQL_COUNT_C2PA_JOBS = "SELECT status, COUNT(*) FROM c2pa_jobs GROUP BY status"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _file_sha256(path: Optional[str]) -> str:
+    """claim / 证书这类小文件直接整读；没给 claim 时记空串的摘要"""
+    if not path:
+        return hashlib.sha256(b"").hexdigest()
+    with open(path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def default_out_path(file_path: str) -> str:
+    stem, ext = os.path.splitext(file_path)
+    return f"{stem}-signed{ext}"
+
+
+def run_c2patool(tool: str, file_path: str, out_path: str, signer_cert: str, signer_key: str,
+                 claim_path: Optional[str], timeout: float) -> dict:
+    """
+    在 worker 进程里执行：把 claim 与签名证书 / 私钥合成一份 manifest，调用
+    `c2patool <file> -m <manifest> -o <out> -f`，返回输出文件摘要。失败抛 RuntimeError（可 pickle）。
+    """
+    manifest = {}
+    if claim_path:
+        with open(claim_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    manifest.setdefault("alg", "ps256")
+    manifest["sign_cert"] = os.path.abspath(signer_cert)
+    manifest["private_key"] = os.path.abspath(signer_key)
+
+    t0 = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="c2pa-") as tmp:
+        mpath = os.path.join(tmp, "manifest.json")
+        with open(mpath, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        try:
+            p = subprocess.run([tool, file_path, "-m", mpath, "-o", out_path, "-f"],
+                               capture_output=True, text=True, timeout=timeout)
+        except FileNotFoundError:
+            raise RuntimeError(f"c2patool not found: {tool}（请先安装 c2patool 或设置 C2PA_TOOL）")
+        except subprocess.TimeoutExpired:
+            raise RuntimeError(f"c2patool timed out after {timeout:.0f}s")
+    if p.returncode != 0:
+        raise RuntimeError(f"c2patool exit {p.returncode}: {(p.stderr or p.stdout).strip()[-500:]}")
+    h = hashlib.sha256()
+    with open(out_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return {"out_sha256": h.hexdigest(), "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+
+class C2PAQueue:
+    def __init__(self, pool, workers: int = 2, tool: str = "c2patool", timeout: float = 600.0,
+                 poll: float = 1.0, max_attempts: int = 3):
+        self.pool = pool
+        self.workers = max(1, int(workers))
+        self.tool = tool
+        self.timeout = timeout
+        self.poll = poll
+        self.max_attempts = max(1, int(max_attempts))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stop = False
+        self._lock = threading.Lock()
+        self._inflight: Dict[Future, Tuple[int, ProcessPoolExecutor]] = {}
+        self._finished: list = []
+
+    def _attach(self) -> None:
+        # c2pa_jobs 由 app/schema.py 的迁移建；放到第一次用时挂，import 本模块不产生副作用
+        schema.attach(self.pool)
+
+    @classmethod
+    def from_env(cls, pool) -> "C2PAQueue":
+        return cls(
+            pool,
+            workers=int(os.getenv("C2PA_WORKERS", str(min(4, os.cpu_count() or 1)))),
+            tool=os.getenv("C2PA_TOOL", "c2patool"),
+            timeout=float(os.getenv("C2PA_TIMEOUT", "600")),
+            max_attempts=int(os.getenv("C2PA_MAX_ATTEMPTS", "3")),
+        )
+
+    # ---------- 生产者 ----------
+    def submit(self, file_path: str, signer_cert: str, signer_key: str, claim_path: Optional[str] = None,
+               out_path: Optional[str] = None, cert_id: Optional[str] = None) -> dict:
+        """登记任务（输入文件 / 证书 / claim 不存在时抛 OSError）；返回 {"job_id", "status", "deduped"}"""
+        if not os.path.exists(signer_key):
+            raise FileNotFoundError(2, "No such file or directory", signer_key)
+        key = (hasher.sha256(file_path), _file_sha256(claim_path), _file_sha256(signer_cert))
+        self._attach()
+        with self._lock, self.pool.transaction(create=True) as conn:
+            row = conn.execute(SQL_SELECT_C2PA_DEDUP, key).fetchone()
+            if row is not None:
+                job = self.get(row[0])
+                return {"job_id": job["id"], "status": job["status"], "deduped": True}
+            cur = conn.execute(SQL_INSERT_C2PA_JOB, (
+                cert_id, file_path, out_path or default_out_path(file_path), signer_cert, signer_key,
+                claim_path, *key, _now()))
+            job_id = cur.lastrowid
+        self._ensure_thread()
+        self._wake.set()
+        return {"job_id": job_id, "status": "queued", "deduped": False}
+
+    def get(self, job_id: int) -> Optional[dict]:
+        self._attach()
+        conn = self.pool.conn()
+        if conn is None:
+            return None
+        cur = conn.execute(SQL_SELECT_C2PA_JOB, (job_id,))
+        row = cur.fetchone()
+        return None if row is None else dict(zip([d[0] for d in cur.description], row))
+
+    def counts(self) -> Dict[str, int]:
+        self._attach()
+        conn = self.pool.conn()
+        return dict(conn.execute(SQL_COUNT_C2PA_JOBS).fetchall()) if conn else {}
+
+    def wait(self, job_id: int, timeout: float = 30.0) -> Optional[dict]:
+        """轮询到任务结束（测试 / 脚本用）"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in ("done", "failed") or time.monotonic() >= deadline:
+                return job
+            time.sleep(0.02)
+
+    def close(self) -> None:
+        """停调度线程；正在跑的 c2patool 不等，下次启动时重新入队"""
+        with self._lock:
+            self._stop = True
+            t, ex = self._thread, self._executor
+            self._thread = self._executor = None
+        self._wake.set()
+        if t is not None:
+            t.join(5.0)
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+        self._stop = False
+
+    # ---------- 调度线程 ----------
+    def _ensure_thread(self) -> None:
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._attach()
+                with self.pool.transaction(create=True) as conn:
+                    conn.execute(SQL_REQUEUE_C2PA_RUNNING)
+                self._executor = self._new_executor()
+                t = threading.Thread(target=self._run, name="c2pa-dispatcher", daemon=True)
+                t.start()
+                self._thread = t
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # fork 一个带线程的进程不安全，用 spawn；worker 只需要导入本模块
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _rebuild(self, broken: ProcessPoolExecutor) -> None:
+        """broken 还是当前进程池时换一个新的；同一个坏池上的多个任务只重建一次"""
+        with self._lock:
+            if self._stop or self._executor is not broken:
+                return
+            self._executor = self._new_executor()
+        logger.warning("c2pa: worker process died, process pool rebuilt")
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _requeue(self, job_ids, refund: int) -> None:
+        with self.pool.transaction() as conn:
+            if conn is not None:
+                conn.executemany(SQL_REQUEUE_C2PA_JOB, [(refund, j) for j in job_ids])
+
+    def _on_future(self, fut: Future) -> None:
+        with self._lock:
+            self._finished.append(fut)
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop:
+            self._wake.clear()
+            with self._lock:
+                finished, self._finished = self._finished, []
+            for fut in finished:
+                self._finish(*self._inflight.pop(fut), fut)
+            free = self.workers - len(self._inflight)
+            if free > 0:
+                try:
+                    self._dispatch(free)
+                except Exception as e:
+                    logger.warning("c2pa: dispatch failed: %s", e)
+            self._wake.wait(self.poll)
+
+    def _dispatch(self, free: int) -> None:
+        with self.pool.transaction() as conn:
+            rows = conn.execute(SQL_CLAIM_C2PA_JOBS, (_now(), free)).fetchall() if conn else []
+        ex = self._executor
+        for i, (job_id, file_path, out_path, cert, key, claim) in enumerate(rows):
+            try:
+                fut = ex.submit(run_c2patool, self.tool, file_path, out_path, cert, key, claim, self.timeout)
+            except BrokenProcessPool:
+                # 还没交出去的任务原样放回队列，下一轮交给新进程池
+                self._requeue([r[0] for r in rows[i:]], 1)
+                self._rebuild(ex)
+                self._wake.set()
+                return
+            self._inflight[fut] = (job_id, ex)
+            fut.add_done_callback(self._on_future)
+
+    def _finish(self, job_id: int, ex: ProcessPoolExecutor, fut: Future) -> None:
+        try:
+            res, err = fut.result(), None
+        except BrokenProcessPool as e:
+            self._rebuild(ex)
+            job = self.get(job_id)
+            if job is not None and job["attempts"] < self.max_attempts:
+                self._requeue([job_id], 0)
+                self._wake.set()
+                return
+            res, err = {}, f"worker process died: {e}"
+        except Exception as e:
+            res, err = {}, str(e) or type(e).__name__
+        with self.pool.transaction() as conn:
+            if conn is None:
+                return
+            conn.execute(SQL_FINISH_C2PA_JOB, ("failed" if err else "done", res.get("out_sha256"), err,
+                                               res.get("elapsed_ms"), _now(), job_id))
+        job = self.get(job_id)
+        for fn in on_done:
+            try:
+                fn(job)
+            except Exception as e:
+                logger.info("c2pa: on_done hook failed: %s", e)
+
+
+# 进程级单例：upgrade25 的 /c2pa/* 与 main.py 共用
+jobs = C2PAQueue.from_env(sqlite_pool)
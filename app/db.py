@@ -1,7 +1,9 @@
 ﻿from datetime import datetime
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Iterable, Sequence, Tuple
 
 from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text, ForeignKey, Index
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship, Session
 
 # 本地 SQLite（需要可改成你的正式连接串）
@@ -39,60 +41,121 @@ class Receipt(Base):
 # 组合索引：按证书+时间倒序查询
 Index("idx_receipts_cert_time", Receipt.cert_id, Receipt.created_at.desc())
 
-from sqlalchemy import inspect  # 放在文件顶部其它 import 附近（若已导入可忽略）
+class EvidenceMeta(Base):
+    """业务字段（与 data/verify_upgrade.db 的 evidence_meta 同构），app.storage 的 postgres 后端使用"""
+    __tablename__ = "evidence_meta"
+    cert_id = Column(String(255), primary_key=True)
+    case_id = Column(String(255), index=True)
+    title = Column(Text)
+    owner = Column(String(255))
+    source = Column(Text)
+    notes = Column(Text)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
-def init_db() -> None:
+from sqlalchemy import inspect
+
+def init_db(bind=None) -> None:
     """
-    启动自检：如果发现 cert_records 表缺少我们需要的新列，就先 drop_all 再 create_all。
-    只影响本地测试数据，不影响线上。
+    启动自检：建缺的表，给已有的表补缺的列（ALTER TABLE ADD COLUMN，可空、不带默认值）。
+    不删表、不删数据；老行的新列为 NULL，Python 侧的 default 只作用于之后的插入。
     """
-    try:
-        insp = inspect(engine)
-        cols = [c["name"] for c in insp.get_columns("cert_records")]
-    except Exception:
-        cols = []
-
-    required = {"file_path", "sha256", "c2pa_claim", "tsa_url", "sepolia_txhash"}
-    if not required.issubset(set(cols)):
-        # 表结构不完整：先全部丢弃再重建
-        Base.metadata.drop_all(bind=engine)
-
-    Base.metadata.create_all(bind=engine)
+    bind = bind or engine
+    Base.metadata.create_all(bind=bind)
+    insp = inspect(bind)
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            have = {c["name"] for c in insp.get_columns(table.name)}
+            for col in table.columns:
+                if col.name not in have:
+                    conn.exec_driver_sql(f"ALTER TABLE {table.name} ADD COLUMN {col.name} "
+                                         f"{col.type.compile(dialect=bind.dialect)}")
 
 
 def get_db() -> Session:
     return SessionLocal()
 
+# ---- 仓储函数：插入一律单条语句 + 调用方一次 commit，不再 SELECT / refresh 回读 ----
+
+def _insert_ignore(db: Session, model):
+    """按方言生成 INSERT ... ON CONFLICT (cert_id) DO NOTHING"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model).on_conflict_do_nothing(index_elements=["cert_id"])
+    if dialect == "sqlite":
+        return sqlite.insert(model).on_conflict_do_nothing(index_elements=["cert_id"])
+    return insert(model).prefix_with("IGNORE")   # MySQL
+
+
+def upsert_certs(db: Session, cert_ids: Iterable[str], commit: bool = True) -> None:
+    """批量确保 cert_records 里有这些 cert_id（已存在的不动）；一条 executemany"""
+    rows = [{"cert_id": c} for c in dict.fromkeys(cert_ids)]
+    if rows:
+        db.execute(_insert_ignore(db, CertRecord), rows)
+    if commit:
+        db.commit()
+
+
 def ensure_cert(db: Session, cert_id: str) -> CertRecord:
-    inst = db.query(CertRecord).filter(CertRecord.cert_id == cert_id).first()
-    if inst is None:
-        inst = CertRecord(cert_id=cert_id)
-        db.add(inst); db.commit(); db.refresh(inst)
-    return inst
-
-def add_receipt(db: Session, cert_id: str, provider: str, status: str, txid: Optional[str] = None) -> Receipt:
-    ensure_cert(db, cert_id)
-    r = Receipt(cert_id=cert_id, provider=provider, status=status, txid=txid)
-    db.add(r); db.commit(); db.refresh(r)
-    return r
+    """需要整行（如 get_evidence）时用；只是为了外键存在请用 upsert_certs"""
+    upsert_certs(db, [cert_id])
+    return db.execute(select(CertRecord).where(CertRecord.cert_id == cert_id)).scalar_one()
 
-def get_last_receipts(db: Session, cert_id: str, limit: int = 5) -> List[Receipt]:
-    return (db.query(Receipt)
-              .filter(Receipt.cert_id == cert_id)
-              .order_by(Receipt.created_at.desc())
-              .limit(limit)
-              .all())
 
-def get_last_status_txid(db: Session, cert_id: str) -> Dict[str, Optional[str]]:
-    last = (db.query(Receipt)
-              .filter(Receipt.cert_id == cert_id)
-              .order_by(Receipt.created_at.desc())
-              .first())
+ReceiptRow = Tuple[str, str, str, Optional[str]]   # (cert_id, provider, status, txid)
+
+
+def add_receipts(db: Session, rows: Sequence[ReceiptRow], created_at: Optional[datetime] = None) -> List[int]:
+    """
+    批量写回执：cert 先 ON CONFLICT DO NOTHING，回执 INSERT ... RETURNING id，整批只 commit 一次。
+    返回的 id 与 rows 顺序一致。
+    """
+    if not rows:
+        return []
+    now = created_at or datetime.utcnow()
+    upsert_certs(db, (r[0] for r in rows), commit=False)
+    ids = db.execute(
+        insert(Receipt).returning(Receipt.id, sort_by_parameter_order=True),
+        [{"cert_id": c, "provider": p, "status": st, "txid": tx, "created_at": now} for c, p, st, tx in rows],
+    ).scalars().all()
+    db.commit()
+    return list(ids)
+
+
+def add_receipt(db: Session, cert_id: str, provider: str, status: str, txid: Optional[str] = None) -> int:
+    """单条回执，返回新回执 id（两条语句、一次 commit）"""
+    return add_receipts(db, [(cert_id, provider, status, txid)])[0]
+
+
+def _recent_receipts(db: Session, cert_id: str, limit: int) -> List[Receipt]:
+    """get_last_receipts / get_last_status_txid 共用的一条查询（走 idx_receipts_cert_time）"""
+    stmt = (select(Receipt)
+            .where(Receipt.cert_id == cert_id)
+            .order_by(Receipt.created_at.desc(), Receipt.id.desc())
+            .limit(limit))
+    return list(db.execute(stmt).scalars())
+
+
+def _status_of(receipts: List[Receipt]) -> Dict[str, Optional[str]]:
+    last = receipts[0] if receipts else None
     return {
         "tsa_last_status": last.status if last else None,
         "tsa_last_txid": last.txid if last else None,
     }
 
+
+def get_last_receipts(db: Session, cert_id: str, limit: int = 5) -> List[Receipt]:
+    return _recent_receipts(db, cert_id, limit)
+
+
+def get_last_status_txid(db: Session, cert_id: str) -> Dict[str, Optional[str]]:
+    return _status_of(_recent_receipts(db, cert_id, 1))
+
+
+def get_receipts_and_status(db: Session, cert_id: str, limit: int = 5) -> Tuple[List[Receipt], Dict[str, Optional[str]]]:
+    """页面同时要最近回执和最新状态时用：一次查询拿齐"""
+    receipts = _recent_receipts(db, cert_id, limit)
+    return receipts, _status_of(receipts)
+
 def get_evidence(db: Session, cert_id: str) -> Dict[str, Any]:
     """页面展示需要的证据字段（示例）。"""
     cert = ensure_cert(db, cert_id)
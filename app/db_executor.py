@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+请求层的 DB 执行器：async 端点里所有阻塞的 sqlite / 存储后端调用都经这里进一个专用线程池，
+事件循环上只剩路由、参数校验、缓存命中和 httpx 异步 I/O。
+
+- 线程数 DB_WORKERS（默认 4）：sqlite_pool 按线程各开一条连接，线程数就是请求层连接数的上限；
+  WAL 下读可以并发，写由 SQLite 串行，线程再多也只是多排锁；
+- 与 anyio 的默认线程池（40 线程，StreamingResponse 的同步迭代器等也在用）分开，
+  DB 慢的时候不会把其它阻塞调用一起拖住；
+- offload：把同步端点包成 async 端点，函数体在这里跑（签名不变，FastAPI 照常解析参数）；
+- stats() 给 /health：在跑 / 排队 / 累计 / 历史最大排队。
+
+close() 之后再提交会重新建线程池（测试里 lifespan 会反复启停）。
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import inspect
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class DBExecutor:
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max(1, max_workers)
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._running = 0
+        self._queued = 0
+        self._max_queued = 0
+        self._done = 0
+
+    @classmethod
+    def from_env(cls) -> "DBExecutor":
+        return cls(max_workers=int(os.getenv("DB_WORKERS", "4")))
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="db")
+            return self._pool
+
+    def _call(self, fn: Callable, args: tuple, kwargs: dict) -> Any:
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._done += 1
+
+    def _settled(self, fut) -> None:
+        if fut.cancelled():                 # 排队时请求被取消（客户端断开）：没进过 _call
+            with self._lock:
+                self._queued -= 1
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """在 DB 线程上执行 fn(*args, **kwargs)，不占事件循环"""
+        with self._lock:
+            self._queued += 1
+            self._max_queued = max(self._max_queued, self._queued)
+        fut = self._executor().submit(self._call, fn, args, kwargs)
+        fut.add_done_callback(self._settled)
+        return await asyncio.wrap_future(fut)
+
+    def offload(self, fn: Callable) -> Callable:
+        """装饰同步端点：变成 async，函数体在 DB 线程上跑"""
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await self.run(fn, *args, **kwargs)
+        # 模块里有 `from __future__ import annotations` 时注解是字符串，FastAPI 会拿 wrapper 所在模块
+        # （也就是这里）的全局变量去解析；先按原函数的模块求值好
+        wrapper.__signature__ = inspect.signature(fn, eval_str=True)
+        return wrapper
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"workers": self.max_workers, "running": self._running, "queued": self._queued,
+                    "max_queued": self._max_queued, "done": self._done}
+
+    def close(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+executor = DBExecutor.from_env()
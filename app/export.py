@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+回执导出：真正的流式生成，内存占用与导出规模无关。
+
+- 数据源：内存 ReceiptStore（分批取视图）或 receipts 表（独立连接 + fetchmany 游标）；
+- 范围：单个 cert_id / 一组 cert_id（如某 case_id 下的全部）/ 全部；
+- 编码：CSV / NDJSON 按固定大小分块输出，客户端接受 gzip 时边压边发；
+  Parquet / Arrow IPC 直接由行元组按列拼成 RecordBatch（需要可选依赖 pyarrow）。
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import zlib
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from app.query import CompiledQuery, lower_row
+
+# 可选依赖：没装 pyarrow 时 parquet / arrow 格式不可用（接口返回 501）
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - 取决于环境
+    pa = pa_ipc = pq = None
+
+CSV_HEADER = ["cert_id", "case_id", "title", "owner", "provider", "status", "txid", "created_at"]
+CHUNK_SIZE = 64 * 1024
+FETCH_BATCH = 1000
+
+SQL_EXPORT_RECEIPTS_ALL = """
+    SELECT r.cert_id, m.case_id, m.title, m.owner, r.provider, r.status, r.txid, r.created_at
+    FROM receipts r LEFT JOIN evidence_meta m ON m.cert_id = r.cert_id
+    ORDER BY r.id
+"""
+SQL_EXPORT_RECEIPTS_CERT = """
+    SELECT r.cert_id, m.case_id, m.title, m.owner, r.provider, r.status, r.txid, r.created_at
+    FROM receipts r LEFT JOIN evidence_meta m ON m.cert_id = r.cert_id
+    WHERE r.cert_id = ?
+    ORDER BY r.id
+"""
+SQL_EXPORT_CASE_CERTS = "SELECT cert_id FROM evidence_meta WHERE case_id = ?"
+
+EVIDENCE_HEADER = ["cert_id", "case_id", "title", "owner", "source", "notes", "updated_at"]
+SQL_EXPORT_EVIDENCE_ALL = (
+    "SELECT cert_id, case_id, title, owner, source, notes, updated_at FROM evidence_meta ORDER BY cert_id"
+)
+SQL_EXPORT_EVIDENCE_CASE = (
+    "SELECT cert_id, case_id, title, owner, source, notes, updated_at FROM evidence_meta "
+    "WHERE case_id = ? ORDER BY cert_id"
+)
+
+# format -> (media_type, 文件扩展名)
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrow"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+COLUMNAR_FORMATS = ("arrow", "parquet")
+ARROW_BATCH_ROWS = 16 * 1024
+
+
+def _row_matches(cq: CompiledQuery, row: Sequence) -> bool:
+    # row 按 CSV_HEADER 排列
+    return cq.match(lower_row(row[0], {"provider": row[4], "status": row[5], "txid": row[6], "time": row[7]}))
+
+
+def sqlite_rows(conn, cert_ids: Optional[List[str]], cq: CompiledQuery,
+                batch: int = FETCH_BATCH) -> Iterator[tuple]:
+    """从 receipts 表流式读取（已联好 evidence_meta）；cert_ids=None 表示全部"""
+    plans = [(SQL_EXPORT_RECEIPTS_ALL, ())] if cert_ids is None else \
+            [(SQL_EXPORT_RECEIPTS_CERT, (c,)) for c in cert_ids]
+    for sql, args in plans:
+        cur = conn.execute(sql, args)
+        while True:
+            rows = cur.fetchmany(batch)
+            if not rows:
+                break
+            for r in rows:
+                if cq.empty or _row_matches(cq, r):
+                    yield r
+
+
+def memory_rows(store, cert_ids: Optional[List[str]], cq: CompiledQuery,
+                meta_of: Callable[[str], Optional[dict]]) -> Iterator[tuple]:
+    """从内存 ReceiptStore 分批读取；业务字段按 cert_id 懒加载并缓存"""
+    metas: Dict[str, tuple] = {}
+    match = None if cq.empty else cq.match
+    for cert_id in (cert_ids if cert_ids is not None else [""]):
+        for v in store.iter_select(cert_id, cq.index_terms(), match, cq.time_range()):
+            c = v["cert_id"]
+            m = metas.get(c)
+            if m is None:
+                try:
+                    meta = meta_of(c) or {}
+                except Exception:
+                    meta = {}
+                m = metas[c] = (meta.get("case_id") or "", meta.get("title") or "", meta.get("owner") or "")
+            yield (c, m[0], m[1], m[2], v["provider"], v["status"], v["txid"], v["created_at"])
+
+
+def case_cert_ids(conn, case_id: str) -> List[str]:
+    if conn is None:
+        return []
+    return [r[0] for r in conn.execute(SQL_EXPORT_CASE_CERTS, (case_id,))]
+
+
+def evidence_rows(conn, case_id: str = "", batch: int = FETCH_BATCH) -> Iterator[tuple]:
+    """evidence_meta 按行元组流式读取（EVIDENCE_HEADER 顺序）"""
+    if conn is None:
+        return
+    cur = conn.execute(SQL_EXPORT_EVIDENCE_CASE, (case_id,)) if case_id else conn.execute(SQL_EXPORT_EVIDENCE_ALL)
+    while True:
+        rows = cur.fetchmany(batch)
+        if not rows:
+            break
+        yield from rows
+
+
+def csv_chunks(rows: Iterable[Sequence], header: Sequence[str] = CSV_HEADER,
+               chunk_size: int = CHUNK_SIZE, bom: bool = True) -> Iterator[str]:
+    """逐行写 CSV，攒够 chunk_size 个字符就吐出一块"""
+    out = io.StringIO()
+    w = csv.writer(out)
+    if bom:
+        out.write("\ufeff")  # UTF-8 BOM，Excel 友好
+    w.writerow(header)
+    for r in rows:
+        w.writerow(r)
+        if out.tell() >= chunk_size:
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+    tail = out.getvalue()
+    if tail:
+        yield tail
+
+
+def gzip_chunks(chunks: Iterable, encoding: str = "utf-8") -> Iterator[bytes]:
+    """边压缩边输出（gzip 容器，wbits=31）"""
+    z = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for c in chunks:
+        data = z.compress(c.encode(encoding) if isinstance(c, str) else c)
+        if data:
+            yield data
+    yield z.flush()
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Accept-Encoding 里有 gzip 且 q 不为 0"""
+    for part in (accept_encoding or "").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip() != "gzip":
+            continue
+        q = 1.0
+        for p in params.split(";"):
+            k, _, v = p.strip().partition("=")
+            if k == "q":
+                try:
+                    q = float(v)
+                except ValueError:
+                    q = 0.0
+        return q > 0
+    return False
+
+
+def ndjson_chunks(rows: Iterable[Sequence], header: Sequence[str] = CSV_HEADER,
+                  chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """每行一个 JSON 对象；键的前缀预先编码好，不为每行构造 dict"""
+    keys = [json.dumps(h, ensure_ascii=False) + ":" for h in header]
+    dumps = json.JSONEncoder(ensure_ascii=False).encode
+    buf: List[str] = []
+    size = 0
+    for r in rows:
+        line = "{" + ",".join(k + dumps(v) for k, v in zip(keys, r)) + "}\n"
+        buf.append(line)
+        size += len(line)
+        if size >= chunk_size:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
+
+
+class _ChunkSink(io.RawIOBase):
+    """pyarrow 写入目标：把写进来的字节攒着，由生成器定期取走"""
+
+    def __init__(self):
+        self._parts: List[bytes] = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        data = bytes(b)
+        self._parts.append(data)
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def take(self) -> bytes:
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def columnar_available() -> bool:
+    return pa is not None
+
+
+def columnar_chunks(rows: Iterable[Sequence], header: Sequence[str], fmt: str,
+                    batch_rows: int = ARROW_BATCH_ROWS) -> Iterator[bytes]:
+    """
+    行元组 → 按列转置成 RecordBatch → Arrow IPC 流 / Parquet（每批一个 row group）。
+    所有列按字符串输出，与 CSV 语义保持一致。
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    schema = pa.schema([(h, pa.string()) for h in header])
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    writer = pa_ipc.new_stream(out, schema) if fmt == "arrow" else pq.ParquetWriter(out, schema)
+
+    def _flush(batch):
+        arrays = []
+        for col in zip(*batch):
+            try:
+                arrays.append(pa.array(col, pa.string()))
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                # 混入了非字符串值（如 sqlite 里存成整数），逐个转成 str
+                arrays.append(pa.array([None if v is None else str(v) for v in col], pa.string()))
+        rb = pa.RecordBatch.from_arrays(arrays, schema=schema)
+        if fmt == "arrow":
+            writer.write_batch(rb)
+        else:
+            writer.write_table(pa.Table.from_batches([rb]))
+
+    batch: List[Sequence] = []
+    for r in rows:
+        batch.append(r)
+        if len(batch) >= batch_rows:
+            _flush(batch)
+            batch = []
+            data = sink.take()
+            if data:
+                yield data
+    if batch:
+        _flush(batch)
+    writer.close()
+    data = sink.take()
+    if data:
+        yield data
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+文件摘要服务：TSQ 生成、evidence.sha256 等所有需要对大文件求摘要的地方共用。
+
+- 大块 readinto 到线程内复用的缓冲区，一遍读取同时喂给多个算法（sha256 / sha512 / ...）；
+- 多个文件在线程池里并发算（hashlib 对大块数据会释放 GIL）；
+- 结果按 (realpath, size, mtime_ns, inode) 缓存：文件没变，重复核验不再读盘；
+  读取前后 stat 不一致（文件正在被改写）时不进缓存。
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+DEFAULT_CHUNK = 4 * 1024 * 1024
+DEFAULT_ALGOS = ("sha256",)
+
+FileKey = Tuple[str, int, int, int]
+
+
+def file_key(path: str, st: Optional[os.stat_result] = None) -> FileKey:
+    st = st or os.stat(path)
+    return (os.path.realpath(path), st.st_size, st.st_mtime_ns, st.st_ino)
+
+
+def _fixed_length(name: str) -> bool:
+    try:
+        return hashlib.new(name).digest_size > 0
+    except ValueError:
+        return False
+
+
+# shake_128 / shake_256 这类 XOF 的 hexdigest() 要给长度，不作为文件摘要算法
+ALGORITHMS = frozenset(a for a in hashlib.algorithms_available if _fixed_length(a))
+
+
+def _norm_algos(algos: Iterable[str]) -> Tuple[str, ...]:
+    out = tuple(dict.fromkeys(a.lower().replace("-", "") for a in algos))
+    for a in out:
+        if a not in ALGORITHMS:
+            raise ValueError(f"unsupported hash algorithm: {a}")
+    return out
+
+
+class DigestCache:
+    """线程安全的 LRU：file_key -> {algo: hexdigest}；同一文件后算的算法合并进同一条"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[FileKey, Dict[str, str]]" = OrderedDict()
+
+    def get(self, key: FileKey, algos: Sequence[str]) -> Optional[Dict[str, str]]:
+        with self._lock:
+            e = self._entries.get(key)
+            if e is not None and all(a in e for a in algos):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return {a: e[a] for a in algos}
+            self.misses += 1
+            return None
+
+    def put(self, key: FileKey, digests: Dict[str, str]) -> None:
+        with self._lock:
+            e = self._entries.get(key)
+            if e is None:
+                e = self._entries[key] = {}
+            e.update(digests)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class FileHasher:
+    """
+    digest(path, algos) 单个文件；digest_many(paths, algos) 在线程池里并发。
+    每个工作线程持有自己的读缓冲（chunk_size 字节），不随文件数增长。
+    """
+
+    def __init__(self, max_workers: int = 4, chunk_size: int = DEFAULT_CHUNK,
+                 cache: Optional[DigestCache] = None):
+        self.max_workers = max_workers
+        self.chunk_size = chunk_size
+        self.cache = cache if cache is not None else DigestCache()
+        self._local = threading.local()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "FileHasher":
+        return cls(
+            max_workers=int(os.getenv("HASH_WORKERS", str(min(8, (os.cpu_count() or 2))))),
+            chunk_size=int(float(os.getenv("HASH_CHUNK_MB", "4")) * 1024 * 1024),
+            cache=DigestCache(int(os.getenv("HASH_CACHE_MAX", "4096"))),
+        )
+
+    def _buffer(self) -> memoryview:
+        buf = getattr(self._local, "buf", None)
+        if buf is None or len(buf) != self.chunk_size:
+            buf = self._local.buf = memoryview(bytearray(self.chunk_size))
+        return buf
+
+    def _compute(self, path: str, algos: Sequence[str]) -> Dict[str, str]:
+        hs = [hashlib.new(a) for a in algos]
+        buf = self._buffer()
+        with open(path, "rb", buffering=0) as f:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                chunk = buf[:n]
+                for h in hs:
+                    h.update(chunk)
+        return {a: h.hexdigest() for a, h in zip(algos, hs)}
+
+    def digest(self, path: str, algos: Iterable[str] = DEFAULT_ALGOS) -> Dict[str, str]:
+        algos = _norm_algos(algos)
+        key = file_key(path)
+        hit = self.cache.get(key, algos)
+        if hit is not None:
+            return hit
+        digests = self._compute(path, algos)
+        if file_key(path) == key:   # 读的过程中文件没被改过才缓存
+            self.cache.put(key, digests)
+        return digests
+
+    def sha256(self, path: str) -> str:
+        return self.digest(path, ("sha256",))["sha256"]
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hasher")
+            return self._pool
+
+    def digest_many(self, paths: Iterable[str], algos: Iterable[str] = DEFAULT_ALGOS,
+                    ) -> Dict[str, Dict[str, str]]:
+        """并发求多个文件的摘要；返回 {path: {algo: hex}}，失败的文件为 {"error": ...}"""
+        algos = _norm_algos(algos)
+        paths = list(dict.fromkeys(paths))
+        if len(paths) <= 1 or self.max_workers <= 1:
+            return {p: self._safe_digest(p, algos) for p in paths}
+        futs = {p: self._executor().submit(self._safe_digest, p, algos) for p in paths}
+        return {p: f.result() for p, f in futs.items()}
+
+    def _safe_digest(self, path: str, algos: Sequence[str]) -> Dict[str, str]:
+        try:
+            return self.digest(path, algos)
+        except OSError as e:
+            return {"error": f"{type(e).__name__}: {e.strerror or e}"}
+
+    def close(self) -> None:
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+
+# 进程级单例
+hasher = FileHasher.from_env()
@@ -1,5 +1,9 @@
-﻿from app.db import Base, engine
+﻿from app import schema
+from app.db import init_db
+from app.sqlite_pool import pool
 
 if __name__ == "__main__":
-    Base.metadata.create_all(bind=engine)
-    print("DB initialized.")
+    init_db()
+    applied = schema.migrate(pool.conn(create=True))
+    print(f"DB initialized. {pool.path}: schema version {schema.status(pool.conn())['version']}"
+          f"{' (applied ' + ', '.join(map(str, applied)) + ')' if applied else ''}")
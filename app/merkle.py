@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+"""
+按天的 Merkle 批量锚定：当天所有待上链的摘要组成一棵追加型 Merkle 树，
+每批只把一个根交给链 provider（N 次上链 → 1 次）。
+
+- 哈希规则同 RFC 6962：leaf = H(0x00 || data)，node = H(0x01 || left || right)，
+  不足 2 的幂时右侧不补齐（最大的 2^k 棵完整子树在左）；
+- 追加是增量的：内存里只留右边缘上各层未配对的“峰”（O(log n)），
+  已配对完成的节点一旦生成就不再变化，直接落到 merkle_nodes 表；
+- 因为完整节点不可变，任意历史 size 的根 / 包含证明都能用同一批节点算出来，
+  证明只需要 O(log n) 个节点的主键点查。
+"""
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from app import schema
+
+Key = Tuple[int, int]  # (level, idx)
+
+
+def leaf_hash(data: bytes) -> bytes:
+    return hashlib.sha256(b"\x00" + data).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def leaf_data(cert_id: str, digest: str) -> bytes:
+    """叶子内容同时绑定 cert_id 与摘要，避免同一摘要被挪用到别的 cert 上"""
+    return f"{cert_id}:{digest}".encode("utf-8")
+
+
+def _peak_keys(size: int) -> List[Key]:
+    """size 个叶子时右边缘上各层的峰，按层从低到高"""
+    return [(k, (size >> k) - 1) for k in range(size.bit_length()) if (size >> k) & 1]
+
+
+def _fold(peaks: Sequence[bytes]) -> Optional[bytes]:
+    """峰从低层往高层折叠：acc = H(peak, acc)，结果即 RFC 6962 的 MTH"""
+    acc = None
+    for h in peaks:
+        acc = h if acc is None else node_hash(h, acc)
+    return acc
+
+
+def _proof_plan(index: int, size: int):
+    """
+    包含证明需要哪些节点：
+      siblings —— 自底向上的完整兄弟节点 [(side, key)]；
+      lower    —— 到达峰之后，右侧由更低层的峰折叠而成的一个节点；
+      higher   —— 更高层的峰，依次在左侧合并。
+    """
+    if not 0 <= index < size:
+        raise IndexError(f"leaf {index} out of range for size {size}")
+    siblings: List[Tuple[str, Key]] = []
+    k, idx = 0, index
+    while (idx ^ 1) < (size >> k):
+        sib = idx ^ 1
+        siblings.append(("L" if sib < idx else "R", (k, sib)))
+        idx >>= 1
+        k += 1
+    lower = [key for key in _peak_keys(size) if key[0] < k]
+    higher = [key for key in _peak_keys(size) if key[0] > k]
+    return siblings, lower, higher
+
+
+def verify_proof(leaf: bytes, path: Iterable[Tuple[str, bytes]], root: bytes) -> bool:
+    """leaf 为叶子哈希；path 为 [(side, hash)]，side=L 表示兄弟在左"""
+    acc = leaf
+    for side, h in path:
+        acc = node_hash(h, acc) if side == "L" else node_hash(acc, h)
+    return acc == root
+
+
+class MemoryNodes:
+    """完整节点的内存存储（测试 / 基准用）；接口与 SQLite 版一致"""
+
+    def __init__(self):
+        self.levels: List[List[bytes]] = []
+
+    def put_many(self, nodes: Sequence[Tuple[int, int, bytes]]) -> None:
+        for level, idx, h in nodes:
+            while len(self.levels) <= level:
+                self.levels.append([])
+            lv = self.levels[level]
+            if idx == len(lv):
+                lv.append(h)
+            else:
+                lv[idx] = h
+
+    def get_many(self, keys: Iterable[Key]) -> Dict[Key, bytes]:
+        return {(k, i): self.levels[k][i] for k, i in keys}
+
+
+class MerkleTree:
+    """
+    追加型 Merkle 树。只在内存里保留右边缘的峰；每生成一个完整节点就交给 nodes.put_many()。
+    root(size) / proof(index, size) 可以针对任意历史 size 计算。
+    """
+
+    def __init__(self, nodes=None, size: int = 0, peaks: Optional[Dict[int, bytes]] = None):
+        self.nodes = nodes if nodes is not None else MemoryNodes()
+        self.size = size
+        if peaks is None and size:
+            got = self.nodes.get_many(_peak_keys(size))
+            peaks = {k: got[(k, i)] for k, i in _peak_keys(size)}
+        self._peaks: Dict[int, bytes] = dict(peaks or {})
+
+    def append_hashes(self, hashes: Iterable[bytes]) -> int:
+        """追加若干叶子哈希，返回第一个叶子的下标；新完整节点一次性写入存储"""
+        first = self.size
+        out: List[Tuple[int, int, bytes]] = []
+        peaks = self._peaks
+        n = self.size
+        for h in hashes:
+            out.append((0, n, h))
+            n += 1
+            k = 0
+            while k in peaks:
+                h = node_hash(peaks.pop(k), h)
+                k += 1
+                out.append((k, (n >> k) - 1, h))
+            peaks[k] = h
+        if out:
+            self.nodes.put_many(out)
+        self.size = n
+        return first
+
+    def append(self, data: bytes) -> int:
+        return self.append_hashes([leaf_hash(data)])
+
+    def root(self, size: Optional[int] = None) -> Optional[bytes]:
+        if size is None or size == self.size:
+            return _fold([self._peaks[k] for k in sorted(self._peaks)])
+        if not 0 <= size <= self.size:
+            raise IndexError(f"size {size} out of range")
+        keys = _peak_keys(size)
+        got = self.nodes.get_many(keys)
+        return _fold([got[key] for key in keys])
+
+    def proof(self, index: int, size: Optional[int] = None) -> Tuple[bytes, List[Tuple[str, bytes]]]:
+        """返回 (叶子哈希, 路径)；O(log n) 个节点"""
+        size = self.size if size is None else size
+        if size > self.size:
+            raise IndexError(f"size {size} out of range")
+        siblings, lower, higher = _proof_plan(index, size)
+        got = self.nodes.get_many([(0, index)] + [key for _, key in siblings] + lower + higher)
+        path = [(side, got[key]) for side, key in siblings]
+        if lower:
+            path.append(("R", _fold([got[key] for key in lower])))
+        path.extend(("L", got[key]) for key in higher)
+        return got[(0, index)], path
+
+
+# ---------------- SQLite 持久化 + 每日批量锚定 ----------------
+
+SQL_CREATE_MERKLE_NODES = """
+    CREATE TABLE IF NOT EXISTS merkle_nodes (
+        day   TEXT    NOT NULL,
+        level INTEGER NOT NULL,
+        idx   INTEGER NOT NULL,
+        hash  BLOB    NOT NULL,
+        PRIMARY KEY (day, level, idx)
+    ) WITHOUT ROWID
+"""
+SQL_CREATE_MERKLE_LEAVES = """
+    CREATE TABLE IF NOT EXISTS merkle_leaves (
+        day        TEXT    NOT NULL,
+        idx        INTEGER NOT NULL,
+        cert_id    TEXT    NOT NULL,
+        digest     TEXT    NOT NULL,
+        created_at TEXT,
+        PRIMARY KEY (day, idx)
+    ) WITHOUT ROWID
+"""
+SQL_CREATE_MERKLE_LEAVES_CERT = (
+    "CREATE INDEX IF NOT EXISTS idx_merkle_leaves_cert ON merkle_leaves (cert_id, day, idx)"
+)
+SQL_CREATE_MERKLE_ANCHORS = """
+    CREATE TABLE IF NOT EXISTS merkle_anchors (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        day        TEXT    NOT NULL,
+        size       INTEGER NOT NULL,
+        root       TEXT    NOT NULL,
+        txid       TEXT,
+        provider   TEXT,
+        created_at TEXT
+    )
+"""
+SQL_CREATE_MERKLE_ANCHORS_DAY = (
+    "CREATE INDEX IF NOT EXISTS idx_merkle_anchors_day ON merkle_anchors (day, size)"
+)
+SQL_INSERT_MERKLE_NODE = "INSERT INTO merkle_nodes (day, level, idx, hash) VALUES (?,?,?,?)"
+SQL_SELECT_MERKLE_NODE = "SELECT hash FROM merkle_nodes WHERE day = ? AND level = ? AND idx = ?"
+SQL_INSERT_MERKLE_LEAF = (
+    "INSERT INTO merkle_leaves (day, idx, cert_id, digest, created_at) VALUES (?,?,?,?,?)"
+)
+SQL_INSERT_MERKLE_ANCHOR = (
+    "INSERT INTO merkle_anchors (day, size, root, txid, provider, created_at) VALUES (?,?,?,?,?,?)"
+)
+SQL_MERKLE_DAY_SIZE = "SELECT COALESCE(MAX(idx) + 1, 0) FROM merkle_leaves WHERE day = ?"
+SQL_MERKLE_LEAF_OF_CERT = (
+    "SELECT day, idx, digest, created_at FROM merkle_leaves WHERE cert_id = ? "
+    "ORDER BY day DESC, idx DESC LIMIT 1"
+)
+SQL_MERKLE_ANCHOR_COVERING = (
+    "SELECT size, root, txid, provider, created_at FROM merkle_anchors "
+    "WHERE day = ? AND size > ? ORDER BY size LIMIT 1"
+)
+SQL_MERKLE_LAST_ANCHOR = "SELECT MAX(size) FROM merkle_anchors WHERE day = ?"
+SQL_MERKLE_ANCHORS_OF_DAY = (
+    "SELECT day, size, root, txid, provider, created_at FROM merkle_anchors "
+    "WHERE day = ? ORDER BY size"
+)
+
+MERKLE_DDL = (
+    SQL_CREATE_MERKLE_NODES, SQL_CREATE_MERKLE_LEAVES, SQL_CREATE_MERKLE_LEAVES_CERT,
+    SQL_CREATE_MERKLE_ANCHORS, SQL_CREATE_MERKLE_ANCHORS_DAY,
+)
+
+
+class SQLiteNodes:
+    """某一天的完整节点，存 merkle_nodes；写入跟随调用方的事务"""
+
+    def __init__(self, conn_fn: Callable, day: str):
+        self._conn_fn = conn_fn
+        self.day = day
+
+    def put_many(self, nodes: Sequence[Tuple[int, int, bytes]]) -> None:
+        self._conn_fn().executemany(SQL_INSERT_MERKLE_NODE, [(self.day, k, i, h) for k, i, h in nodes])
+
+    def get_many(self, keys: Iterable[Key]) -> Dict[Key, bytes]:
+        # 逐个主键点查（语句缓存命中，每个 O(log N)）；一次证明约 log2(n) 个
+        conn = self._conn_fn()
+        got: Dict[Key, bytes] = {}
+        for k, i in keys:
+            if (k, i) in got:
+                continue
+            row = conn.execute(SQL_SELECT_MERKLE_NODE, (self.day, k, i)).fetchone()
+            if row is None:
+                raise KeyError(f"merkle_nodes missing ({k}, {i}) for day {self.day}")
+            got[(k, i)] = bytes(row[0])
+        return got
+
+
+def _utc_day(ts: Optional[float] = None) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(ts))
+
+
+def _utc_now() -> str:
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+
+
+def _begin_write(conn) -> None:
+    """先拿 SQLite 写锁再读 size：别的写入方已提交的叶子此时都可见，下标不会撞"""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+
+
+class MerkleLedger:
+    """
+    每天一棵树（UTC 日期）。add() 把 (cert_id, digest) 追加为叶子，
+    anchor() 把当天当前的根交给 anchor_fn(root_hex, day, size) -> txid，一批一次。
+    batch_size > 0 时，未锚定的叶子攒够这么多条就自动锚定一次。
+    """
+
+    def __init__(self, pool, anchor_fn: Optional[Callable[[str, str, int], str]] = None,
+                 provider: str = "chain", batch_size: int = 0):
+        self.pool = pool
+        self.anchor_fn = anchor_fn
+        self.provider = provider
+        self.batch_size = batch_size
+        self.on_anchor: Optional[Callable[[dict], None]] = None
+        self._lock = threading.RLock()
+        self._trees: Dict[str, MerkleTree] = {}
+        self._anchored: Dict[str, int] = {}
+        self._anchoring: Set[str] = set()     # 正在调 anchor_fn 的 day
+        self._db_path = None
+        schema.attach(pool)          # 表由 app/schema.py 的迁移建
+
+    def _conn(self):
+        return self.pool.conn(create=True)
+
+    def _tree(self, day: str, conn=None) -> MerkleTree:
+        """
+        当天的树。每次都按库里的 MAX(idx)+1 对一下 size：同一个库可能有别的 worker / 进程在追加，
+        内存里的右边缘落后了就按库里的节点重新取峰（O(log n) 次主键点查）。
+        """
+        # db 换了（测试里切 tmp 路径）就丢掉内存里的右边缘
+        if self._db_path != self.pool.path:
+            self._trees.clear()
+            self._anchored.clear()
+            self._db_path = self.pool.path
+        conn = conn or self._conn()
+        size = conn.execute(SQL_MERKLE_DAY_SIZE, (day,)).fetchone()[0]
+        t = self._trees.get(day)
+        if t is None or t.size != size:
+            t = self._trees[day] = MerkleTree(SQLiteNodes(self._conn, day), size=size)
+            self._anchored[day] = conn.execute(SQL_MERKLE_LAST_ANCHOR, (day,)).fetchone()[0] or 0
+        return t
+
+    def add_many(self, items: Sequence[Tuple[str, str]], day: Optional[str] = None) -> Tuple[str, int]:
+        """批量追加 [(cert_id, digest)]，一个事务；返回 (day, 第一个叶子下标)"""
+        day = day or _utc_day()
+        now = _utc_now()
+        with self._lock:
+            try:
+                with self.pool.transaction(create=True) as conn:
+                    _begin_write(conn)
+                    tree = self._tree(day, conn)
+                    first = tree.append_hashes(leaf_hash(leaf_data(c, d)) for c, d in items)
+                    conn.executemany(SQL_INSERT_MERKLE_LEAF,
+                                     [(day, first + j, c, d, now) for j, (c, d) in enumerate(items)])
+            except Exception:
+                self._trees.pop(day, None)     # 事务回滚，右边缘下次按库重建
+                raise
+            due = self.batch_size and tree.size - self._anchored.get(day, 0) >= self.batch_size
+        if due:
+            self.anchor(day)             # 不占着本进程的锁等链上确认
+        return day, first
+
+    def add(self, cert_id: str, digest: str, day: Optional[str] = None) -> Tuple[str, int]:
+        return self.add_many([(cert_id, digest)], day)
+
+    def root(self, day: Optional[str] = None) -> dict:
+        day = day or _utc_day()
+        with self._lock:
+            tree = self._tree(day)
+            r = tree.root()
+            return {"day": day, "size": tree.size, "root": r.hex() if r else None,
+                    "anchored_size": self._anchored.get(day, 0)}
+
+    def anchor(self, day: Optional[str] = None) -> Optional[dict]:
+        """
+        把当天当前的根提交一次；没有新叶子时返回 None。
+        size / 根在一个短写事务里读出并提交，anchor_fn（真实链要几秒）在事务外调，
+        锚定记录再用第二个短事务写入：那时库里已经锚定到同样或更大的 size（别的 worker 抢先）就不写，返回 None。
+        本进程内同一天同时只跑一个锚定。
+        """
+        day = day or _utc_day()
+        with self._lock:
+            if day in self._anchoring:
+                return None
+            with self.pool.transaction(create=True) as conn:
+                _begin_write(conn)
+                tree = self._tree(day, conn)
+                size = tree.size
+                self._anchored[day] = conn.execute(SQL_MERKLE_LAST_ANCHOR, (day,)).fetchone()[0] or 0
+                if size == 0 or size <= self._anchored[day]:
+                    return None
+                root = tree.root().hex()
+            self._anchoring.add(day)
+        try:
+            txid = self.anchor_fn(root, day, size) if self.anchor_fn else None
+            rec = {"day": day, "size": size, "root": root, "txid": txid,
+                   "provider": self.provider, "created_at": _utc_now()}
+            with self._lock:
+                with self.pool.transaction(create=True) as conn:
+                    _begin_write(conn)
+                    last = conn.execute(SQL_MERKLE_LAST_ANCHOR, (day,)).fetchone()[0] or 0
+                    if size > last:
+                        conn.execute(SQL_INSERT_MERKLE_ANCHOR,
+                                     (day, size, root, txid, self.provider, rec["created_at"]))
+                self._anchored[day] = max(size, last)
+                if size <= last:
+                    return None
+        finally:
+            with self._lock:
+                self._anchoring.discard(day)
+        if self.on_anchor:
+            self.on_anchor(rec)
+        return rec
+
+    def anchors(self, day: Optional[str] = None) -> List[dict]:
+        conn = self.pool.conn()
+        if conn is None:
+            return []
+        cols = ("day", "size", "root", "txid", "provider", "created_at")
+        return [dict(zip(cols, r)) for r in conn.execute(SQL_MERKLE_ANCHORS_OF_DAY, (day or _utc_day(),))]
+
+    def proof_for(self, cert_id: str) -> Optional[dict]:
+        """
+        cert 最近一片叶子的包含证明：优先对“第一次覆盖它的锚定”出证明，
+        还没锚定时对当天当前的根出证明（anchored=False）。
+        """
+        conn = self.pool.conn()
+        if conn is None:
+            return None
+        row = conn.execute(SQL_MERKLE_LEAF_OF_CERT, (cert_id,)).fetchone()
+        if row is None:
+            return None
+        day, idx, digest, created_at = row
+        with self._lock:
+            tree = self._tree(day)
+            anchor = conn.execute(SQL_MERKLE_ANCHOR_COVERING, (day, idx)).fetchone()
+            size = anchor[0] if anchor else tree.size
+            leaf, path = tree.proof(idx, size)
+            root = tree.root(size)
+        ok = verify_proof(leaf, path, root) and (anchor is None or anchor[1] == root.hex())
+        return {
+            "cert_id": cert_id, "day": day, "index": idx, "digest": digest, "created_at": created_at,
+            "leaf": leaf.hex(), "size": size, "root": root.hex(),
+            "path": [{"side": s, "hash": h.hex()} for s, h in path],
+            "anchored": anchor is not None,
+            "txid": anchor[2] if anchor else None,
+            "provider": anchor[3] if anchor else None,
+            "anchored_at": anchor[4] if anchor else None,
+            "verified": ok,
+        }
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+按 key（cert_id）缓存渲染好的页面，附带 ETag / Last-Modified，支持 304。
+
+- 写路径（新回执、业务信息更新、清空）调用 invalidate(key) 让缓存失效；
+- 另有 TTL 兜底，覆盖脚本直接改库等绕过应用的写入；
+- 失效后重建若内容没变（ETag 相同），沿用原来的 Last-Modified，扫码端仍能拿到 304。
+"""
+from __future__ import annotations
+
+import hashlib
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, Mapping, Optional, Tuple
+
+
+class CacheEntry:
+    __slots__ = ("body", "etag", "last_modified", "expires")
+
+    def __init__(self, body: str, etag: str, last_modified: float, expires: float):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires = expires
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "ETag": self.etag,
+            "Last-Modified": formatdate(self.last_modified, usegmt=True),
+            # 允许缓存，但每次都要回源校验（拿 304 很便宜）
+            "Cache-Control": "no-cache",
+        }
+
+
+def _etag_of(body: str) -> str:
+    return '"' + hashlib.sha1(body.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def not_modified(entry: CacheEntry, req_headers: Mapping[str, str]) -> bool:
+    """按 If-None-Match（优先）/ If-Modified-Since 判断是否可以回 304"""
+    inm = req_headers.get("if-none-match")
+    if inm:
+        tags = [t.strip() for t in inm.split(",")]
+        return "*" in tags or entry.etag in tags or ("W/" + entry.etag) in tags
+    ims = req_headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(entry.last_modified) <= int(parsedate_to_datetime(ims).timestamp())
+        except Exception:
+            return False
+    return False
+
+
+class PageCache:
+    """线程安全的 LRU 页面缓存。lookup() 返回的 token 用于防止“构建期间被失效”的脏写。"""
+
+    def __init__(self, ttl: float = 30.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._gen: Dict[str, int] = {}
+        # _gen 里被裁掉的 key 的代数不能回到 0（否则裁剪前拿到 token 的构建会被当成最新）：
+        # 没有记录的 key 一律按“裁掉过的最大代数”算
+        self._floor = 0
+        self._epoch = 0
+        self._counter = itertools.count(1)
+
+    def lookup(self, key: str) -> Tuple[Optional[CacheEntry], Tuple[int, int]]:
+        now = time.time()
+        with self._lock:
+            token = (self._epoch, self._gen.get(key, self._floor))
+            e = self._entries.get(key)
+            if e is not None and e.expires > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return e, token
+            self.misses += 1
+            return None, token
+
+    def store(self, key: str, body: str, token: Tuple[int, int]) -> CacheEntry:
+        now = time.time()
+        etag = _etag_of(body)
+        with self._lock:
+            old = self._entries.get(key)
+            last_modified = old.last_modified if (old is not None and old.etag == etag) else now
+            entry = CacheEntry(body, etag, last_modified, now + self.ttl)
+            if token != (self._epoch, self._gen.get(key, self._floor)):
+                # 构建期间 key 被失效过：结果照常返回，但不进缓存
+                return entry
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                k, _ = self._entries.popitem(last=False)
+                self._drop_gen(k)
+            return entry
+
+    def _drop_gen(self, key: str) -> None:
+        # 调用方持锁
+        g = self._gen.pop(key, None)
+        if g is not None and g > self._floor:
+            self._floor = g
+
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._gen[key] = next(self._counter)
+            e = self._entries.get(key)
+            if e is not None:
+                e.expires = 0.0     # 留着旧条目，只为重建时比较 ETag
+            if len(self._gen) > 2 * self.max_entries:
+                for k in [k for k in self._gen if k not in self._entries]:
+                    self._drop_gen(k)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            for e in self._entries.values():
+                e.expires = 0.0
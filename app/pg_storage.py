@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+"""
+PostgreSQL 存储后端（STORAGE_BACKEND=postgres）：asyncpg 连接池 + receipts 按月分区。
+
+- 表与 app/db.py 的 CertRecord / Receipt / EvidenceMeta 同名同列；receipts 是按 created_at
+  月份 RANGE 分区的父表，主键 (id, created_at)；idx_receipts_cert_time 建在父表上，
+  PostgreSQL 会给每个分区（包括之后新建的）自动建同款索引。
+- 分区按写入的月份现建（receipts_yYYYYmMM），不设 DEFAULT 分区：否则之后补建月分区时
+  会因默认分区里已有该月数据而失败。
+- 回执批量写走 COPY（copy_records_to_table），证据 / 业务字段是 executemany 的 upsert，
+  cert 先用 unnest 一条语句补齐（receipts 有外键）；同一批在一个事务里。
+- asyncpg 的池绑定在创建它的事件循环上；这里用一条专用线程跑循环，同步接口（Storage）
+  用 run_coroutine_threadsafe 调过去，线程池里的同步端点和 async 端点共用同一个池。
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:  # 可选依赖：只有 STORAGE_BACKEND=postgres 时需要
+    import asyncpg
+except ImportError:  # pragma: no cover - 取决于环境
+    asyncpg = None
+
+from app import export as receipts_export
+from app.query import compile_query
+from app.storage import (
+    EVIDENCE_FIELDS, META_FIELDS, IN_BATCH, ReceiptTuple, _Base, _fmt_time, _merge, _parse_time, _split,
+)
+
+SQL_PG_CREATE_CERT_RECORDS = """
+    CREATE TABLE IF NOT EXISTS cert_records (
+        id             SERIAL PRIMARY KEY,
+        cert_id        VARCHAR(255) NOT NULL UNIQUE,
+        file_path      TEXT,
+        sha256         VARCHAR(128),
+        c2pa_claim     VARCHAR(255),
+        tsa_url        VARCHAR(255),
+        sepolia_txhash VARCHAR(255)
+    )
+"""
+SQL_PG_CREATE_EVIDENCE_META = """
+    CREATE TABLE IF NOT EXISTS evidence_meta (
+        cert_id    VARCHAR(255) PRIMARY KEY,
+        case_id    VARCHAR(255),
+        title      TEXT,
+        owner      VARCHAR(255),
+        source     TEXT,
+        notes      TEXT,
+        updated_at TIMESTAMP
+    )
+"""
+SQL_PG_CREATE_EVIDENCE_META_CASE = "CREATE INDEX IF NOT EXISTS ix_evidence_meta_case_id ON evidence_meta (case_id)"
+SQL_PG_CREATE_RECEIPTS = """
+    CREATE TABLE IF NOT EXISTS receipts (
+        id         BIGSERIAL,
+        cert_id    VARCHAR(255) NOT NULL REFERENCES cert_records (cert_id),
+        provider   VARCHAR(64) NOT NULL,
+        status     VARCHAR(64) NOT NULL,
+        txid       VARCHAR(255),
+        created_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+        PRIMARY KEY (id, created_at)
+    ) PARTITION BY RANGE (created_at)
+"""
+SQL_PG_CREATE_RECEIPTS_CERT_TIME = (
+    "CREATE INDEX IF NOT EXISTS idx_receipts_cert_time ON receipts (cert_id, created_at DESC)"
+)
+SQL_PG_CREATE_PARTITION = (
+    "CREATE TABLE IF NOT EXISTS {name} PARTITION OF receipts FOR VALUES FROM ('{lo}') TO ('{hi}')"
+)
+SQL_PG_RECEIPTS_KIND = "SELECT c.relkind FROM pg_class c WHERE c.oid = to_regclass('receipts')"
+SQL_PG_PARTITIONS = """
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'receipts'::regclass
+"""
+
+SQL_PG_ENSURE_CERTS = """
+    INSERT INTO cert_records (cert_id) SELECT unnest($1::varchar[])
+    ON CONFLICT (cert_id) DO NOTHING
+"""
+SQL_PG_RECENT = """
+    SELECT provider, status, txid, created_at FROM receipts
+    WHERE cert_id = $1 ORDER BY created_at DESC, id DESC LIMIT $2
+"""
+SQL_PG_SELECT_CERTS = f"""
+    SELECT cert_id, {", ".join(EVIDENCE_FIELDS)} FROM cert_records WHERE cert_id = ANY($1::varchar[])
+"""
+SQL_PG_SELECT_META = f"""
+    SELECT cert_id, {", ".join(META_FIELDS)}, updated_at FROM evidence_meta WHERE cert_id = ANY($1::varchar[])
+"""
+# 导出按 id 键集分页（id 来自同一个序列，跨分区单调）
+SQL_PG_EXPORT_ALL = """
+    SELECT r.id, r.cert_id, m.case_id, m.title, m.owner, r.provider, r.status, r.txid, r.created_at
+    FROM receipts r LEFT JOIN evidence_meta m ON m.cert_id = r.cert_id
+    WHERE r.id > $1
+    ORDER BY r.id LIMIT $2
+"""
+SQL_PG_EXPORT_CERT = """
+    SELECT r.id, r.cert_id, m.case_id, m.title, m.owner, r.provider, r.status, r.txid, r.created_at
+    FROM receipts r LEFT JOIN evidence_meta m ON m.cert_id = r.cert_id
+    WHERE r.cert_id = $3 AND r.id > $1
+    ORDER BY r.id LIMIT $2
+"""
+SQL_PG_EXPORT_EVIDENCE = f"""
+    SELECT cert_id, {", ".join(META_FIELDS)}, updated_at FROM evidence_meta
+    WHERE cert_id > $1 AND ($2 = '' OR case_id = $2)
+    ORDER BY cert_id LIMIT $3
+"""
+SQL_PG_CASE_CERTS = "SELECT cert_id FROM evidence_meta WHERE case_id = $1"
+SQL_PG_COUNT_ALL = "SELECT COUNT(*) FROM receipts"
+SQL_PG_COUNT_CERT = "SELECT COUNT(*) FROM receipts WHERE cert_id = $1"
+
+RECEIPT_COLUMNS = ("cert_id", "provider", "status", "txid", "created_at")
+
+
+def partition_name(month: Tuple[int, int]) -> str:
+    return f"receipts_y{month[0]:04d}m{month[1]:02d}"
+
+
+def parse_partition(name: str) -> Optional[Tuple[int, int]]:
+    """receipts_y2025m01 -> (2025, 1)；不是本模块建的分区返回 None"""
+    if len(name) != 17 or not name.startswith("receipts_y") or name[14] != "m":
+        return None
+    try:
+        return int(name[10:14]), int(name[15:17])
+    except ValueError:
+        return None
+
+
+def month_bounds(month: Tuple[int, int]) -> Tuple[str, str]:
+    y, m = month
+    nxt = (y + 1, 1) if m == 12 else (y, m + 1)
+    return f"{y:04d}-{m:02d}-01", f"{nxt[0]:04d}-{nxt[1]:02d}-01"
+
+
+def _upsert_sql(table: str, cols: Sequence[str]) -> str:
+    names = ["cert_id", *cols]
+    marks = ", ".join(f"${i}" for i in range(1, len(names) + 1))
+    sets = ", ".join(f"{c} = excluded.{c}" for c in cols)
+    return f"INSERT INTO {table} ({', '.join(names)}) VALUES ({marks}) ON CONFLICT (cert_id) DO UPDATE SET {sets}"
+
+
+class PostgresStorage(_Base):
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10):
+        if asyncpg is None:
+            raise RuntimeError("asyncpg is not installed (pip install asyncpg)")
+        self.dsn = dsn
+        self._months: set = set()
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="pg-storage", daemon=True)
+        self._thread.start()
+        try:
+            self.pool = self._run(asyncpg.create_pool(dsn, min_size=min_size, max_size=max_size))
+            self._run(self._init_schema())
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    # ---------- 事件循环线程 ----------
+    def _run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def _stop_loop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(5)
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._run(self.pool.close())
+            self._stop_loop()
+
+    # ---------- 建表 / 分区 ----------
+    async def _init_schema(self) -> None:
+        async with self.pool.acquire() as conn:
+            kind = await conn.fetchval(SQL_PG_RECEIPTS_KIND)
+            if kind is not None and kind != "p":
+                raise RuntimeError("receipts exists but is not partitioned; migrate it before using the postgres backend")
+            async with conn.transaction():
+                for ddl in (SQL_PG_CREATE_CERT_RECORDS, SQL_PG_CREATE_EVIDENCE_META,
+                            SQL_PG_CREATE_EVIDENCE_META_CASE, SQL_PG_CREATE_RECEIPTS,
+                            SQL_PG_CREATE_RECEIPTS_CERT_TIME):
+                    await conn.execute(ddl)
+            self._months = {m for m in (parse_partition(r[0]) for r in await conn.fetch(SQL_PG_PARTITIONS)) if m}
+
+    async def _ensure_partitions(self, conn, months) -> None:
+        for month in sorted(set(months) - self._months):
+            lo, hi = month_bounds(month)
+            try:
+                await conn.execute(SQL_PG_CREATE_PARTITION.format(name=partition_name(month), lo=lo, hi=hi))
+            except asyncpg.exceptions.DuplicateTableError:
+                pass   # 另一个 worker 同时建了
+            self._months.add(month)
+
+    def partitions(self) -> List[str]:
+        async def go():
+            async with self.pool.acquire() as conn:
+                return sorted(r[0] for r in await conn.fetch(SQL_PG_PARTITIONS))
+        return self._run(go())
+
+    # ---------- 写 ----------
+    async def _write_batch(self, evidence: Sequence[dict], receipts: Sequence[ReceiptTuple]) -> int:
+        now = datetime.utcnow().replace(microsecond=0)
+        records = [(c, p, s, tx, _parse_time(t) or now) for c, p, s, tx, t in receipts]
+        groups: Dict[Tuple[str, Tuple[str, ...]], list] = {}
+        for row in evidence:
+            ev, meta = _split(row)
+            if ev:
+                groups.setdefault(("cert_records", tuple(ev)), []).append((row["cert_id"], *ev.values()))
+            if meta:
+                groups.setdefault(("evidence_meta", (*meta, "updated_at")), []).append(
+                    (row["cert_id"], *meta.values(), now))
+        certs = list(dict.fromkeys([r["cert_id"] for r in evidence] + [r[0] for r in records]))
+        async with self.pool.acquire() as conn:
+            # 分区 DDL 在事务外做：失败不牵连数据，且已建好的分区对其它 worker 立即可见
+            await self._ensure_partitions(conn, {(r[4].year, r[4].month) for r in records})
+            async with conn.transaction():
+                if certs:
+                    await conn.execute(SQL_PG_ENSURE_CERTS, certs)
+                for (table, cols), args in groups.items():
+                    await conn.executemany(_upsert_sql(table, cols), args)
+                if records:
+                    await conn.copy_records_to_table("receipts", records=records, columns=RECEIPT_COLUMNS)
+        return len(records)
+
+    def write_batch(self, evidence: Sequence[dict] = (), receipts: Sequence[ReceiptTuple] = (),
+                    create: bool = False) -> int:
+        return self._run(self._write_batch(evidence, receipts))
+
+    # ---------- 读 ----------
+    async def _evidence_many(self, conn, ids: List[str]) -> Dict[str, dict]:
+        out: Dict[str, dict] = {}
+        for i in range(0, len(ids), IN_BATCH):
+            part = ids[i:i + IN_BATCH]
+            evs = {r[0]: (*r, None, None, None) for r in await conn.fetch(SQL_PG_SELECT_CERTS, part)}
+            metas = {r[0]: (*tuple(r)[:-1], _fmt_time(r[-1])) for r in await conn.fetch(SQL_PG_SELECT_META, part)}
+            for c in part:
+                merged = _merge(evs.get(c), metas.get(c))
+                if merged is not None:
+                    out[c] = merged
+        return out
+
+    @staticmethod
+    def _receipt_dicts(rows) -> List[dict]:
+        return [{"provider": r[0], "status": r[1], "txid": r[2], "created_at": _fmt_time(r[3])} for r in rows]
+
+    def page_view(self, cert_id: str, limit: int = 5) -> Tuple[Optional[dict], List[dict]]:
+        async def go():
+            async with self.pool.acquire() as conn:
+                ev = (await self._evidence_many(conn, [cert_id])).get(cert_id)
+                rows = await conn.fetch(SQL_PG_RECENT, cert_id, limit) if limit > 0 else []
+                return ev, self._receipt_dicts(rows)
+        return self._run(go())
+
+    def recent_receipts(self, cert_id: str, limit: int = 5) -> List[dict]:
+        async def go():
+            async with self.pool.acquire() as conn:
+                return self._receipt_dicts(await conn.fetch(SQL_PG_RECENT, cert_id, limit))
+        return self._run(go())
+
+    def get_evidence_many(self, cert_ids: Sequence[str]) -> Dict[str, dict]:
+        async def go():
+            async with self.pool.acquire() as conn:
+                return await self._evidence_many(conn, list(dict.fromkeys(cert_ids)))
+        return self._run(go())
+
+    def get_evidence(self, cert_id: str) -> Optional[dict]:
+        return self.get_evidence_many([cert_id]).get(cert_id)
+
+    def _fetch(self, sql: str, *args) -> list:
+        async def go():
+            async with self.pool.acquire() as conn:
+                return await conn.fetch(sql, *args)
+        return self._run(go())
+
+    def iter_receipts(self, cert_ids=None, cq=None) -> Iterator[tuple]:
+        """按 id 键集分页流式读出；每页一次往返，内存只留一页"""
+        cq = cq or compile_query("")
+        for c in (list(cert_ids) if cert_ids is not None else [None]):
+            last = 0
+            while True:
+                if c is None:
+                    rows = self._fetch(SQL_PG_EXPORT_ALL, last, receipts_export.FETCH_BATCH)
+                else:
+                    rows = self._fetch(SQL_PG_EXPORT_CERT, last, receipts_export.FETCH_BATCH, c)
+                for r in rows:
+                    row = (*tuple(r)[1:8], _fmt_time(r[8]))
+                    if cq.empty or receipts_export._row_matches(cq, row):
+                        yield row
+                if len(rows) < receipts_export.FETCH_BATCH:
+                    break
+                last = rows[-1][0]
+
+    def iter_evidence(self, case_id: str = "") -> Iterator[tuple]:
+        last = ""
+        while True:
+            rows = self._fetch(SQL_PG_EXPORT_EVIDENCE, last, case_id, receipts_export.FETCH_BATCH)
+            for r in rows:
+                yield (*tuple(r)[:6], _fmt_time(r[6]))
+            if len(rows) < receipts_export.FETCH_BATCH:
+                break
+            last = rows[-1][0]
+
+    def cert_ids_for_case(self, case_id: str) -> List[str]:
+        return [r[0] for r in self._fetch(SQL_PG_CASE_CERTS, case_id)]
+
+    def count_receipts(self, cert_id: Optional[str] = None) -> int:
+        rows = self._fetch(SQL_PG_COUNT_CERT, cert_id) if cert_id else self._fetch(SQL_PG_COUNT_ALL)
+        return rows[0][0]
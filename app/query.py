@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Vault / 回执查询语法的编译器：查询串只解析一次，编译成谓词对象，按查询串 LRU 缓存。
+
+语法（空格分隔的词默认 AND）：
+  provider:tsa status:pending     字段等值（大小写不敏感）
+  0xTX_                           任意子串，匹配 cert_id/provider/status/txid
+  -status:failed                  取反
+  provider:tsa OR provider:chain  OR（也可写成 |），优先级低于 AND
+  created_at>2026-10-01           时间范围：> >= < <=（time 与 created_at 等价）
+
+谓词作用在“预先小写化”的行上（见 lower_row），匹配时不再做字符串拼接/小写转换。
+"""
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Optional, Tuple
+
+# 子串匹配覆盖的字段（与原 _match_query 一致）
+BLOB_FIELDS = ("cert_id", "provider", "status", "txid")
+TIME_FIELDS = ("created_at", "time")
+
+_RANGE_RE = re.compile(r"^([A-Za-z_]+)(>=|<=|>|<)(.+)$")
+_OR_TOKENS = ("OR", "|")
+
+Pred = Callable[[dict], bool]
+
+
+def norm_time(v) -> str:
+    """时间统一成 'YYYY-MM-DD HH:MM:SS...' 形式，便于按字符串比较"""
+    return str(v or "").strip().replace("T", " ").replace("t", " ")
+
+
+def lower_row(cert_id: str, item: dict) -> dict:
+    """
+    写入时算一次：所有字段值小写化 + created_at 归一化 + 子串匹配用的 blob。
+    """
+    low = {k: str(v).lower() for k, v in item.items() if v is not None and k != "time"}
+    low["cert_id"] = (cert_id or "").lower()
+    low["created_at"] = norm_time(item.get("time", item.get("created_at")))
+    low["_blob"] = " ".join(low.get(k, "") for k in BLOB_FIELDS)
+    return low
+
+
+def _eq(k: str, v: str) -> Pred:
+    if k in TIME_FIELDS:
+        v = norm_time(v)
+        return lambda low: low.get("created_at", "") == v
+    return lambda low: low.get(k, "") == v
+
+
+def _sub(v: str) -> Pred:
+    return lambda low: v in low["_blob"]
+
+
+def _range(op: str, v: str) -> Pred:
+    v = norm_time(v)
+    if op == ">":
+        return lambda low: low.get("created_at", "") > v
+    if op == ">=":
+        return lambda low: low.get("created_at", "") >= v
+    if op == "<":
+        return lambda low: low.get("created_at", "") < v
+    return lambda low: low.get("created_at", "") <= v
+
+
+def _neg(p: Pred) -> Pred:
+    return lambda low: not p(low)
+
+
+class CompiledQuery:
+    """编译后的查询：若干 OR 分组，每组内部 AND。"""
+
+    __slots__ = ("source", "groups", "_eq_terms", "_time_range")
+
+    def __init__(self, source: str, groups, eq_terms, time_range):
+        self.source = source
+        self.groups: Tuple[Tuple[Pred, ...], ...] = groups
+        self._eq_terms: Dict[str, str] = eq_terms
+        self._time_range: Tuple[Optional[str], Optional[str]] = time_range
+
+    @property
+    def empty(self) -> bool:
+        return not self.groups
+
+    def match(self, low: dict) -> bool:
+        """low 为 lower_row() 的结果"""
+        if not self.groups:
+            return True
+        for g in self.groups:
+            for p in g:
+                if not p(low):
+                    break
+            else:
+                return True
+        return False
+
+    def match_item(self, item: dict) -> bool:
+        """兼容入口：对未预处理的原始 dict 现算小写行"""
+        if not self.groups:
+            return True
+        return self.match(lower_row(str(item.get("cert_id") or ""), item))
+
+    def index_terms(self) -> Dict[str, str]:
+        """可以交给索引的等值条件（只有单个分组时才有意义）"""
+        return dict(self._eq_terms)
+
+    def time_range(self) -> Tuple[Optional[str], Optional[str]]:
+        """(下界, 上界)，供按时间有序索引做二分；边界是否包含由谓词再校验"""
+        return self._time_range
+
+
+def _compile(q: str) -> CompiledQuery:
+    groups, cur = [], []
+    for t in (q or "").split():
+        if t in _OR_TOKENS:
+            if cur:
+                groups.append(cur)
+            cur = []
+            continue
+        cur.append(t)
+    if cur:
+        groups.append(cur)
+
+    compiled = []
+    eq_terms: Dict[str, str] = {}
+    lo = hi = None
+    single = len(groups) == 1
+    for terms in groups:
+        preds = []
+        for t in terms:
+            neg = t.startswith("-") and len(t) > 1
+            body = t[1:] if neg else t
+            m = _RANGE_RE.match(body)
+            if m and m.group(1) in TIME_FIELDS:
+                _, op, v = m.groups()
+                p = _range(op, v)
+                if single and not neg:
+                    if op[0] == ">":
+                        lo = max(lo or "", norm_time(v))
+                    else:
+                        hi = min(hi, norm_time(v)) if hi is not None else norm_time(v)
+            elif ":" in body:
+                k, v = body.split(":", 1)
+                p = _eq(k, v.lower())
+                if single and not neg and k not in TIME_FIELDS:
+                    eq_terms[k] = v.lower()
+            else:
+                p = _sub(body.lower())
+            preds.append(_neg(p) if neg else p)
+        compiled.append(tuple(preds))
+    return CompiledQuery(q, tuple(compiled), eq_terms, (lo, hi))
+
+
+@lru_cache(maxsize=256)
+def compile_query(q: str) -> CompiledQuery:
+    return _compile(q or "")
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+内存回执仓库：替代原来 app.state.receipts 的 dict-of-lists。
+
+- 每条回执分配自增 id，按 cert_id 分组保存（保持写入顺序）；
+- provider / status / txid 建二级索引（值统一小写），另维护按时间排序的索引；
+- count / select 只遍历最小的候选集合，代价≈结果集大小，而不是全库大小；
+- 写入时顺带算好小写化的行（app.query.lower_row），查询谓词直接作用在上面；
+- 每个可排序字段维护 (值, id) 有序列表（全库一份、每个 cert_id 一份），
+  page() 按游标二分定位，翻页代价≈页大小，与该 cert_id 有多少条无关；
+- count() 给了 cache_key 时按 cert_id 的写入代数缓存结果，没写入就不重新数；
+- trim / expire 供保留策略（app/retention.py）按条数 / 时间裁剪，approx_bytes 为估算的常驻内存。
+"""
+from __future__ import annotations
+
+import bisect
+import heapq
+import sys
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from app.query import lower_row
+
+# 建了二级索引的字段（与 _match_query 的 key:value 语法对应）
+INDEXED_FIELDS = ("provider", "status", "txid")
+# 允许排序的字段（与 Vault 表头一致）
+SORT_FIELDS = ("created_at", "provider", "status", "txid")
+
+
+def _norm(v) -> str:
+    return str(v).lower() if v is not None else ""
+
+
+# 每行在各索引 / 有序列表里的固定开销（dict 槽位、元组、list 指针），估算用
+_ROW_OVERHEAD = 64 * (3 + len(INDEXED_FIELDS)) + 72 * 2 * len(SORT_FIELDS)
+# count(cache_key=...) 最多缓存这么多个结果，满了整体清掉
+_COUNT_CACHE_MAX = 1024
+
+
+def _row_bytes(item: dict, low: dict) -> int:
+    return (sys.getsizeof(item) + sys.getsizeof(low) + _ROW_OVERHEAD
+            + sum(sys.getsizeof(v) for v in item.values()) + sum(sys.getsizeof(v) for v in low.values()))
+
+
+class ReceiptStore:
+    """按 cert_id 分组的回执表 + 二级索引。线程安全（同步端点跑在线程池里）。"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._seq = 0
+        self._rows: Dict[int, dict] = {}
+        self._low: Dict[int, dict] = {}
+        self._cert_of: Dict[int, str] = {}
+        # dict 当作“有序集合”用：删除 O(1)，遍历保持插入顺序
+        self._by_cert: Dict[str, Dict[int, None]] = {}
+        self._index: Dict[str, Dict[str, Dict[int, None]]] = {f: {} for f in INDEXED_FIELDS}
+        # 每个排序字段一个 (值, id) 升序列表；删除时不挪动列表，只记数，攒多了再整体压缩
+        self._sorted: Dict[str, List[Tuple[str, int]]] = {f: [] for f in SORT_FIELDS}
+        self._by_time = self._sorted["created_at"]
+        # 同样的有序列表按 cert_id 再分一份：带 cert_id 翻页时直接在这里二分，不用先捞出整个 cert
+        self._cert_sorted: Dict[str, Dict[str, List[Tuple[str, int]]]] = {}
+        # 写入代数：全库一个、每个 cert_id 一个，count 缓存据此判断是否过期
+        self._gen = 0
+        self._cert_gen: Dict[str, int] = {}
+        self._counts: Dict[tuple, Tuple[int, int]] = {}
+        self._dead = 0
+        self._bytes = 0
+
+    # ---------- 写 ----------
+    def append(self, cert_id: str, item: dict) -> int:
+        with self._lock:
+            self._seq += 1
+            rid = self._seq
+            low = lower_row(cert_id, item)
+            self._rows[rid] = item
+            self._low[rid] = low
+            self._cert_of[rid] = cert_id
+            self._by_cert.setdefault(cert_id, {})[rid] = None
+            self._bytes += _row_bytes(item, low)
+            for f in INDEXED_FIELDS:
+                self._index[f].setdefault(low.get(f, ""), {})[rid] = None
+            per_cert = self._cert_sorted.setdefault(cert_id, {f: [] for f in SORT_FIELDS})
+            for f, keys in self._sorted.items():
+                key = (low.get(f, ""), rid)
+                # 回执基本按时间顺序到达，created_at 绝大多数情况是追加到末尾
+                for lst in (keys, per_cert[f]):
+                    if not lst or key >= lst[-1]:
+                        lst.append(key)
+                    else:
+                        bisect.insort(lst, key)
+            self._bump(cert_id)
+            return rid
+
+    def _bump(self, cert_id: str) -> None:
+        # 调用方持锁
+        self._gen += 1
+        self._cert_gen[cert_id] = self._cert_gen.get(cert_id, 0) + 1
+
+    def clear(self, cert_id: Optional[str] = None) -> int:
+        """清空某个 cert_id（或全部），返回清掉的条数。"""
+        with self._lock:
+            if not cert_id:
+                n = len(self._rows)
+                self.__init__()
+                return n
+            ids = list(self._by_cert.get(cert_id) or ())
+            self._remove(ids)
+            return len(ids)
+
+    def trim(self, cert_id: str, keep: int) -> int:
+        """只保留该 cert_id 最新的 keep 条，返回删掉的条数。"""
+        with self._lock:
+            ids = list(self._by_cert.get(cert_id) or ())
+            drop = ids[:max(0, len(ids) - keep)]
+            self._remove(drop)
+            return len(drop)
+
+    def expire(self, before: str) -> Dict[str, int]:
+        """删掉 created_at 早于 before 的回执，返回 {cert_id: 删掉的条数}。"""
+        with self._lock:
+            stop = bisect.bisect_left(self._by_time, (_norm(before), 0))
+            ids = [rid for _, rid in self._by_time[:stop] if rid in self._rows]
+            out: Dict[str, int] = {}
+            for rid in ids:
+                c = self._cert_of[rid]
+                out[c] = out.get(c, 0) + 1
+            self._remove(ids)
+            return out
+
+    def _remove(self, ids) -> None:
+        # 调用方持锁；有序列表不挪动，只记数，攒多了再整体压缩
+        for rid in ids:
+            item = self._rows.pop(rid)
+            cert_id = self._cert_of.pop(rid)
+            low = self._low.pop(rid)
+            self._bytes -= _row_bytes(item, low)
+            group = self._by_cert.get(cert_id)
+            if group is not None:
+                group.pop(rid, None)
+                if not group:
+                    del self._by_cert[cert_id]
+                    self._cert_sorted.pop(cert_id, None)
+            self._bump(cert_id)
+            for f in INDEXED_FIELDS:
+                bucket = self._index[f].get(low.get(f, ""))
+                if bucket is not None:
+                    bucket.pop(rid, None)
+                    if not bucket:
+                        del self._index[f][low.get(f, "")]
+        self._dead += len(ids)
+        if self._dead > 1024 and self._dead * 2 > len(self._by_time):
+            for keys in self._sorted.values():
+                keys[:] = [k for k in keys if k[1] in self._rows]
+            for per_cert in self._cert_sorted.values():
+                for keys in per_cert.values():
+                    keys[:] = [k for k in keys if k[1] in self._rows]
+            self._dead = 0
+
+    # ---------- 读 ----------
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def approx_bytes(self) -> int:
+        """行数据 + 索引的估算常驻字节数（sys.getsizeof 累加，不含 dict 扩容余量）"""
+        return self._bytes
+
+    def certs(self) -> List[str]:
+        with self._lock:
+            return list(self._by_cert)
+
+    def count_cert(self, cert_id: str) -> int:
+        return len(self._by_cert.get(cert_id) or ())
+
+    def rows(self, cert_id: str) -> List[dict]:
+        """某个 cert_id 的原始回执（写入顺序）。"""
+        with self._lock:
+            return [self._rows[rid] for rid in self._by_cert.get(cert_id) or ()]
+
+    def view(self, rid: int) -> dict:
+        """统一字段：time -> created_at，并带上 cert_id。"""
+        item = self._rows[rid]
+        return {
+            "id": rid,
+            "cert_id": self._cert_of[rid],
+            "provider": item.get("provider"),
+            "status": item.get("status"),
+            "txid": item.get("txid"),
+            "created_at": item.get("time"),
+        }
+
+    def candidates(
+        self,
+        cert_id: str = "",
+        eq: Optional[Dict[str, str]] = None,
+        time_range: Tuple[Optional[str], Optional[str]] = (None, None),
+    ) -> List[int]:
+        """
+        按 cert_id + 索引字段等值条件 + 时间范围取候选 id（写入顺序）。
+        只遍历最小的那个集合，其余条件逐条校验；时间范围用二分定位切片，
+        边界的开闭交给查询谓词再确认。
+        """
+        eq = {k: _norm(v) for k, v in (eq or {}).items() if k in INDEXED_FIELDS}
+        lo, hi = time_range
+        with self._lock:
+            sets = []
+            if cert_id:
+                sets.append(self._by_cert.get(cert_id) or {})
+            for f, v in eq.items():
+                sets.append(self._index[f].get(v) or {})
+            if lo is not None or hi is not None:
+                a = bisect.bisect_left(self._by_time, (lo, 0)) if lo is not None else 0
+                b = bisect.bisect_right(self._by_time, (hi + "\uffff", 0)) if hi is not None else len(self._by_time)
+                if not sets or b - a < min(len(x) for x in sets):
+                    ids = sorted(rid for _, rid in self._by_time[a:b] if rid in self._rows)
+                    return [rid for rid in ids if all(rid in x for x in sets)]
+            if not sets:
+                return list(self._rows)
+            base = min(sets, key=len)
+            if len(sets) == 1:
+                return list(base)
+            others = [x for x in sets if x is not base]
+            return [rid for rid in base if all(rid in x for x in others)]
+
+    def select(
+        self,
+        cert_id: str = "",
+        eq: Optional[Dict[str, str]] = None,
+        match: Optional[Callable[[dict], bool]] = None,
+        time_range: Tuple[Optional[str], Optional[str]] = (None, None),
+    ) -> List[dict]:
+        """match 作用在预先小写化的行上（见 app.query.lower_row）"""
+        with self._lock:
+            ids = self.candidates(cert_id, eq, time_range)
+            if match is not None:
+                low = self._low
+                ids = [rid for rid in ids if match(low[rid])]
+            return [self.view(rid) for rid in ids]
+
+    def iter_select(
+        self,
+        cert_id: str = "",
+        eq: Optional[Dict[str, str]] = None,
+        match: Optional[Callable[[dict], bool]] = None,
+        time_range: Tuple[Optional[str], Optional[str]] = (None, None),
+        batch: int = 1000,
+    ) -> Iterator[dict]:
+        """
+        与 select 相同，但分批生成视图：导出大量回执时只常驻 id 列表与一个批次，
+        每批单独持锁，不会长时间挡住写入。
+        """
+        ids = self.candidates(cert_id, eq, time_range)
+        for i in range(0, len(ids), batch):
+            with self._lock:
+                low = self._low
+                out = [self.view(rid) for rid in ids[i:i + batch]
+                       if rid in low and (match is None or match(low[rid]))]
+            yield from out
+
+    def count(
+        self,
+        cert_id: str = "",
+        eq: Optional[Dict[str, str]] = None,
+        match: Optional[Callable[[dict], bool]] = None,
+        time_range: Tuple[Optional[str], Optional[str]] = (None, None),
+        cache_key: Optional[str] = None,
+    ) -> int:
+        """
+        cache_key 标识这组过滤条件（如查询串原文）；给了就按 cert_id（或全库）的写入代数缓存，
+        期间没有写入 / 删除时直接返回上次的结果。
+        """
+        with self._lock:
+            if cache_key is None:
+                return self._count(cert_id, eq, match, time_range)
+            gen = self._cert_gen.get(cert_id, 0) if cert_id else self._gen
+            key = (cert_id, cache_key)
+            hit = self._counts.get(key)
+            if hit is not None and hit[0] == gen:
+                return hit[1]
+            n = self._count(cert_id, eq, match, time_range)
+            if len(self._counts) >= _COUNT_CACHE_MAX:
+                self._counts.clear()
+            self._counts[key] = (gen, n)
+            return n
+
+    def _count(self, cert_id, eq, match, time_range) -> int:
+        # 调用方持锁
+        if match is None and time_range == (None, None):
+            if not eq:
+                return self.count_cert(cert_id) if cert_id else len(self)
+            return len(self.candidates(cert_id, eq))
+        ids = self.candidates(cert_id, eq, time_range)
+        if match is None:
+            return len(ids)
+        low = self._low
+        return sum(1 for rid in ids if match(low[rid]))
+
+    def iter_by_time(self, reverse: bool = True) -> Iterator[int]:
+        """按时间（同一时间按写入顺序）遍历 id，默认最新在前。"""
+        with self._lock:
+            keys = list(reversed(self._by_time)) if reverse else list(self._by_time)
+        for _, rid in keys:
+            if rid in self._rows:
+                yield rid
+
+    def page(
+        self,
+        sort: str = "created_at",
+        reverse: bool = True,
+        after: Optional[Tuple[str, int]] = None,
+        limit: int = 20,
+        offset: int = 0,
+        cert_id: str = "",
+        eq: Optional[Dict[str, str]] = None,
+        match: Optional[Callable[[dict], bool]] = None,
+        time_range: Tuple[Optional[str], Optional[str]] = (None, None),
+    ) -> Tuple[List[dict], List[Tuple[str, int]], bool]:
+        """
+        键集分页：按 (sort 字段值, id) 排序，取严格排在游标 after 之后的 limit 条。
+        返回 (行, 每行的排序键, 后面是否还有)。
+
+        - 等值 / 时间条件里最窄的索引远小于范围（该 cert_id 或全库）时，只对候选集做 top-k；
+        - 否则沿预先排好序的索引（有 cert_id 时用该 cert 自己的那份）从游标位置往后走，
+          其余条件逐行校验，代价≈页大小 / 命中率，不随 cert 的总条数增长。
+        offset 只给兼容“页码跳转”用，代价与 offset 成正比。
+        """
+        if sort not in self._sorted:
+            sort = "created_at"
+        need = offset + limit + 1
+        eq = {k: _norm(v) for k, v in (eq or {}).items() if k in INDEXED_FIELDS}
+        lo, hi = time_range
+        top = hi + "\uffff" if hi is not None else None
+        with self._lock:
+            low = self._low
+            if cert_id:
+                index = (self._cert_sorted.get(cert_id) or {}).get(sort) or []
+                scope = self.count_cert(cert_id)
+            else:
+                index = self._sorted[sort]
+                scope = len(self._rows)
+            narrow = self._narrowest(eq, time_range)
+            if narrow is not None and narrow * 4 < scope:
+                cand = self.candidates(cert_id, eq, time_range)
+                keys = [(low[rid].get(sort, ""), rid) for rid in cand
+                        if match is None or match(low[rid])]
+                if after is not None:
+                    keys = [k for k in keys if (k < after if reverse else k > after)]
+                best = heapq.nlargest(need, keys) if reverse else heapq.nsmallest(need, keys)
+                return self._page_result(best, offset, limit)
+
+            got: List[Tuple[str, int]] = []
+            if reverse:
+                i = (bisect.bisect_left(index, after) if after is not None else len(index)) - 1
+                step = -1
+            else:
+                i = bisect.bisect_right(index, after) if after is not None else 0
+                step = 1
+            n = len(index)
+            while 0 <= i < n and len(got) < need:
+                key = index[i]
+                rid = key[1]
+                i += step
+                row = low.get(rid)
+                if row is None:
+                    continue
+                if eq and any(row.get(f, "") != v for f, v in eq.items()):
+                    continue
+                if lo is not None and row.get("created_at", "") < lo:
+                    continue
+                if top is not None and row.get("created_at", "") >= top:
+                    continue
+                if match is not None and not match(row):
+                    continue
+                got.append(key)
+            return self._page_result(got, offset, limit)
+
+    def _narrowest(self, eq: Dict[str, str], time_range) -> Optional[int]:
+        """等值条件 / 时间范围各自命中的索引大小里最小的一个（都没有时为 None）；调用方持锁"""
+        sizes = [len(self._index[f].get(v) or ()) for f, v in eq.items()]
+        lo, hi = time_range
+        if lo is not None or hi is not None:
+            a = bisect.bisect_left(self._by_time, (lo, 0)) if lo is not None else 0
+            b = bisect.bisect_right(self._by_time, (hi + "\uffff", 0)) if hi is not None else len(self._by_time)
+            sizes.append(b - a)
+        return min(sizes, default=None)
+
+    def _page_result(self, keys, offset, limit):
+        window = keys[offset:offset + limit]
+        return [self.view(rid) for _, rid in window], list(window), len(keys) > offset + limit
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+回执异步批量落盘（write-behind）：请求线程只把回执放进队列，
+后台线程每 N 条或每 M 毫秒用 executemany 在一个事务里写入 receipts 表。
+
+持久性（RECEIPT_DURABILITY）：
+  enqueue  入队即返回（默认，吞吐最高；进程被强杀时可能丢最后一批）
+  flush    等这条所在的批次提交后才返回
+关闭时 close() 会把队列里剩下的全部写完（graceful drain）。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("verify-upgrade")
+
+SQL_INSERT_RECEIPT = "INSERT INTO receipts (cert_id, provider, status, txid, created_at) VALUES (?,?,?,?,?)"
+
+DURABILITY_ENQUEUE = "enqueue"
+DURABILITY_FLUSH = "flush"
+
+_STOP = object()
+
+
+class ReceiptWriter:
+    """
+    后台批量写入器；pool 为 app.sqlite_pool.SQLitePool。
+    给了 sink（如 Storage.add_receipts）时整批交给它写，pool 只作兜底。
+    """
+
+    def __init__(
+        self,
+        pool,
+        batch_size: int = 500,
+        flush_ms: int = 50,
+        durability: str = DURABILITY_ENQUEUE,
+        on_flush: Optional[Callable[[Iterable[str]], None]] = None,
+        sink: Optional[Callable[[List[tuple]], object]] = None,
+        wait_timeout: float = 10.0,
+    ):
+        self.pool = pool
+        self.sink = sink
+        self.batch_size = max(1, int(batch_size))
+        self.flush_ms = max(1, int(flush_ms))
+        self.durability = durability if durability in (DURABILITY_ENQUEUE, DURABILITY_FLUSH) else DURABILITY_ENQUEUE
+        self.on_flush = on_flush
+        self.wait_timeout = wait_timeout      # submit(wait=True) 最多等这么久（后台线程卡住时不把请求一起挂住）
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self._q: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    @classmethod
+    def from_env(cls, pool, **kw) -> "ReceiptWriter":
+        return cls(
+            pool,
+            batch_size=int(os.getenv("RECEIPT_BATCH_SIZE", "500")),
+            flush_ms=int(os.getenv("RECEIPT_FLUSH_MS", "50")),
+            durability=os.getenv("RECEIPT_DURABILITY", DURABILITY_ENQUEUE).lower(),
+            **kw,
+        )
+
+    # ---------- 生产者 ----------
+    def submit(self, cert_id: str, item: dict, wait: Optional[bool] = None) -> None:
+        """wait=None 按 durability；True 等所在批次提交后返回（共享回执模式用），最多等 wait_timeout 秒"""
+        row = (cert_id, item.get("provider"), item.get("status"), item.get("txid"), item.get("time"))
+        done = threading.Event() if (wait if wait is not None else self.durability == DURABILITY_FLUSH) else None
+        # 判断是否已关闭和入队在同一把锁里：close() 放 _STOP 之后不会再有条目进队列（那样永远写不掉）
+        with self._lock:
+            closed = self._closed
+            if not closed:
+                self._start_locked()
+                self._q.put((row, done))
+        if closed:
+            # 已关闭：退化为同步单条写入，不丢数据
+            self._write([(row, None)])
+        elif done is not None and not done.wait(self.wait_timeout):
+            logger.warning("receipt-writer: batch not committed within %.1fs (cert_id=%s)", self.wait_timeout, cert_id)
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """把目前已入队的回执全部写完再返回；timeout 内没写完返回 False"""
+        with self._lock:
+            t = self._thread
+            if t is None:
+                return True
+            if not self._closed and t.is_alive():
+                done = threading.Event()
+                self._q.put((None, done))
+                t = None
+        if t is None:
+            return done.wait(timeout)
+        # 已关闭（close() 正在 / 已经排空）或后台线程已退出：不能再排标记等它取
+        t.join(timeout)
+        return not t.is_alive() and self._q.empty()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """停止后台线程，先把队列排空"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            t = self._thread
+            if t is not None:
+                self._q.put(_STOP)
+        if t is not None:
+            t.join(timeout)
+
+    def pending(self) -> int:
+        return self._q.qsize()
+
+    # ---------- 后台线程 ----------
+    def _start_locked(self) -> None:
+        """调用方持有 self._lock"""
+        if self._thread is None:
+            t = threading.Thread(target=self._run, name="receipt-writer", daemon=True)
+            t.start()
+            self._thread = t
+
+    def _run(self) -> None:
+        stop = False
+        while not stop:
+            entry = self._q.get()
+            if entry is _STOP:
+                break
+            batch: List[Tuple[Optional[tuple], Optional[threading.Event]]] = [entry]
+            deadline = time.monotonic() + self.flush_ms / 1000.0
+            # 攒批：满 batch_size 或到时间就落盘；遇到 flush 请求立刻落盘；
+            # 有人在等提交时不等满时间，队列一空就写（并发等待者自然合进同一批）
+            waiting = entry[1] is not None
+            while len(batch) < self.batch_size and batch[-1][0] is not None:
+                if waiting and self._q.empty():
+                    break
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                try:
+                    nxt = self._q.get(timeout=left)
+                except queue.Empty:
+                    break
+                if nxt is _STOP:
+                    stop = True
+                    break
+                batch.append(nxt)
+                waiting = waiting or nxt[1] is not None
+            if stop:
+                # 把 STOP 之后还没取的也一起写掉
+                while True:
+                    try:
+                        nxt = self._q.get_nowait()
+                    except queue.Empty:
+                        break
+                    if nxt is not _STOP:
+                        batch.append(nxt)
+            self._write(batch)
+
+    def _write(self, batch) -> None:
+        rows = [row for row, _ in batch if row is not None]
+        try:
+            if rows and self.sink is not None:
+                # sink 返回实际写入的条数；库不存在（sqlite 不为回执建库）时为 0，算作丢弃
+                n = self.sink(rows)
+                n = len(rows) if n is None else int(n)
+                self.written += n
+                self.dropped += len(rows) - n
+                self.batches += 1 if n else 0
+            elif rows:
+                with self.pool.transaction() as conn:
+                    if conn is None:
+                        self.dropped += len(rows)
+                    else:
+                        conn.executemany(SQL_INSERT_RECEIPT, rows)
+                        self.written += len(rows)
+                        self.batches += 1
+        except Exception as e:
+            # 与原先 _maybe_write_sqlite 一致：DB 未就绪不影响请求
+            self.dropped += len(rows)
+            logger.info("receipt-writer: flush failed (%d rows): %s", len(rows), e)
+        finally:
+            for _, ev in batch:
+                if ev is not None:
+                    ev.set()
+        if rows and self.on_flush is not None:
+            try:
+                self.on_flush({r[0] for r in rows})
+            except Exception:
+                pass
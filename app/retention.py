@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+内存回执的保留策略：给 app.state.receipts（ReceiptStore）设上限，长跑的实例内存不再无限增长。
+
+  RECEIPTS_MAX_PER_CERT  每个 cert 只留最新 N 条（0 = 不限）
+  RECEIPTS_MAX_TOTAL     总条数上限；超出时按 LRU 把最久没被访问的 cert 整个移出内存，
+                         降到上限的 90% 为止（留余量，避免每次写都触发）
+  RECEIPTS_MAX_AGE_S     created_at 早于 now - N 秒的回执移出内存（至多每秒检查一次）
+
+回执本来就经 ReceiptWriter 落到存储后端（app/storage.py），移出内存前先 flush，
+保证被移出的 cert 在库里是全的；之后再访问这个 cert（count / vault / preview / 导出）时
+透明地从库里读回（同样受每 cert 条数和时间限制）。没有可用存储时被挤出的回执只能丢弃，记在 dropped。
+被 /api/receipts/clear 清过的 cert 重新载入时只取清空时刻之后的回执。
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.receipt_store import ReceiptStore
+
+RELOAD_LIMIT = 100_000     # 不限每 cert 条数时，重新载入最多取这么多
+PERSIST_TIMEOUT_S = 5.0    # 移出 / 读回前等写入队列刷完最多这么久；没刷完就先不动
+EVICT_LOW_WATER = 0.9
+AGE_CHECK_S = 1.0
+
+
+def _now_str(offset_s: float = 0.0) -> str:
+    return (datetime.utcnow() - timedelta(seconds=offset_s)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class RetentionPolicy:
+    def __init__(self, max_per_cert: int = 0, max_total: int = 0, max_age_s: float = 0):
+        self.max_per_cert = max(0, int(max_per_cert))
+        self.max_total = max(0, int(max_total))
+        self.max_age_s = max(0.0, float(max_age_s))
+
+    @classmethod
+    def from_env(cls) -> "RetentionPolicy":
+        return cls(max_per_cert=int(os.getenv("RECEIPTS_MAX_PER_CERT", "0")),
+                   max_total=int(os.getenv("RECEIPTS_MAX_TOTAL", "0")),
+                   max_age_s=float(os.getenv("RECEIPTS_MAX_AGE_S", "0")))
+
+    @property
+    def active(self) -> bool:
+        return bool(self.max_per_cert or self.max_total or self.max_age_s)
+
+    def as_dict(self) -> dict:
+        return {"max_per_cert": self.max_per_cert, "max_total": self.max_total, "max_age_s": self.max_age_s}
+
+
+class Retention:
+    """
+    loader(cert_id, limit) -> [item, ...]（旧→新，item 同 ReceiptStore 的格式）：从存储读回最近 limit 条；
+    persist(timeout) -> bool：移出前调用，确保内存里的回执都已落库（main.py 传 receipt_writer.flush）；
+      返回 False（超时 / 写入器已停）时这次不移出、不读回，内存里的回执原样保留；
+    durable()：当前是否有可用存储（没有时挤出的回执无法再读回）。
+    """
+
+    def __init__(self, policy: RetentionPolicy, loader: Optional[Callable[[str, int], List[dict]]] = None,
+                 persist: Optional[Callable[[float], object]] = None, durable: Callable[[], bool] = lambda: True,
+                 persist_timeout: float = PERSIST_TIMEOUT_S):
+        self.policy = policy
+        self.loader = loader
+        self.persist = persist
+        self.persist_timeout = persist_timeout
+        self.durable = durable
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._evicted: Dict[str, None] = {}
+        self._cleared: Dict[str, str] = {}        # cert_id（"" 表示全部）-> 清空时刻
+        self._lock = threading.RLock()
+        self._store: Optional[ReceiptStore] = None
+        self._last_age_check = 0.0
+        self.evictions = 0
+        self.evicted_rows = 0
+        self.trimmed_rows = 0
+        self.expired_rows = 0
+        self.dropped_rows = 0
+        self.reloads = 0
+        self.reloaded_rows = 0
+        self.persist_timeouts = 0
+
+    # ---------- 写路径 ----------
+    def after_write(self, store: ReceiptStore, cert_ids: Iterable[Optional[str]]) -> None:
+        """回执进内存之后调用：记 LRU、按 cert 裁剪、必要时按时间 / 总量移出"""
+        if not self.policy.active:
+            return
+        with self._lock:
+            self._bind(store)
+            for c in cert_ids:
+                if not c:
+                    continue
+                self._touch(c)
+                if self.policy.max_per_cert:
+                    self.trimmed_rows += store.trim(c, self.policy.max_per_cert)
+            self._enforce(store)
+
+    def _bind(self, store: ReceiptStore) -> None:
+        if store is not self._store:         # app.state.receipts 被整个换掉：旧的 LRU / 移出记录作废
+            self.reset()
+            self._store = store
+
+    def _touch(self, cert_id: str) -> None:
+        self._lru[cert_id] = None
+        self._lru.move_to_end(cert_id)
+
+    def _enforce(self, store: ReceiptStore) -> None:
+        now = time.monotonic()
+        if self.policy.max_age_s and now - self._last_age_check >= AGE_CHECK_S:
+            self._last_age_check = now
+            for c, n in store.expire(_now_str(self.policy.max_age_s)).items():
+                self.expired_rows += n
+                if not store.count_cert(c):
+                    self._lru.pop(c, None)
+        if self.policy.max_total and len(store) > self.policy.max_total:
+            self._evict(store, int(self.policy.max_total * EVICT_LOW_WATER))
+
+    def _persisted(self) -> bool:
+        if self.persist is None or self.persist(self.persist_timeout) is not False:
+            return True
+        self.persist_timeouts += 1
+        return False
+
+    def _evict(self, store: ReceiptStore, target: int) -> None:
+        durable = self.durable()
+        if durable and not self._persisted():
+            return                      # 还没落库的不能移出（移出就读不回了），下次写入再试
+        while len(store) > target and self._lru:
+            c, _ = self._lru.popitem(last=False)
+            n = store.clear(c)
+            if not n:
+                continue
+            self.evictions += 1
+            if durable:
+                self.evicted_rows += n
+                self._evicted[c] = None
+            else:
+                self.dropped_rows += n
+
+    # ---------- 读路径 ----------
+    def on_access(self, store: ReceiptStore, cert_id: str) -> None:
+        """读某个 cert 之前调用：被移出过的先从存储读回"""
+        if not cert_id or not self.policy.active:
+            return
+        with self._lock:
+            self._bind(store)
+            if cert_id in self._evicted and self.loader is not None:
+                self._reload(store, cert_id)
+            if store.count_cert(cert_id):
+                self._touch(cert_id)
+
+    def _reload(self, store: ReceiptStore, cert_id: str) -> None:
+        if not self._persisted():       # 移出之后又写进来的，库里也得有；没刷完就下次访问再读回
+            return
+        limit = self.policy.max_per_cert or RELOAD_LIMIT
+        items = self.loader(cert_id, limit)
+        floor = max(self._cleared.get(cert_id, ""), self._cleared.get("", ""),
+                    _now_str(self.policy.max_age_s) if self.policy.max_age_s else "")
+        if floor:
+            # 时间只到秒：清空 / 过期那一秒里的回执宁可多留
+            items = [it for it in items if str(it.get("time") or "") >= floor]
+        store.clear(cert_id)
+        for it in items:
+            store.append(cert_id, it)
+        del self._evicted[cert_id]
+        self.reloads += 1
+        self.reloaded_rows += len(items)
+        if store.count_cert(cert_id):
+            self._touch(cert_id)
+            self._enforce(store)
+
+    def forget(self, cert_id: Optional[str] = None) -> None:
+        """/api/receipts/clear 之后调用：之前的回执不再读回"""
+        with self._lock:
+            self._cleared[cert_id or ""] = _now_str()
+            if cert_id:
+                self._evicted.pop(cert_id, None)
+                self._lru.pop(cert_id, None)
+            else:
+                self._evicted.clear()
+                self._lru.clear()
+
+    def reset(self) -> None:
+        """内存回执整体作废（换库）时调用"""
+        with self._lock:
+            self._lru.clear()
+            self._evicted.clear()
+            self._cleared.clear()
+
+    def stats(self, store: Optional[ReceiptStore]) -> dict:
+        return {
+            "rows": len(store) if store is not None else 0,
+            "certs": len(store.certs()) if store is not None else 0,
+            "approx_bytes": store.approx_bytes() if store is not None else 0,
+            "policy": self.policy.as_dict(),
+            "evicted_certs": len(self._evicted),
+            "evictions": self.evictions,
+            "evicted_rows": self.evicted_rows,
+            "trimmed_rows": self.trimmed_rows,
+            "expired_rows": self.expired_rows,
+            "dropped_rows": self.dropped_rows,
+            "reloads": self.reloads,
+            "reloaded_rows": self.reloaded_rows,
+            "persist_timeouts": self.persist_timeouts,
+        }
@@ -0,0 +1,443 @@
+# -*- coding: utf-8 -*-
+"""
+RFC 3161 时间戳：进程内构造 TSQ、解析 TSR，不再每次 fork 一个 `openssl ts`。
+
+- 自带一个够用的 DER 编解码（只覆盖 TimeStampReq / TimeStampResp / TSTInfo / X.509 外层所需）；
+- parse_tsr() 取出 status、genTime、serialNumber、policy、messageImprint、nonce、TSA 名称与证书链；
+- verify_tsr() 校验 messageImprint 与本地登记的摘要（及 nonce）一致；
+- 证书链按原始字节缓存解析结果（同一 TSA 每张回执带的链通常一模一样）。
+
+CMS 签名本身的密码学校验不在这里做（仓库没有引入 cryptography 等依赖）；
+需要时仍可对存下来的 TSR 离线跑 `openssl ts -verify`。
+"""
+from __future__ import annotations
+
+import hashlib
+import secrets
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+class DERError(ValueError):
+    """DER 结构不合法 / 不是预期的 RFC 3161 结构"""
+
+
+# ---------------- OID ----------------
+
+OID_SIGNED_DATA = "1.2.840.113549.1.7.2"
+OID_TST_INFO = "1.2.840.113549.1.9.16.1.4"
+DEFAULT_POLICY = "1.3.6.1.4.1.4146.2.3"   # mock TSA 使用的策略号（任意占位）
+
+HASH_OIDS = {
+    "sha1": "1.3.14.3.2.26",
+    "sha224": "2.16.840.1.101.3.4.2.4",
+    "sha256": "2.16.840.1.101.3.4.2.1",
+    "sha384": "2.16.840.1.101.3.4.2.2",
+    "sha512": "2.16.840.1.101.3.4.2.3",
+}
+OID_HASHES = {v: k for k, v in HASH_OIDS.items()}
+
+NAME_ATTRS = {"2.5.4.3": "CN", "2.5.4.6": "C", "2.5.4.7": "L", "2.5.4.8": "ST",
+              "2.5.4.10": "O", "2.5.4.11": "OU", "1.2.840.113549.1.9.1": "E"}
+
+PKI_STATUS = {0: "granted", 1: "grantedWithMods", 2: "rejection", 3: "waiting",
+              4: "revocationWarning", 5: "revocationNotification"}
+
+# ---------------- DER 编码 ----------------
+
+T_BOOL, T_INT, T_BITS, T_OCTETS, T_NULL, T_OID = 0x01, 0x02, 0x03, 0x04, 0x05, 0x06
+T_UTF8, T_PRINTABLE, T_IA5, T_UTCTIME, T_GENTIME = 0x0C, 0x13, 0x16, 0x17, 0x18
+T_SEQ, T_SET = 0x30, 0x31
+
+
+def _enc_len(n: int) -> bytes:
+    if n < 0x80:
+        return bytes([n])
+    b = n.to_bytes((n.bit_length() + 7) // 8, "big")
+    return bytes([0x80 | len(b)]) + b
+
+
+def der(tag: int, content: bytes) -> bytes:
+    return bytes([tag]) + _enc_len(len(content)) + content
+
+
+def der_int(v: int) -> bytes:
+    n = (v.bit_length() + 8) // 8 if v >= 0 else ((~v).bit_length() + 8) // 8
+    return der(T_INT, v.to_bytes(max(n, 1), "big", signed=True))
+
+
+def der_oid(dotted: str) -> bytes:
+    parts = [int(x) for x in dotted.split(".")]
+    out = bytearray()
+    for v in [parts[0] * 40 + parts[1]] + parts[2:]:
+        chunk = [v & 0x7F]
+        v >>= 7
+        while v:
+            chunk.append(0x80 | (v & 0x7F))
+            v >>= 7
+        out.extend(reversed(chunk))
+    return der(T_OID, bytes(out))
+
+
+def der_seq(*parts: bytes) -> bytes:
+    return der(T_SEQ, b"".join(parts))
+
+
+def der_set(*parts: bytes) -> bytes:
+    return der(T_SET, b"".join(sorted(parts)))   # DER 的 SET OF 按编码排序
+
+
+def der_explicit(n: int, inner: bytes) -> bytes:
+    return der(0xA0 | n, inner)
+
+
+def der_gentime(dt: datetime) -> bytes:
+    dt = dt.astimezone(timezone.utc)
+    s = dt.strftime("%Y%m%d%H%M%S")
+    if dt.microsecond:
+        s += ("." + f"{dt.microsecond:06d}").rstrip("0")
+    return der(T_GENTIME, (s + "Z").encode("ascii"))
+
+
+def _alg_id(hash_algo: str) -> bytes:
+    oid = HASH_OIDS.get(hash_algo)
+    if oid is None:
+        raise ValueError(f"unsupported hash algorithm: {hash_algo}")
+    return der_seq(der_oid(oid), der(T_NULL, b""))
+
+
+# ---------------- DER 解码 ----------------
+# 节点用 (tag, start, end) 表示：值在 buf[start:end]，不拷贝
+
+Node = Tuple[int, int, int]
+
+
+def _read(buf: bytes, pos: int, limit: Optional[int] = None) -> Tuple[Node, int]:
+    limit = len(buf) if limit is None else limit
+    if pos + 2 > limit:
+        raise DERError("truncated TLV")
+    tag = buf[pos]
+    if tag & 0x1F == 0x1F:
+        raise DERError("high tag numbers are not supported")
+    n = buf[pos + 1]
+    pos += 2
+    if n & 0x80:
+        k = n & 0x7F
+        if k == 0 or k > 4 or pos + k > limit:
+            raise DERError("bad length")
+        n = int.from_bytes(buf[pos:pos + k], "big")
+        pos += k
+    if pos + n > limit:
+        raise DERError("truncated value")
+    return (tag, pos, pos + n), pos + n
+
+
+def _root(buf: bytes) -> Node:
+    node, end = _read(buf, 0)
+    if end != len(buf):
+        raise DERError("trailing bytes after DER value")
+    return node
+
+
+def _kids(buf: bytes, node: Node) -> List[Node]:
+    out, pos = [], node[1]
+    while pos < node[2]:
+        child, pos = _read(buf, pos, node[2])
+        out.append(child)
+    return out
+
+
+def _need(kids: List[Node], n: int, what: str) -> List[Node]:
+    """子节点不够时按结构错误处理，不让后面的下标取值抛 IndexError"""
+    if len(kids) < n:
+        raise DERError(f"{what}: expected at least {n} elements, got {len(kids)}")
+    return kids
+
+
+def _expect(node: Node, tag: int, what: str) -> Node:
+    if node[0] != tag:
+        raise DERError(f"{what}: expected tag 0x{tag:02x}, got 0x{node[0]:02x}")
+    return node
+
+
+def _int(buf: bytes, node: Node) -> int:
+    return int.from_bytes(buf[node[1]:node[2]], "big", signed=True)
+
+
+def _oid(buf: bytes, node: Node) -> str:
+    _expect(node, T_OID, "OID")
+    vals, v = [], 0
+    for b in buf[node[1]:node[2]]:
+        v = (v << 7) | (b & 0x7F)
+        if not b & 0x80:
+            vals.append(v)
+            v = 0
+    if not vals:
+        raise DERError("empty OID")
+    first = min(vals[0] // 40, 2)
+    return ".".join(str(x) for x in [first, vals[0] - first * 40] + vals[1:])
+
+
+def _time(buf: bytes, node: Node) -> datetime:
+    s = bytes(buf[node[1]:node[2]]).decode("ascii")
+    if not s.endswith("Z"):
+        raise DERError(f"time without Z: {s}")
+    s = s[:-1]
+    if node[0] == T_UTCTIME:
+        yy = int(s[:2])
+        s = ("19" if yy >= 50 else "20") + s
+    elif node[0] != T_GENTIME:
+        raise DERError("expected UTCTime / GeneralizedTime")
+    main, _, frac = s.partition(".")
+    dt = datetime.strptime(main, "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+    if frac:
+        dt = dt.replace(microsecond=int(frac[:6].ljust(6, "0")))
+    return dt
+
+
+def _name(buf: bytes, node: Node) -> str:
+    """X.501 Name → "CN=...,O=..."（只认常见属性，其余用 OID）"""
+    parts = []
+    for rdn in _kids(buf, _expect(node, T_SEQ, "Name")):
+        for atv in _kids(buf, rdn):
+            oid_n, val_n = _need(_kids(buf, atv), 2, "AttributeTypeAndValue")[:2]
+            oid = _oid(buf, oid_n)
+            raw = bytes(buf[val_n[1]:val_n[2]])
+            val = raw.decode("utf-16-be" if val_n[0] == 0x1E else "utf-8", errors="replace")
+            parts.append(f"{NAME_ATTRS.get(oid, oid)}={val}")
+    return ",".join(parts)
+
+
+# ---------------- TSQ ----------------
+
+def build_tsq(digest: bytes, hash_algo: str = "sha256", nonce: Optional[int] = None,
+              cert_req: bool = True, policy: Optional[str] = None) -> bytes:
+    """TimeStampReq（v1）；nonce=None 时随机生成一个 63 位正整数"""
+    hash_algo = hash_algo.lower()
+    if len(digest) != hashlib.new(hash_algo).digest_size:
+        raise ValueError(f"digest length {len(digest)} does not match {hash_algo}")
+    if nonce is None:
+        nonce = secrets.randbits(63)
+    parts = [der_int(1), der_seq(_alg_id(hash_algo), der(T_OCTETS, digest))]
+    if policy:
+        parts.append(der_oid(policy))
+    parts.append(der_int(nonce))
+    if cert_req:
+        parts.append(der(T_BOOL, b"\xff"))
+    return der_seq(*parts)
+
+
+def parse_tsq(data: bytes) -> Dict:
+    buf = bytes(data)
+    kids = _need(_kids(buf, _expect(_root(buf), T_SEQ, "TimeStampReq")), 2, "TimeStampReq")
+    algo, digest = _imprint(buf, kids[1])
+    if algo in HASH_OIDS and len(digest) != hashlib.new(algo).digest_size:
+        raise DERError(f"messageImprint: {len(digest)}-byte digest for {algo}")
+    out = {"version": _int(buf, kids[0]), "hash_algo": algo, "digest": digest,
+           "policy": None, "nonce": None, "cert_req": False}
+    for k in kids[2:]:
+        if k[0] == T_OID:
+            out["policy"] = _oid(buf, k)
+        elif k[0] == T_INT:
+            out["nonce"] = _int(buf, k)
+        elif k[0] == T_BOOL:
+            if k[2] - k[1] != 1:
+                raise DERError("certReq: BOOLEAN must be one byte")
+            out["cert_req"] = buf[k[1]] != 0
+    return out
+
+
+def _imprint(buf: bytes, node: Node) -> Tuple[str, bytes]:
+    alg, hashed = _need(_kids(buf, _expect(node, T_SEQ, "MessageImprint")), 2, "MessageImprint")[:2]
+    oid = _oid(buf, _need(_kids(buf, _expect(alg, T_SEQ, "hashAlgorithm")), 1, "hashAlgorithm")[0])
+    _expect(hashed, T_OCTETS, "hashedMessage")
+    return OID_HASHES.get(oid, oid), bytes(buf[hashed[1]:hashed[2]])
+
+
+# ---------------- 证书链（按原始字节缓存） ----------------
+
+def _cert_info(buf: bytes, node: Node, raw_start: int) -> Dict:
+    tbs = _kids(buf, _expect(_need(_kids(buf, node), 1, "Certificate")[0], T_SEQ, "TBSCertificate"))
+    if tbs and tbs[0][0] == 0xA0:     # [0] EXPLICIT version
+        tbs = tbs[1:]
+    serial, _sig, issuer, validity, subject = _need(tbs, 5, "TBSCertificate")[:5]
+    nb, na = _need(_kids(buf, _expect(validity, T_SEQ, "Validity")), 2, "Validity")[:2]
+    return {
+        "subject": _name(buf, subject),
+        "issuer": _name(buf, issuer),
+        "serial": format(_int(buf, serial), "x"),
+        "not_before": _time(buf, nb).isoformat(),
+        "not_after": _time(buf, na).isoformat(),
+        "sha256": hashlib.sha256(buf[raw_start:node[2]]).hexdigest(),   # 整张证书 DER 的指纹
+    }
+
+
+@lru_cache(maxsize=256)
+def parse_cert_chain(blob: bytes) -> Tuple[Dict, ...]:
+    """
+    certificates 字段（[0] IMPLICIT SET OF Certificate 的内容）→ 证书摘要元组，
+    按 subject→issuer 从叶到根排好序。相同字节直接命中缓存。
+    """
+    certs, pos = [], 0
+    while pos < len(blob):
+        start = pos
+        node, pos = _read(blob, pos)
+        if node[0] == T_SEQ:
+            certs.append(_cert_info(blob, node, start))
+    by_subject = {c["subject"]: c for c in certs}
+    issuers = {c["issuer"] for c in certs if c["issuer"] != c["subject"]}
+    leaf = next((c for c in certs if c["subject"] not in issuers), certs[0] if certs else None)
+    chain, seen = [], set()
+    while leaf is not None and leaf["sha256"] not in seen:
+        chain.append(leaf)
+        seen.add(leaf["sha256"])
+        leaf = by_subject.get(leaf["issuer"]) if leaf["issuer"] != leaf["subject"] else None
+    chain.extend(c for c in certs if c["sha256"] not in seen)
+    return tuple(chain)
+
+
+# ---------------- TSR ----------------
+
+class TimeStampToken:
+    """parse_tsr() 的结果；status != granted 时只有 status / status_text 有值"""
+
+    __slots__ = ("status", "status_text", "policy", "hash_algo", "digest", "serial",
+                 "gen_time", "nonce", "tsa", "certs", "tst_info")
+
+    def __init__(self, **kw):
+        for k in self.__slots__:
+            setattr(self, k, kw.get(k))
+
+    @property
+    def granted(self) -> bool:
+        return self.status in (0, 1)
+
+    def as_dict(self) -> Dict:
+        return {
+            "status": PKI_STATUS.get(self.status, self.status),
+            "status_text": self.status_text,
+            "policy": self.policy,
+            "hash_algo": self.hash_algo,
+            "imprint": self.digest.hex() if self.digest else None,
+            "serial": format(self.serial, "x") if self.serial is not None else None,
+            "gen_time": self.gen_time.isoformat() if self.gen_time else None,
+            "nonce": self.nonce,
+            "tsa": self.tsa,
+            "certs": list(self.certs or ()),
+        }
+
+
+def _tst_info(buf: bytes) -> Dict:
+    kids = _kids(buf, _expect(_root(buf), T_SEQ, "TSTInfo"))
+    if len(kids) < 5:
+        raise DERError("TSTInfo too short")
+    algo, digest = _imprint(buf, kids[2])
+    out = {"policy": _oid(buf, kids[1]), "hash_algo": algo, "digest": digest,
+           "serial": _int(buf, kids[3]), "gen_time": _time(buf, _expect(kids[4], T_GENTIME, "genTime")),
+           "nonce": None, "tsa": None}
+    for k in kids[5:]:
+        if k[0] == T_INT:
+            out["nonce"] = _int(buf, k)
+        elif k[0] == 0xA0:   # tsa [0] EXPLICIT GeneralName
+            gn = _need(_kids(buf, k), 1, "tsa")[0]
+            if gn[0] == 0xA4:   # directoryName [4] EXPLICIT Name
+                out["tsa"] = _name(buf, _need(_kids(buf, gn), 1, "directoryName")[0])
+            else:
+                out["tsa"] = bytes(buf[gn[1]:gn[2]]).decode("utf-8", errors="replace")
+    return out
+
+
+def parse_tsr(data: bytes) -> TimeStampToken:
+    """TimeStampResp → TimeStampToken；也接受直接传入 token（ContentInfo）"""
+    buf = bytes(data)
+    top = _need(_kids(buf, _expect(_root(buf), T_SEQ, "TimeStampResp")), 1, "TimeStampResp")
+    if top[0][0] == T_OID:                  # 直接是 ContentInfo（只存了 token）
+        status, text = 0, None
+        token_kids = top
+    else:
+        si = _need(_kids(buf, _expect(top[0], T_SEQ, "PKIStatusInfo")), 1, "PKIStatusInfo")
+        status = _int(buf, si[0])
+        text = None
+        if len(si) > 1 and si[1][0] == T_SEQ:
+            text = "; ".join(bytes(buf[s[1]:s[2]]).decode("utf-8", errors="replace") for s in _kids(buf, si[1]))
+        if len(top) < 2:
+            if status in (0, 1):            # granted 却没带 token：不能当成一张有效回执
+                raise DERError("status granted but no timeStampToken")
+            return TimeStampToken(status=status, status_text=text)
+        token_kids = _kids(buf, _expect(top[1], T_SEQ, "TimeStampToken"))
+    _need(token_kids, 2, "ContentInfo")
+    if _oid(buf, token_kids[0]) != OID_SIGNED_DATA:
+        raise DERError("timeStampToken is not SignedData")
+    sd = _need(_kids(buf, _need(_kids(buf, _expect(token_kids[1], 0xA0, "content")), 1, "content")[0]),
+               3, "SignedData")
+    encap = _need(_kids(buf, _expect(sd[2], T_SEQ, "encapContentInfo")), 2, "encapContentInfo")
+    if _oid(buf, encap[0]) != OID_TST_INFO:
+        raise DERError("eContentType is not TSTInfo")
+    octets = _need(_kids(buf, _expect(encap[1], 0xA0, "eContent")), 1, "eContent")[0]
+    tst_der = bytes(buf[octets[1]:octets[2]])
+    certs: Tuple[Dict, ...] = ()
+    for k in sd[3:]:
+        if k[0] == 0xA0:
+            certs = parse_cert_chain(bytes(buf[k[1]:k[2]]))
+    return TimeStampToken(status=status, status_text=text, certs=certs, tst_info=tst_der, **_tst_info(tst_der))
+
+
+def verify_tsr(data: bytes, expected_digest, hash_algo: Optional[str] = None,
+               nonce: Optional[int] = None) -> Dict:
+    """
+    校验回执与本地摘要是否对应：状态为 granted、messageImprint 一致、（给了的话）nonce 一致、
+    hash_algo 一致。expected_digest 可以是 bytes 或 hex 字符串。
+    """
+    try:
+        tok = parse_tsr(data)
+    except (DERError, ValueError, IndexError) as e:
+        return {"ok": False, "reason": f"malformed: {e}"}
+    res = tok.as_dict()
+    if not tok.granted:
+        return {**res, "ok": False, "reason": f"status {res['status']}"}
+    want = bytes.fromhex(expected_digest) if isinstance(expected_digest, str) else bytes(expected_digest or b"")
+    if hash_algo and tok.hash_algo != hash_algo.lower():
+        return {**res, "ok": False, "reason": f"hash algorithm {tok.hash_algo} != {hash_algo}"}
+    if tok.digest != want:
+        return {**res, "ok": False, "reason": "message imprint mismatch"}
+    if nonce is not None and tok.nonce != nonce:
+        return {**res, "ok": False, "reason": "nonce mismatch"}
+    return {**res, "ok": True, "reason": None}
+
+
+def verify_many(items: Iterable[Tuple[object, bytes, str]]) -> Iterator[Tuple[object, Dict]]:
+    """批量校验 [(key, tsr, expected_sha256_hex)]；证书链解析走缓存，单条只做 DER 解析 + 比对"""
+    for key, tsr, expected in items:
+        if not expected:
+            yield key, {"ok": False, "reason": "no stored digest"}
+            continue
+        yield key, verify_tsr(tsr, expected)
+
+
+# ---------------- mock TSA 用：按 TSQ 生成 TSR（不含签名） ----------------
+
+def build_tsr(tsq: bytes, serial: int, gen_time: Optional[datetime] = None,
+              policy: str = DEFAULT_POLICY, tsa_name: Optional[str] = None,
+              certs: Sequence[bytes] = ()) -> bytes:
+    """
+    结构完整但 signerInfos 为空的 TimeStampResp，给本地 mock TSA 和测试用；
+    不能当作真实时间戳。
+    """
+    req = parse_tsq(tsq)
+    gen_time = gen_time or datetime.now(timezone.utc)
+    tst = [der_int(1), der_oid(req["policy"] or policy),
+           der_seq(_alg_id(req["hash_algo"]), der(T_OCTETS, req["digest"])),
+           der_int(serial), der_gentime(gen_time)]
+    if req["nonce"] is not None:
+        tst.append(der_int(req["nonce"]))
+    if tsa_name:
+        name = der_seq(der_set(der_seq(der_oid("2.5.4.3"), der(T_UTF8, tsa_name.encode("utf-8")))))
+        tst.append(der_explicit(0, der(0xA4, name)))
+    encap = der_seq(der_oid(OID_TST_INFO), der_explicit(0, der(T_OCTETS, der_seq(*tst))))
+    sd = [der_int(3), der_set(_alg_id(req["hash_algo"])), encap]
+    if certs and req["cert_req"]:
+        sd.append(der(0xA0, b"".join(certs)))
+    sd.append(der(T_SET, b""))
+    token = der_seq(der_oid(OID_SIGNED_DATA), der_explicit(0, der_seq(*sd)))
+    return der_seq(der_seq(der_int(0)), token)
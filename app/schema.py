@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+data/verify_upgrade.db 的表结构迁移：所有建表 / 建索引都在 MIGRATIONS 里按版本号排好，
+已执行的版本记在 schema_migrations 表里，每个版本只跑一次。
+
+- 启动时（main.py 的 lifespan 启动钩子）跑一遍；
+- 兜底：连接池每打开一条新连接时读一次 schema_migrations（纯读），
+  发现有没跑过的版本（老库 / 测试里的新库 / 没走 lifespan 的脚本）才加写锁执行；
+- 请求路径上不再有任何 DDL。
+
+各表的 DDL 常量仍放在各自模块里（storage / search / upgrade25 / merkle / c2pa_jobs / shared_receipts），
+这里只负责顺序和版本。早期版本的 DDL 都是 IF NOT EXISTS，迁移之前就有表的老库直接补记版本号。
+加表 / 加索引：在 _migrations() 末尾追加一个新版本号，不要改已经发布的版本。
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Sequence, Tuple, Union
+
+logger = logging.getLogger("verify-upgrade")
+
+SQL_CREATE_SCHEMA_MIGRATIONS = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version    INTEGER PRIMARY KEY,
+        name       TEXT NOT NULL,
+        applied_at TEXT
+    )
+"""
+SQL_SELECT_APPLIED = "SELECT version FROM schema_migrations"
+SQL_INSERT_APPLIED = "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)"
+# 按业务编号查 cert（Storage.cert_ids_for_case / 按案号导出）；v9 起换成带 cert_id 的版本，按案号导出不用再排序
+SQL_CREATE_EVIDENCE_META_CASE = "CREATE INDEX IF NOT EXISTS idx_evidence_meta_case ON evidence_meta (case_id)"
+SQL_CREATE_EVIDENCE_META_CASE_CERT = (
+    "CREATE INDEX IF NOT EXISTS idx_evidence_meta_case_cert ON evidence_meta (case_id, cert_id)"
+)
+
+Step = Union[str, Callable[[sqlite3.Connection], None]]
+Migration = Tuple[int, str, Sequence[Step]]
+
+_MIGRATIONS: List[Migration] = []
+
+
+def _migrations() -> List[Migration]:
+    """延迟组装（各模块都要 import sqlite_pool / schema，放到模块级会循环引用）"""
+    if _MIGRATIONS:
+        return _MIGRATIONS
+    from app import c2pa_jobs, merkle, search, shared_receipts, storage, upgrade25
+    _MIGRATIONS.extend([
+        (1, "receipts / evidence / evidence_meta",
+         (storage.SQL_CREATE_RECEIPTS, storage.SQL_CREATE_EVIDENCE, storage.SQL_CREATE_EVIDENCE_META)),
+        (2, "receipts (cert_id, id) index", (storage.SQL_CREATE_RECEIPTS_CERT,)),
+        (3, "tsa_tokens", (upgrade25.SQL_CREATE_TSA_TOKENS, upgrade25.SQL_CREATE_TSA_TOKENS_CERT)),
+        (4, "merkle nodes / leaves / anchors", merkle.MERKLE_DDL),
+        (5, "c2pa_jobs", (c2pa_jobs.SQL_CREATE_C2PA_JOBS, c2pa_jobs.SQL_CREATE_C2PA_JOBS_DEDUP,
+                          c2pa_jobs.SQL_CREATE_C2PA_JOBS_STATUS)),
+        (6, "receipt_clears", (shared_receipts.SQL_CREATE_RECEIPT_CLEARS,)),
+        (7, "evidence_meta (case_id) index", (SQL_CREATE_EVIDENCE_META_CASE,)),
+        (8, "full-text search (evidence_fts / receipts_fts)", (search.create_search_index,)),
+        (9, "covering indexes: receipts by cert, evidence_meta by case",
+         (storage.SQL_CREATE_RECEIPTS_CERT_COVER, "DROP INDEX IF EXISTS idx_receipts_cert",
+          SQL_CREATE_EVIDENCE_META_CASE_CERT, "DROP INDEX IF EXISTS idx_evidence_meta_case")),
+    ])
+    versions = [m[0] for m in _MIGRATIONS]
+    assert versions == sorted(set(versions)), "schema versions must be unique and increasing"
+    return _MIGRATIONS
+
+
+def applied(conn: sqlite3.Connection) -> set:
+    try:
+        return {r[0] for r in conn.execute(SQL_SELECT_APPLIED)}
+    except sqlite3.OperationalError:        # 还没有 schema_migrations：一个版本都没跑过
+        return set()
+
+
+def pending(conn: sqlite3.Connection) -> List[Migration]:
+    done = applied(conn)
+    return [m for m in _migrations() if m[0] not in done]
+
+
+def migrate(conn: sqlite3.Connection) -> List[int]:
+    """在一个写事务里把没跑过的版本按顺序跑完；返回这次执行的版本号"""
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")          # 多个连接 / 进程同时启动时只让一个去执行
+    try:
+        conn.execute(SQL_CREATE_SCHEMA_MIGRATIONS)
+        todo = pending(conn)                 # 拿到锁之后再看一次
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        for version, name, steps in todo:
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(SQL_INSERT_APPLIED, (version, name, now))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    if todo:
+        logger.info("schema: applied %s", ", ".join(f"{v} ({n})" for v, n, _ in todo))
+    return [v for v, _, _ in todo]
+
+
+def ensure(conn: sqlite3.Connection) -> None:
+    """连接钩子：有没跑过的版本才迁移，否则只是一次读"""
+    if pending(conn):
+        migrate(conn)
+
+
+def attach(pool) -> None:
+    """让 pool 打开的每条新连接都先确认表结构是最新的（重复调用无副作用）"""
+    if ensure not in pool.on_connect:
+        pool.on_connect.append(ensure)
+
+
+def status(conn) -> dict:
+    if conn is None:
+        return {"version": 0, "pending": [m[0] for m in _migrations()]}
+    done = applied(conn)
+    return {"version": max(done, default=0), "pending": [m[0] for m in _migrations() if m[0] not in done]}
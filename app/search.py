@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+证据 / 回执全文检索（SQLite FTS5），给 /api/search 与 Vault 的“全文检索”用。
+
+两张 external-content 的 FTS5 表挂在 data/verify_upgrade.db 上，由触发器随源表增量维护
+（api_evidence_update / 批量登记 / ReceiptWriter 落库都不用另外通知）：
+
+  evidence_fts  content=evidence_meta：case_id / title / owner / source / notes
+                trigram 分词：中文标题、案号 / 编号的任意子串都能命中（每个词至少 3 个字符）
+  receipts_fts  content=receipts：只索引 txid（provider / status 取值就几个，Vault 的 provider:xx 语法已覆盖），
+                unicode61 分词 + 前缀匹配（txid 前缀，如 0xab12）；回执量大，比 trigram 省得多
+
+查询串按空白切词，词之间为 AND；一个 cert 在 evidence_fts 整体命中或某条回执命中即算命中。
+排序用 bm25（案号 / 标题权重更高），同一 cert 两边都命中时分数相加；cert_id 精确等于查询串的排最前。
+FTS 表首次建出来时对已有数据 rebuild 一次。evidence_meta 的 rowid 是隐式的，VACUUM 可能重排它，
+真要 VACUUM 之后跑一次 rebuild_search_index()。
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+META_COLUMNS = ("case_id", "title", "owner", "source", "notes")
+META_WEIGHTS = (8.0, 4.0, 2.0, 1.0, 1.0)
+MIN_TRIGRAM = 3
+RECEIPT_CANDIDATES = 2000       # 回执侧先按 rank 取这么多条再按 cert 归并
+
+SQL_CREATE_EVIDENCE_FTS = """
+    CREATE VIRTUAL TABLE evidence_fts USING fts5(
+        case_id, title, owner, source, notes,
+        content='evidence_meta', content_rowid='rowid', tokenize='trigram'
+    )
+"""
+SQL_CREATE_RECEIPTS_FTS = """
+    CREATE VIRTUAL TABLE receipts_fts USING fts5(
+        txid,
+        content='receipts', content_rowid='id', tokenize='unicode61'
+    )
+"""
+SQL_CREATE_SEARCH_TRIGGERS = (
+    """CREATE TRIGGER IF NOT EXISTS evidence_meta_fts_ai AFTER INSERT ON evidence_meta BEGIN
+           INSERT INTO evidence_fts (rowid, case_id, title, owner, source, notes)
+           VALUES (new.rowid, new.case_id, new.title, new.owner, new.source, new.notes);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS evidence_meta_fts_ad AFTER DELETE ON evidence_meta BEGIN
+           INSERT INTO evidence_fts (evidence_fts, rowid, case_id, title, owner, source, notes)
+           VALUES ('delete', old.rowid, old.case_id, old.title, old.owner, old.source, old.notes);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS evidence_meta_fts_au AFTER UPDATE OF case_id, title, owner, source, notes
+           ON evidence_meta BEGIN
+           INSERT INTO evidence_fts (evidence_fts, rowid, case_id, title, owner, source, notes)
+           VALUES ('delete', old.rowid, old.case_id, old.title, old.owner, old.source, old.notes);
+           INSERT INTO evidence_fts (rowid, case_id, title, owner, source, notes)
+           VALUES (new.rowid, new.case_id, new.title, new.owner, new.source, new.notes);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS receipts_fts_ai AFTER INSERT ON receipts BEGIN
+           INSERT INTO receipts_fts (rowid, txid) VALUES (new.id, new.txid);
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS receipts_fts_ad AFTER DELETE ON receipts BEGIN
+           INSERT INTO receipts_fts (receipts_fts, rowid, txid) VALUES ('delete', old.id, old.txid);
+       END""",
+)
+SQL_FTS_EXISTS = "SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('evidence_fts', 'receipts_fts')"
+SQL_REBUILD_FTS = "INSERT INTO {table} ({table}) VALUES ('rebuild')"
+SQL_SEARCH_META = f"""
+    SELECT m.cert_id, bm25(evidence_fts, {', '.join(map(str, META_WEIGHTS))}) AS score
+    FROM evidence_fts JOIN evidence_meta m ON m.rowid = evidence_fts.rowid
+    WHERE evidence_fts MATCH ?
+    ORDER BY score LIMIT ?
+"""
+SQL_SEARCH_RECEIPTS = """
+    SELECT r.cert_id, MIN(f.score), COUNT(*)
+    FROM (SELECT rowid, rank AS score FROM receipts_fts WHERE receipts_fts MATCH ? ORDER BY rank LIMIT ?) f
+    JOIN receipts r ON r.id = f.rowid
+    GROUP BY r.cert_id
+"""
+SQL_SEARCH_EXACT = """
+    SELECT EXISTS (SELECT 1 FROM evidence_meta WHERE cert_id = ?)
+        OR EXISTS (SELECT 1 FROM receipts WHERE cert_id = ?)
+"""
+
+_SPLIT = re.compile(r"\s+")
+
+
+def create_search_index(conn) -> None:
+    """迁移步骤（app/schema.py，排在建源表之后）：建 FTS 表和触发器；表是新建的就把已有数据灌一遍"""
+    have = {r[0] for r in conn.execute(SQL_FTS_EXISTS)}
+    for table, ddl in (("evidence_fts", SQL_CREATE_EVIDENCE_FTS), ("receipts_fts", SQL_CREATE_RECEIPTS_FTS)):
+        if table not in have:
+            conn.execute(ddl)
+            conn.execute(SQL_REBUILD_FTS.format(table=table))
+    for ddl in SQL_CREATE_SEARCH_TRIGGERS:
+        conn.execute(ddl)
+
+
+def rebuild_search_index(conn) -> None:
+    for table in ("evidence_fts", "receipts_fts"):
+        conn.execute(SQL_REBUILD_FTS.format(table=table))
+    conn.commit()
+
+
+def terms(q: str) -> List[str]:
+    return [t for t in _SPLIT.split((q or "").strip()) if t]
+
+
+def _phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+
+def meta_match(q: str) -> Optional[str]:
+    """trigram 侧的 MATCH 串；不足 3 个字符的词 trigram 命不中，跳过（全都太短则返回 None）"""
+    ts = [t for t in terms(q) if len(t) >= MIN_TRIGRAM]
+    return " AND ".join(_phrase(t) for t in ts) or None
+
+
+def receipt_match(q: str) -> Optional[str]:
+    """unicode61 侧：每个词按前缀匹配；只含分隔符的词（如 "-"）丢掉"""
+    ts = [t for t in terms(q) if re.search(r"\w", t)]
+    return " AND ".join(_phrase(t) + " *" for t in ts) or None
+
+
+def search_sqlite(conn, q: str, limit: int = 20, offset: int = 0) -> Tuple[List[Tuple[str, float, List[str]]], bool]:
+    """返回 ([(cert_id, score, 命中来源), ...], 是否还有下一页)；score 越大越相关"""
+    want = offset + limit + 1
+    scores: Dict[str, float] = {}
+    hits: Dict[str, List[str]] = {}
+    mq = meta_match(q)
+    if mq:
+        for cert_id, score in conn.execute(SQL_SEARCH_META, (mq, want)):
+            scores[cert_id] = -score
+            hits.setdefault(cert_id, []).append("evidence")
+    rq = receipt_match(q)
+    if rq:
+        for cert_id, score, n in conn.execute(SQL_SEARCH_RECEIPTS, (rq, max(RECEIPT_CANDIDATES, want))):
+            scores[cert_id] = scores.get(cert_id, 0.0) - score
+            hits.setdefault(cert_id, []).append("receipts")
+    exact = (q or "").strip()
+    if exact and conn.execute(SQL_SEARCH_EXACT, (exact, exact)).fetchone()[0]:
+        scores[exact] = max(scores.values(), default=0.0) + 1.0
+        hits.setdefault(exact, []).insert(0, "cert_id")
+    ranked = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))
+    page = ranked[offset:offset + limit]
+    return [(c, round(s, 4), hits[c]) for c, s in page], len(ranked) > offset + limit
+
+
+def search_scan(rows: Iterable[Sequence], q: str, limit: int = 20, offset: int = 0
+                ) -> Tuple[List[Tuple[str, float, List[str]]], bool]:
+    """
+    没有 FTS 的后端（memory / postgres / sqlalchemy）的兜底：逐行子串匹配 evidence 业务字段。
+    rows 为 Storage.iter_evidence() 的元组 (cert_id, case_id, title, owner, source, notes, updated_at)。
+    分数 = 命中列的权重之和。
+    """
+    ts = [t.lower() for t in terms(q)]
+    if not ts:
+        return [], False
+    exact = (q or "").strip()
+    scored = []
+    for row in rows:
+        cert_id, cols = row[0], [str(v or "").lower() for v in row[1:1 + len(META_COLUMNS)]]
+        if not all(any(t in v for v in cols) for t in ts):
+            if cert_id != exact:
+                continue
+        score = sum(w for t in ts for v, w in zip(cols, META_WEIGHTS) if t in v)
+        scored.append((cert_id, score + (100.0 if cert_id == exact else 0.0),
+                       ["cert_id"] if cert_id == exact else ["evidence"]))
+    scored.sort(key=lambda x: (-x[1], x[0]))
+    return scored[offset:offset + limit], len(scored) > offset + limit
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+多 worker 共享回执（RECEIPTS_SHARED=1）：uvicorn --workers N 时每个进程各有一份 app.state.receipts，
+互相看不到对方写的回执。共享模式下以 data/verify_upgrade.db 的 receipts 表为准：
+
+- 写：回执先经 ReceiptWriter 提交（等批次 commit，多个请求同批提交），再同步进本进程；
+- 读：每次读之前按 receipts.id 追尾（WHERE id > 上次位置，主键区间扫描），新行追加进本进程的
+  ReceiptStore；查询 / 分页 / 计数仍走内存索引，延迟与单进程相同；
+- 清空：写一行 receipt_clears（cert_id 为空表示全部，upto 为当时 receipts 的最大 id），
+  各 worker 追尾时按 id 顺序重放，只清 upto 之前的回执；
+- Merkle 锚定：merkle_anchors 有新行（别的 worker 锚定了一批）时整体失效页面缓存，
+  一批 cert 同时变成“已锚定”。Merkle 树本身在同一个库里，见 app/merkle.py。
+
+WAL 下读不阻塞写；receipts 的 id 按提交顺序递增（写锁串行），所以追尾不会漏行。
+追尾前先看 PRAGMA data_version（别的连接提交过就会变）+ 本连接的 total_changes，都没变就不查表，
+空读只多一次 PRAGMA。
+"""
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Optional, Set
+
+from app import schema
+from app.receipt_store import ReceiptStore
+
+logger = logging.getLogger("verify-upgrade")
+
+SQL_CREATE_RECEIPT_CLEARS = """
+    CREATE TABLE IF NOT EXISTS receipt_clears (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        cert_id    TEXT,
+        upto       INTEGER NOT NULL,
+        created_at TEXT
+    )
+"""
+SQL_DATA_VERSION = "PRAGMA data_version"
+SQL_TAIL_RECEIPTS = "SELECT id, cert_id, provider, status, txid, created_at FROM receipts WHERE id > ? ORDER BY id"
+SQL_TAIL_CLEARS = "SELECT id, cert_id, upto FROM receipt_clears WHERE id > ? ORDER BY id"
+SQL_LAST_ANCHOR_ID = "SELECT COALESCE(MAX(id), 0) FROM merkle_anchors"
+SQL_INSERT_CLEAR = """
+    INSERT INTO receipt_clears (cert_id, upto, created_at)
+    VALUES (?, (SELECT COALESCE(MAX(id), 0) FROM receipts), ?)
+"""
+FETCH_BATCH = 1000
+
+
+class SharedReceipts:
+    """
+    pool: SQLitePool；submit(cert_id, item)：把回执写进 receipts 表并等提交完成；
+    on_change(cert_ids)：追尾拿到新回执 / 清空后调用（cert_ids 含 None 表示全部），main.py 用来失效页面缓存。
+    sync_ms>0 时两次追尾之间至少隔这么久（用一点新鲜度换更少的查询），默认每次读都追。
+    """
+
+    def __init__(self, pool, submit: Callable[[str, dict], None], enabled: bool = True, sync_ms: int = 0,
+                 on_change: Optional[Callable[[Iterable[Optional[str]]], None]] = None):
+        self.pool = pool
+        self.submit = submit
+        self.enabled = enabled
+        self.sync_ms = max(0, int(sync_ms))
+        self.on_change = on_change
+        self.store = ReceiptStore()
+        self.syncs = 0
+        self.pulled = 0
+        self._last_id = 0
+        self._last_clear = 0
+        self._last_anchor = 0
+        self._last_sync = 0.0
+        self._path = None
+        self._lock = threading.Lock()
+        self._tls = threading.local()     # 每个线程的连接上次追尾时的 (conn, data_version, total_changes)
+        schema.attach(pool)          # receipt_clears 由 app/schema.py 的迁移建
+
+    @classmethod
+    def from_env(cls, pool, submit, **kw) -> "SharedReceipts":
+        return cls(pool, submit,
+                   enabled=os.getenv("RECEIPTS_SHARED", "0").lower() in ("1", "true", "yes"),
+                   sync_ms=int(os.getenv("RECEIPTS_SYNC_MS", "0")), **kw)
+
+    # ---------- 追尾 ----------
+    def sync(self, force: bool = False) -> Set[Optional[str]]:
+        """把其它 worker（和自己）已提交的回执 / 清空拉进本进程；返回变动的 cert_id"""
+        if not force and self.sync_ms and time.monotonic() - self._last_sync < self.sync_ms / 1000.0:
+            return set()
+        with self._lock:
+            if self._path != self.pool.path:
+                # 换了库（测试里常见）：本进程的副本作废，从头追
+                self._path = self.pool.path
+                self.store.clear()
+                self._last_id = self._last_clear = self._last_anchor = 0
+                self._tls = threading.local()
+            conn = self.pool.conn(create=True)
+            mark = (conn, conn.execute(SQL_DATA_VERSION).fetchone()[0], conn.total_changes)
+            seen = getattr(self._tls, "mark", None)
+            if seen is not None and seen[0] is mark[0] and seen[1:] == mark[1:]:
+                return set()
+            changed: Set[Optional[str]] = set()
+            own = not conn.in_transaction
+            if own:
+                conn.execute("BEGIN")          # 几张表在同一个快照里读
+            try:
+                clears = conn.execute(SQL_TAIL_CLEARS, (self._last_clear,)).fetchall()
+                cur = conn.execute(SQL_TAIL_RECEIPTS, (self._last_id,))
+                pending = iter(clears)
+                nxt = next(pending, None)
+                while True:
+                    rows = cur.fetchmany(FETCH_BATCH)
+                    if not rows:
+                        break
+                    for rid, cert_id, provider, status, txid, created_at in rows:
+                        while nxt is not None and nxt[2] < rid:
+                            changed.add(self._apply_clear(nxt))
+                            nxt = next(pending, None)
+                        self.store.append(cert_id, {"provider": provider, "status": status, "txid": txid,
+                                                    "time": created_at})
+                        self._last_id = rid
+                        changed.add(cert_id)
+                        self.pulled += 1
+                while nxt is not None:
+                    changed.add(self._apply_clear(nxt))
+                    nxt = next(pending, None)
+                anchor = conn.execute(SQL_LAST_ANCHOR_ID).fetchone()[0]
+                if anchor != self._last_anchor:
+                    self._last_anchor = anchor
+                    changed.add(None)
+            finally:
+                if own:
+                    conn.rollback()
+            self._tls.mark = mark
+            self.syncs += 1
+            self._last_sync = time.monotonic()
+        if changed and self.on_change is not None:
+            try:
+                self.on_change(changed)
+            except Exception as e:
+                logger.info("shared-receipts: on_change failed: %s", e)
+        return changed
+
+    def _apply_clear(self, row) -> Optional[str]:
+        cid, cert_id, _ = row
+        self.store.clear(cert_id or None)
+        self._last_clear = cid
+        return cert_id or None
+
+    # ---------- 写 ----------
+    def append(self, cert_id: str, item: dict) -> None:
+        """落库（等提交）后立刻追尾一次，本进程读自己写的回执不会落空"""
+        self.pool.conn(create=True)
+        self.submit(cert_id, item)
+        self.sync(force=True)
+
+    def clear(self, cert_id: Optional[str] = None) -> int:
+        self.sync(force=True)
+        before = self.store.count_cert(cert_id) if cert_id else len(self.store)
+        with self.pool.transaction(create=True) as conn:
+            conn.execute(SQL_INSERT_CLEAR, (cert_id or None, datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")))
+        self.sync(force=True)
+        return before
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, "last_id": self._last_id, "rows": len(self.store),
+                "syncs": self.syncs, "pulled": self.pulled, "sync_ms": self.sync_ms}
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+data/verify_upgrade.db 的统一连接管理：每个线程一条长连接，进程内复用。
+
+- 打开时设置 WAL + synchronous=NORMAL + busy_timeout，并开启语句缓存（cached_statements）；
+- 文件不存在时默认返回 None（与原先“没有 db 就跳过”的行为一致），需要时 create=True；
+- 所有原先各自 sqlite3.connect() 的调用点都改走这里，不再每个请求开关连接。
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+DEFAULT_DB_PATH = os.getenv("DB_PATH", os.path.join("data", "verify_upgrade.db"))
+
+
+class SQLitePool:
+    """按线程缓存 sqlite3 连接；close_all() 用于进程退出 / 测试清理。"""
+
+    def __init__(self, path, cached_statements: int = 256, timeout: float = 5.0):
+        self.path = Path(path)
+        self.cached_statements = cached_statements
+        self.timeout = timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._all = set()
+        self._busy = {}       # conn -> 进行中的 transaction() 层数
+        self._retired = set()  # close_all() 时还在事务里的连接，事务结束由所属线程关掉
+        # 新连接打开后依次调用 fn(conn)，用于一次性的建表 / 预热
+        self.on_connect = []
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            str(self.path),
+            timeout=self.timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,  # 只在本线程使用；close_all() 可能从别的线程调用
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.timeout * 1000)}")
+        for fn in self.on_connect:
+            fn(conn)
+        with self._lock:
+            self._all.add(conn)
+        return conn
+
+    def conn(self, create: bool = False) -> Optional[sqlite3.Connection]:
+        """当前线程的连接；db 文件不存在且 create=False 时返回 None"""
+        c = getattr(self._local, "conn", None)
+        if c is not None:
+            if self.exists():
+                return c
+            # 文件被删掉了（比如测试清理），旧连接作废
+            self._discard(c)
+        if not create and not self.exists():
+            return None
+        c = self._open()
+        self._local.conn = c
+        return c
+
+    @contextmanager
+    def transaction(self, create: bool = False) -> Iterator[Optional[sqlite3.Connection]]:
+        """成功则 commit，异常则 rollback；没有 db 时 yield None"""
+        c = self.conn(create=create)
+        if c is None:
+            yield None
+            return
+        with self._lock:
+            self._busy[c] = self._busy.get(c, 0) + 1
+        try:
+            yield c
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+        finally:
+            self._release(c)
+
+    def _release(self, c: sqlite3.Connection) -> None:
+        with self._lock:
+            n = self._busy.pop(c) - 1
+            if n:
+                self._busy[c] = n
+                return
+            if c not in self._retired:
+                return
+            self._retired.discard(c)
+        c.close()
+
+    @contextmanager
+    def reader(self) -> Iterator[Optional[sqlite3.Connection]]:
+        """
+        独立的只读连接（不进线程缓存），给流式导出这类跨多次 next() 的长游标用；
+        StreamingResponse 的生成器可能在不同线程上推进，不能占用线程级共享连接。
+        """
+        if not self.exists():
+            yield None
+            return
+        c = sqlite3.connect(str(self.path), timeout=self.timeout, check_same_thread=False)
+        try:
+            c.execute("PRAGMA query_only=1")
+            yield c
+        finally:
+            c.close()
+
+    def _discard(self, c: sqlite3.Connection) -> None:
+        self._local.conn = None
+        with self._lock:
+            self._all.discard(c)
+        try:
+            c.close()
+        except Exception:
+            pass
+
+    def close_all(self) -> None:
+        """
+        关掉所有线程的连接；别的线程正在事务里的连接不能从这里关（关掉正在 executemany 的连接会崩进程），
+        记下来等它的事务结束再关。之后各线程再取连接都会重新打开。
+        """
+        with self._lock:
+            conns = [c for c in self._all if c not in self._busy]
+            self._retired.update(c for c in self._all if c in self._busy)
+            self._all = set()
+        for c in conns:
+            try:
+                c.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+
+# 进程级单例：main.py 及各模块共用
+pool = SQLitePool(DEFAULT_DB_PATH)
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+"""
+TSA 提交服务：基于 httpx.AsyncClient，进程内共用连接池。
+
+- 每个 endpoint 一个并发上限（信号量），避免把 TSA 打爆 / 被限流；
+- 网络错误、429、5xx 按指数退避（带抖动）重试，4xx 直接失败；
+- 每个 endpoint 一个熔断器：连续失败达到阈值后打开，冷却期内直接拒绝，之后放一个探测请求；
+- ping() 并发探测所有候选地址，第一个成功即返回，其余取消；
+- 多个 TSA（TSA_ENDPOINTS）时按滚动窗口的 p50 / 错误率挑最快的发，
+  超过它的 p95 还没回来就对冲一个请求到下一个 endpoint（submit_hedged）。
+
+AsyncClient / Semaphore 都绑定事件循环，所以按当前 loop 各建一份
+（生产环境只有一个 loop；TestClient 每次请求可能换 loop）。
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import httpx
+
+TSQ_CONTENT_TYPE = "application/timestamp-query"
+TSR_CONTENT_TYPE = "application/timestamp-reply"
+DEFAULT_ENDPOINT = "http://127.0.0.1:8011/api/tsa/mock"
+
+
+class TSAError(Exception):
+    def __init__(self, message: str, endpoint: str = "", status: Optional[int] = None):
+        super().__init__(message)
+        self.endpoint = endpoint
+        self.status = status
+
+
+class CircuitOpenError(TSAError):
+    """熔断器打开：冷却期内不再向该 endpoint 发请求"""
+
+
+class CircuitBreaker:
+    """closed → 连续 threshold 次失败 → open → reset_after 秒后 half_open（放行一个探测）"""
+
+    def __init__(self, threshold: int = 5, reset_after: float = 30.0):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            st = self.state
+            if st == "closed":
+                return True
+            if st == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self) -> None:
+        """放行的请求没有结果（被取消 / 非网络异常）：不计成败，只让出探测名额"""
+        with self._lock:
+            self._probing = False
+
+
+class EndpointStats:
+    """最近 window 次请求的耗时 / 成败；被取消的请求（对冲输家）没有结果，不计入"""
+
+    def __init__(self, window: int = 256):
+        self._samples: "deque[Tuple[float, bool]]" = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float, ok: bool) -> None:
+        with self._lock:
+            self._samples.append((latency, ok))
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            lat = sorted(t for t, ok in self._samples if ok)
+        if not lat:
+            return None
+        return lat[min(len(lat) - 1, int(q * len(lat)))]
+
+    @property
+    def error_rate(self) -> float:
+        with self._lock:
+            n = len(self._samples)
+            return sum(1 for _, ok in self._samples if not ok) / n if n else 0.0
+
+    def score(self) -> float:
+        """越小越好：p50 按错误率加罚；没有样本时记 0，让新 endpoint 先被试到"""
+        p50 = self.percentile(0.50)
+        return 0.0 if p50 is None else p50 * (1.0 + 4.0 * self.error_rate)
+
+    def snapshot(self) -> Dict:
+        ms = lambda v: None if v is None else round(v * 1000, 1)   # noqa: E731
+        return {"samples": len(self), "p50_ms": ms(self.percentile(0.50)), "p95_ms": ms(self.percentile(0.95)),
+                "p99_ms": ms(self.percentile(0.99)), "error_rate": round(self.error_rate, 4)}
+
+
+class _LoopState:
+    __slots__ = ("client", "sems")
+
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.sems: Dict[str, asyncio.Semaphore] = {}
+
+
+class TSAClient:
+    def __init__(self, endpoint: str = DEFAULT_ENDPOINT, api_key: Optional[str] = None,
+                 max_connections: int = 32, per_endpoint: int = 8, timeout: float = 10.0,
+                 retries: int = 3, backoff: float = 0.2, backoff_max: float = 5.0,
+                 breaker_threshold: int = 5, breaker_reset: float = 30.0,
+                 transport: Optional[httpx.AsyncBaseTransport] = None,
+                 endpoints: Optional[Sequence[str]] = None, hedge_after: float = 0.5,
+                 hedge_min_samples: int = 20):
+        self.endpoint = endpoint
+        # 多 TSA 冗余：没配列表时就只有 endpoint 一个
+        self.endpoints: List[str] = list(dict.fromkeys(endpoints or [endpoint]))
+        self.hedge_after = hedge_after
+        self.hedge_min_samples = hedge_min_samples
+        self._stats: Dict[str, EndpointStats] = {}
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.per_endpoint = per_endpoint
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.transport = transport
+        self._states: Dict[asyncio.AbstractEventLoop, _LoopState] = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "TSAClient":
+        endpoint = os.getenv("TSA_ENDPOINT", DEFAULT_ENDPOINT)
+        return cls(
+            endpoint=endpoint,
+            endpoints=[e.strip() for e in os.getenv("TSA_ENDPOINTS", "").split(",") if e.strip()] or [endpoint],
+            hedge_after=float(os.getenv("TSA_HEDGE_MS", "500")) / 1000,
+            api_key=os.getenv("TSA_API_KEY") or None,
+            max_connections=int(os.getenv("TSA_MAX_CONNECTIONS", "32")),
+            per_endpoint=int(os.getenv("TSA_CONCURRENCY", "8")),
+            timeout=float(os.getenv("TSA_TIMEOUT", "10")),
+            retries=int(os.getenv("TSA_RETRIES", "3")),
+        )
+
+    # ---- 每个事件循环一份连接池 / 信号量 ----
+    def _state(self) -> _LoopState:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            st = self._states.get(loop)
+            if st is None:
+                # 顺手清掉已经关闭的 loop 留下的状态
+                for old in [lp for lp in self._states if lp.is_closed()]:
+                    del self._states[old]
+                limits = httpx.Limits(max_connections=self.max_connections,
+                                      max_keepalive_connections=self.max_connections)
+                st = self._states[loop] = _LoopState(httpx.AsyncClient(
+                    timeout=self.timeout, limits=limits, transport=self.transport))
+            return st
+
+    def _sem(self, st: _LoopState, endpoint: str) -> asyncio.Semaphore:
+        sem = st.sems.get(endpoint)
+        if sem is None:
+            sem = st.sems[endpoint] = asyncio.Semaphore(self.per_endpoint)
+        return sem
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            b = self._breakers.get(endpoint)
+            if b is None:
+                b = self._breakers[endpoint] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+            return b
+
+    def stats(self, endpoint: str) -> EndpointStats:
+        with self._lock:
+            st = self._stats.get(endpoint)
+            if st is None:
+                st = self._stats[endpoint] = EndpointStats()
+            return st
+
+    def ranked(self, endpoints: Optional[Sequence[str]] = None) -> List[str]:
+        """熔断打开的排到最后，其余按 score（p50 × 错误率加罚）从快到慢"""
+        eps = list(dict.fromkeys(endpoints or self.endpoints))
+        return sorted(eps, key=lambda e: (self.breaker(e).state == "open", self.stats(e).score()))
+
+    def hedge_delay(self, endpoint: str) -> float:
+        """该 endpoint 的 p95；样本不够时用固定的 hedge_after"""
+        st = self.stats(endpoint)
+        p95 = st.percentile(0.95) if len(st) >= self.hedge_min_samples else None
+        return max(0.01, p95 if p95 is not None else self.hedge_after)
+
+    def report(self) -> List[Dict]:
+        return [{"endpoint": e, "breaker": self.breaker(e).state, **self.stats(e).snapshot()}
+                for e in self.ranked()]
+
+    def _delay(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff * (2 ** attempt)) * random.uniform(0.5, 1.0)
+
+    # ---- 提交 ----
+    async def submit(self, tsq: bytes, endpoint: Optional[str] = None,
+                     retries: Optional[int] = None) -> bytes:
+        """POST TSQ，返回 TSR 原文；重试用尽 / 熔断时抛 TSAError"""
+        url = endpoint or self.endpoint
+        breaker = self.breaker(url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"circuit open for {url}", url)
+        st = self._state()
+        stats = self.stats(url)
+        headers = {"Content-Type": TSQ_CONTENT_TYPE, "Accept": TSR_CONTENT_TYPE}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        last: Optional[TSAError] = None
+        settled = False
+        try:
+            for attempt in range((self.retries if retries is None else retries) + 1):
+                if attempt:
+                    await asyncio.sleep(self._delay(attempt - 1))
+                async with self._sem(st, url):
+                    t0 = time.perf_counter()
+                    try:
+                        r = await st.client.post(url, content=tsq, headers=headers)
+                    except httpx.HTTPError as e:
+                        stats.record(time.perf_counter() - t0, False)
+                        last = TSAError(f"{type(e).__name__}: {e}", url)
+                        continue
+                    stats.record(time.perf_counter() - t0, r.status_code == 200)
+                if r.status_code == 200:
+                    breaker.record_success()
+                    settled = True
+                    return r.content
+                last = TSAError(f"HTTP {r.status_code}", url, r.status_code)
+                if r.status_code != 429 and r.status_code < 500:
+                    break   # 请求本身有问题，重试没用
+            breaker.record_failure()
+            settled = True
+            raise last
+        finally:
+            if not settled:
+                breaker.release()   # 被对冲取消 / 退避时被取消 / 其它异常：半开的探测名额不能一直占着
+
+    async def submit_hedged(self, tsq: bytes, endpoints: Optional[Sequence[str]] = None,
+                            want: int = 1) -> List[Tuple[str, bytes]]:
+        """
+        多 TSA 提交：先发给最快的 endpoint；超过它的 p95 还没回来，就对冲一个请求到下一个；
+        失败立即换下一个。拿到 want 个回执后取消其余请求。
+        同一轮里同时回来的回执都会返回（每个都是独立的时间戳）。
+        """
+        queue = self.ranked(endpoints)
+        if not queue:
+            raise TSAError("no TSA endpoint configured")
+        retries = self.retries if len(queue) == 1 else 0   # 多个 endpoint 时用对冲代替重试
+        running: Dict[asyncio.Future, str] = {}
+        results: List[Tuple[str, bytes]] = []
+        errors: List[str] = []
+
+        def launch() -> str:
+            ep = queue.pop(0)
+            running[asyncio.ensure_future(self.submit(tsq, ep, retries=retries))] = ep
+            return ep
+
+        newest = None
+        while queue and len(running) < want:
+            newest = launch()
+        try:
+            while running:
+                timeout = self.hedge_delay(newest) if queue else None
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:                # 慢于 p95：对冲
+                    newest = launch()
+                    continue
+                for t in done:
+                    ep = running.pop(t)
+                    try:
+                        results.append((ep, t.result()))
+                    except TSAError as e:
+                        errors.append(f"{ep}: {e}")
+                if len(results) >= want:
+                    break
+                while queue and len(running) < want - len(results):
+                    newest = launch()
+        finally:
+            for t in running:
+                t.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+        if not results:
+            raise TSAError("all TSA endpoints failed: " + "; ".join(errors))
+        return results
+
+    # ---- 健康探测 ----
+    async def _probe(self, url: str, timeout: float) -> Optional[int]:
+        try:
+            r = await self._state().client.get(url, timeout=timeout)
+        except httpx.HTTPError:
+            return None
+        return r.status_code if r.status_code in (200, 204) else None
+
+    async def ping(self, candidates: Iterable[str], timeout: float = 2.0) -> Optional[Dict]:
+        """并发探测，返回第一个成功的 {"url", "status"}；全部失败返回 None"""
+        tasks = {asyncio.ensure_future(self._probe(u, timeout)): u for u in dict.fromkeys(candidates)}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for t in done:
+                    status = t.result()
+                    if status is not None:
+                        return {"url": tasks[t], "status": status}
+            return None
+        finally:
+            for t in pending:
+                t.cancel()
+
+    async def aclose(self) -> None:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            st = self._states.pop(loop, None)
+        if st is not None:
+            await st.client.aclose()
+
+
+# 进程级单例；TSA_ENDPOINT 等环境变量在导入时读取
+client = TSAClient.from_env()
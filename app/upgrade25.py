@@ -1,3 +1,315 @@
-﻿"""TEMP STUB: disabled to pass CI (see upgrade25.py.bak for original)."""
-# This module is intentionally minimal for CI.
-__all__ = []
+﻿# -*- coding: utf-8 -*-
+"""
+Day 2.5 升级接口（README 第 4 节），挂在 /v1/upgrade25 下：
+
+- POST /c2pa/embed  → 登记 C2PA 写签任务（c2patool 在后台进程池执行），立即返回 job_id；
+- GET  /c2pa/jobs/{job_id} → 任务状态 / 输出摘要 / 错误；
+- POST /tsa/query   → 进程内生成 RFC3161 TSQ（Base64），不再调用 openssl；
+- POST /tsa/submit  → 回填 TSR（Base64）：解析 genTime / serial / policy / imprint，核对摘要后落库；
+- POST /tsa/verify  → 批量核验已存的 TSR（与 evidence.sha256 比对），几千条在秒级完成；
+- POST /tsa/stamp   → 求摘要 + 生成 TSQ + 异步提交 TSA（多个 TSA 时对冲）+ 核对落库，一步完成；
+- GET  /tsa/token/{cert_id} → 最近一张回执的解析结果。
+
+TSR 原文存 data/verify_upgrade.db 的 tsa_tokens 表，随时可以离线再跑 `openssl ts -verify`。
+读写库的接口都是 async 的，查询 / 落库在 app/db_executor.py 的 DB 线程上执行。
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import time
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app import c2pa_jobs, rfc3161, schema, tsa_client
+from app.db_executor import executor as db_executor
+from app.hashing import hasher
+from app.sqlite_pool import pool as sqlite_pool
+
+router = APIRouter()
+
+# 新回执落库后依次调用 fn(cert_id, info)；main.py 用它写回执历史、让 verify 页缓存失效
+on_token: list = []
+
+SQL_CREATE_TSA_TOKENS = """
+    CREATE TABLE IF NOT EXISTS tsa_tokens (
+        id         INTEGER PRIMARY KEY AUTOINCREMENT,
+        cert_id    TEXT NOT NULL,
+        tsr        BLOB NOT NULL,
+        hash_algo  TEXT,
+        imprint    TEXT,
+        serial     TEXT,
+        gen_time   TEXT,
+        policy     TEXT,
+        nonce      TEXT,
+        tsa        TEXT,
+        created_at TEXT
+    )
+"""
+SQL_CREATE_TSA_TOKENS_CERT = "CREATE INDEX IF NOT EXISTS idx_tsa_tokens_cert ON tsa_tokens (cert_id, id)"
+SQL_INSERT_TSA_TOKEN = """
+    INSERT INTO tsa_tokens (cert_id, tsr, hash_algo, imprint, serial, gen_time, policy, nonce, tsa, created_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+SQL_SELECT_TSA_LATEST = "SELECT tsr FROM tsa_tokens WHERE cert_id = ? ORDER BY id DESC LIMIT 1"
+# 批量核验：TSR 原文 + 本地登记的摘要 / 文件路径
+SQL_VERIFY_TOKENS_ALL = """
+    SELECT t.id, t.cert_id, t.tsr, t.hash_algo, e.sha256, e.file_path
+    FROM tsa_tokens t LEFT JOIN evidence e ON e.cert_id = t.cert_id
+    ORDER BY t.id
+"""
+SQL_VERIFY_TOKENS_CERT = """
+    SELECT t.id, t.cert_id, t.tsr, t.hash_algo, e.sha256, e.file_path
+    FROM tsa_tokens t LEFT JOIN evidence e ON e.cert_id = t.cert_id
+    WHERE t.cert_id = ?
+    ORDER BY t.id
+"""
+SQL_SELECT_EVIDENCE_DIGEST = "SELECT sha256, file_path FROM evidence WHERE cert_id = ?"
+
+VERIFY_FETCH = 500
+MAX_FAILURES = 100
+
+
+schema.attach(sqlite_pool)      # tsa_tokens 由 app/schema.py 的迁移建
+
+
+def _b64(data: str) -> bytes:
+    try:
+        return base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise ValueError(f"invalid base64: {e}")
+
+
+def _expected_digest(hash_algo: str, sha256: Optional[str], file_path: Optional[str]) -> Optional[str]:
+    """回执用的算法与本地登记的 sha256 不同时，按 file_path 现算（走文件摘要缓存）"""
+    if hash_algo == "sha256" and sha256:
+        return sha256
+    if file_path:
+        try:
+            return hasher.digest(file_path, (hash_algo,))[hash_algo]
+        except (OSError, ValueError):
+            return None
+    return None
+
+
+class C2PAEmbed(BaseModel):
+    file_path: str
+    signer_cert_path: str
+    signer_key_path: str
+    claim_json_path: Optional[str] = None
+    out_path: Optional[str] = None        # 默认 <文件名>-signed.<扩展名>
+    cert_id: Optional[str] = None         # 给了就把结果记进该 cert 的回执
+
+
+@router.post("/c2pa/embed")
+@db_executor.offload
+def c2pa_embed(req: C2PAEmbed):
+    """只登记任务；相同 (输入 sha256, claim, 签名证书) 已完成或在跑时返回原任务，不重复执行"""
+    try:
+        job = c2pa_jobs.jobs.submit(req.file_path, req.signer_cert_path, req.signer_key_path,
+                                    claim_path=req.claim_json_path, out_path=req.out_path, cert_id=req.cert_id)
+    except OSError as e:
+        return JSONResponse({"ok": False, "error": f"{type(e).__name__}: {e.strerror or e}",
+                             "path": getattr(e, "filename", None)}, status_code=404)
+    return JSONResponse({"ok": True, **job}, status_code=200 if job["status"] == "done" else 202)
+
+
+@router.get("/c2pa/jobs/{job_id}")
+@db_executor.offload
+def c2pa_job(job_id: int):
+    job = c2pa_jobs.jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"ok": False, "error": "no such job"}, status_code=404)
+    return {"ok": True, "job": job}
+
+
+class TSQRequest(BaseModel):
+    file_path: Optional[str] = None
+    digest: Optional[str] = None          # 已知摘要（hex）时可以不给 file_path
+    hash_algo: str = "sha256"
+    cert_req: bool = True
+    nonce: Optional[int] = None
+
+
+class TSRSubmit(BaseModel):
+    cert_id: str
+    tsr_b64: str
+    tsq_b64: Optional[str] = None         # 给了就按请求里的摘要 / nonce 核对
+    file_path: Optional[str] = None
+
+
+class TSRVerify(BaseModel):
+    cert_ids: List[str] = []              # 为空表示全部
+
+
+@router.post("/tsa/query")
+async def tsa_query(req: TSQRequest):
+    algo = req.hash_algo.lower()
+    try:
+        if req.digest:
+            digest = bytes.fromhex(req.digest)
+        elif req.file_path:
+            digests = await asyncio.get_running_loop().run_in_executor(
+                None, hasher.digest, req.file_path, (algo,))
+            digest = bytes.fromhex(digests[algo])
+        else:
+            return JSONResponse({"ok": False, "error": "file_path or digest required"}, status_code=400)
+        tsq = rfc3161.build_tsq(digest, algo, nonce=req.nonce, cert_req=req.cert_req)
+    except OSError as e:
+        return JSONResponse({"ok": False, "error": f"{type(e).__name__}: {e.strerror or e}"}, status_code=404)
+    except ValueError as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    info = rfc3161.parse_tsq(tsq)
+    return {"ok": True, "tsq_b64": base64.b64encode(tsq).decode("ascii"),
+            "hash_algo": algo, "digest": digest.hex(), "nonce": info["nonce"]}
+
+
+@router.post("/tsa/submit")
+@db_executor.offload
+def tsa_submit(req: TSRSubmit):
+    try:
+        tsr = _b64(req.tsr_b64)
+        tok = rfc3161.parse_tsr(tsr)
+        tsq = rfc3161.parse_tsq(_b64(req.tsq_b64)) if req.tsq_b64 else None
+    except ValueError as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+    info = tok.as_dict()
+    if not tok.granted:
+        return JSONResponse({"ok": False, "error": f"TSA status {info['status']}", "token": info}, status_code=422)
+
+    algo, nonce = None, None
+    if tsq is not None:
+        expected, algo, nonce = tsq["digest"].hex(), tsq["hash_algo"], tsq["nonce"]
+    else:
+        conn = sqlite_pool.conn()
+        row = conn.execute(SQL_SELECT_EVIDENCE_DIGEST, (req.cert_id,)).fetchone() if conn else None
+        expected = _expected_digest(tok.hash_algo, row[0] if row else None,
+                                    req.file_path or (row[1] if row else None))
+    check = rfc3161.verify_tsr(tsr, expected, hash_algo=algo, nonce=nonce) if expected else \
+        {"ok": None, "reason": "no local digest to compare"}
+    if check["ok"] is False:
+        return JSONResponse({"ok": False, "error": check["reason"], "token": info}, status_code=422)
+
+    _store_token(req.cert_id, tsr, tok)
+    return {"ok": True, "cert_id": req.cert_id, "verified": check["ok"], "token": info}
+
+
+def _store_token(cert_id: str, tsr: bytes, tok: rfc3161.TimeStampToken) -> dict:
+    return _store_tokens([(cert_id, tsr, tok)])[0]
+
+
+def _store_tokens(items) -> List[dict]:
+    """[(cert_id, tsr, token)] 一个事务写入，之后逐条调用 on_token"""
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    infos = [tok.as_dict() for _, _, tok in items]
+    with sqlite_pool.transaction(create=True) as conn:
+        conn.executemany(SQL_INSERT_TSA_TOKEN, [
+            (cert_id, tsr, tok.hash_algo, info["imprint"], info["serial"], info["gen_time"],
+             info["policy"], None if tok.nonce is None else str(tok.nonce), info["tsa"], now)
+            for (cert_id, tsr, tok), info in zip(items, infos)])
+    for (cert_id, _, _), info in zip(items, infos):
+        for fn in on_token:
+            fn(cert_id, info)
+    return infos
+
+
+class TSAStamp(BaseModel):
+    cert_id: str
+    file_path: Optional[str] = None
+    digest: Optional[str] = None
+    hash_algo: str = "sha256"
+    endpoint: Optional[str] = None        # 指定单个 TSA（必须在 TSA_ENDPOINTS 里）；默认挑最快的并对冲
+    redundancy: int = 1                   # 想要几张不同 TSA 的回执
+
+
+@router.post("/tsa/stamp")
+async def tsa_stamp(req: TSAStamp):
+    """
+    一步完成：求摘要 → TSQ → 异步提交 TSA（连接池 / 并发上限 / 重试 / 熔断 / 对冲）→ 核对 → 落库。
+    文件摘要在线程池里算，不阻塞事件循环。每张核对通过的回执单独落库（各记一条 tsa 回执）。
+    """
+    algo = req.hash_algo.lower()
+    try:
+        if req.digest:
+            digest = bytes.fromhex(req.digest)
+        elif req.file_path:
+            digests = await asyncio.get_running_loop().run_in_executor(
+                None, hasher.digest, req.file_path, (algo,))
+            digest = bytes.fromhex(digests[algo])
+        else:
+            return JSONResponse({"ok": False, "error": "file_path or digest required"}, status_code=400)
+        tsq = rfc3161.build_tsq(digest, algo)
+    except OSError as e:
+        return JSONResponse({"ok": False, "error": f"{type(e).__name__}: {e.strerror or e}"}, status_code=404)
+    except ValueError as e:
+        return JSONResponse({"ok": False, "error": str(e)}, status_code=400)
+
+    if req.endpoint and req.endpoint not in tsa_client.client.endpoints:
+        # 只发往配置过的 TSA，不能让调用方指使服务端去请求任意地址
+        return JSONResponse({"ok": False, "error": "endpoint not in TSA_ENDPOINTS"}, status_code=400)
+    endpoints = [req.endpoint] if req.endpoint else tsa_client.client.endpoints
+    try:
+        replies = await tsa_client.client.submit_hedged(tsq, endpoints, want=max(1, req.redundancy))
+    except tsa_client.TSAError as e:
+        return JSONResponse({"ok": False, "error": str(e), "endpoint": e.endpoint}, status_code=502)
+
+    req_info = rfc3161.parse_tsq(tsq)
+    tokens, rejected = [], []
+    for endpoint, tsr in replies:
+        check = rfc3161.verify_tsr(tsr, digest, hash_algo=algo, nonce=req_info["nonce"])
+        if check["ok"]:
+            info = await db_executor.run(_store_token, req.cert_id, tsr, rfc3161.parse_tsr(tsr))
+            tokens.append({"endpoint": endpoint, **info})
+        else:
+            rejected.append({"endpoint": endpoint, "error": check["reason"]})
+    if not tokens:
+        return JSONResponse({"ok": False, "error": rejected[0]["error"], "endpoint": rejected[0]["endpoint"],
+                             "rejected": rejected}, status_code=502)
+    return {"ok": True, "cert_id": req.cert_id, "endpoint": tokens[0]["endpoint"],
+            "token": tokens[0], "tokens": tokens, "rejected": rejected}
+
+
+@router.get("/tsa/token/{cert_id}")
+@db_executor.offload
+def tsa_token(cert_id: str):
+    conn = sqlite_pool.conn()
+    row = conn.execute(SQL_SELECT_TSA_LATEST, (cert_id,)).fetchone() if conn else None
+    if row is None:
+        return JSONResponse({"ok": False, "error": "no token"}, status_code=404)
+    return {"ok": True, "cert_id": cert_id, "token": rfc3161.parse_tsr(row[0]).as_dict()}
+
+
+def _verify_rows(conn, cert_ids: List[str]):
+    plans = [(SQL_VERIFY_TOKENS_CERT, (c,)) for c in cert_ids] or [(SQL_VERIFY_TOKENS_ALL, ())]
+    for sql, args in plans:
+        cur = conn.execute(sql, args)
+        while True:
+            rows = cur.fetchmany(VERIFY_FETCH)
+            if not rows:
+                break
+            for tid, cert_id, tsr, algo, sha256, file_path in rows:
+                yield (tid, cert_id), bytes(tsr), _expected_digest(algo or "sha256", sha256, file_path)
+
+
+@router.post("/tsa/verify")
+@db_executor.offload
+def tsa_verify(req: TSRVerify):
+    """逐条核对 imprint；返回汇总和（最多 100 条）失败明细"""
+    t0 = time.perf_counter()
+    total = ok = 0
+    failures = []
+    with sqlite_pool.reader() as conn:
+        if conn is not None:
+            for (tid, cert_id), res in rfc3161.verify_many(_verify_rows(conn, req.cert_ids)):
+                total += 1
+                if res["ok"]:
+                    ok += 1
+                elif len(failures) < MAX_FAILURES:
+                    failures.append({"id": tid, "cert_id": cert_id, "reason": res["reason"]})
+    return {"ok": True, "total": total, "verified": ok, "failed": total - ok,
+            "failures": failures, "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}
@@ -1,10 +1,9 @@
 ﻿import os, sqlite3
+from app import schema
 os.makedirs("data", exist_ok=True)
 db="data/verify_upgrade.db"
 conn=sqlite3.connect(db)
-conn.execute("""CREATE TABLE IF NOT EXISTS receipts(
-  id INTEGER PRIMARY KEY AUTOINCREMENT,
-  cert_id TEXT, provider TEXT, status TEXT, txid TEXT, created_at TEXT
-)""")
-conn.commit(); conn.close()
-print("ok:", db)
+# 表 / 索引（含 receipts(cert_id, …) 覆盖索引）都由 app/schema.py 的迁移建，和服务启动时一致
+schema.migrate(conn)
+conn.close()
+print("ok:", db, "schema", schema.status(sqlite3.connect(db))["version"])
@@ -0,0 +1,75 @@
+# scripts/bench_bulk.py
+# -*- coding: utf-8 -*-
+"""
+批量登记基准：在临时目录生成 N 个文件和 NDJSON 清单，走 POST /api/certify/bulk（进程内 TestClient），
+报告 certs/s；--baseline 再用逐个请求（/api/evidence/hash + /api/chain/mock）跑同样的量作对比。
+用法：
+  python scripts/bench_bulk.py --certs 50000
+  python scripts/bench_bulk.py --certs 5000 --baseline
+  python scripts/bench_bulk.py --certs 5000 --tsa            # 同时申请时间戳（本地 mock TSA）
+"""
+import argparse, json, logging, os, sys, tempfile, time
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--certs", type=int, default=50_000)
+    ap.add_argument("--size", type=int, default=4096, help="每个文件的字节数")
+    ap.add_argument("--chunk", type=int, default=2000)
+    ap.add_argument("--tsa", action="store_true")
+    ap.add_argument("--baseline", action="store_true")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DB_PATH"] = os.path.join(tmp, "bench.db")
+        import httpx
+        from fastapi.testclient import TestClient
+        import app.main as main
+        from app import tsa_client
+
+        logging.getLogger("httpx").setLevel(logging.WARNING)   # 每个请求一行 INFO，刷屏
+        client = TestClient(main.app)
+        if args.tsa:
+            tsa_client.client = tsa_client.TSAClient("http://testserver/api/tsa/mock",
+                                                     transport=httpx.ASGITransport(app=main.app))
+        files = Path(tmp, "files")
+        files.mkdir()
+        t0 = time.perf_counter()
+        lines = []
+        for i in range(args.certs):
+            p = files / f"asset-{i:07d}.bin"
+            p.write_bytes(i.to_bytes(8, "big") * (args.size // 8))
+            lines.append(json.dumps({"cert_id": f"bulk-{i:07d}", "file_path": str(p),
+                                     "case_id": f"CASE-{i % 100}", "title": f"asset {i}"}))
+        manifest = "\n".join(lines).encode()
+        print(f"certs={args.certs} size={args.size}B chunk={args.chunk} tsa={args.tsa}")
+        print(f"seed:     {time.perf_counter() - t0:.1f}s  manifest {len(manifest) / 1e6:.1f} MB")
+
+        t1 = time.perf_counter()
+        r = client.post("/api/certify/bulk", params={"chunk": args.chunk, "tsa": args.tsa}, content=manifest)
+        elapsed = time.perf_counter() - t1
+        final = json.loads(r.text.splitlines()[-1])
+        print(f"bulk:     {elapsed:.2f}s  {final['done'] / elapsed:,.0f} certs/s  "
+              f"done={final['done']} failed={final['failed']} stamped={final['stamped']} chunks={final['chunks']}")
+
+        if args.baseline:
+            main.sqlite_pool.close_all()
+            os.remove(main.sqlite_pool.path)
+            main.file_hasher.cache.clear()
+            t2 = time.perf_counter()
+            for i in range(args.certs):
+                cert = f"one-{i:07d}"
+                client.post("/api/evidence/hash", json={"cert_id": cert,
+                                                        "file_path": str(files / f"asset-{i:07d}.bin")})
+                client.get("/api/chain/mock", params={"cert_id": cert})
+            main.receipt_writer.flush()
+            base = time.perf_counter() - t2
+            print(f"per-cert: {base:.2f}s  {args.certs / base:,.0f} certs/s  (bulk is {base / elapsed:.1f}x faster)")
+        main.sqlite_pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
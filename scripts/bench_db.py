@@ -0,0 +1,79 @@
+# scripts/bench_db.py
+# -*- coding: utf-8 -*-
+"""
+app/db.py 仓储层基准：同样写 N 条回执，对比旧路径（ensure_cert 先 SELECT，每条回执各自 commit + refresh）
+与新路径（ON CONFLICT DO NOTHING + INSERT ... RETURNING，按批一次 commit）。
+用法：
+  python scripts/bench_db.py --receipts 100000
+  python scripts/bench_db.py --receipts 100000 --batch 5000 --certs 1000
+说明：旧路径每条回执两次 fsync，100k 条在普通磁盘上要几分钟；--old-limit 可只跑前 N 条再按比例外推。
+"""
+import argparse, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, select   # noqa: E402
+from sqlalchemy.orm import Session                  # noqa: E402
+
+from app.db import Base, CertRecord, Receipt, add_receipts   # noqa: E402
+
+
+def old_add_receipt(db, cert_id, provider, status, txid=None):
+    """改造前的 ensure_cert + add_receipt（保留在这里只为对比）"""
+    inst = db.query(CertRecord).filter(CertRecord.cert_id == cert_id).first()
+    if inst is None:
+        inst = CertRecord(cert_id=cert_id)
+        db.add(inst); db.commit(); db.refresh(inst)
+    r = Receipt(cert_id=cert_id, provider=provider, status=status, txid=txid)
+    db.add(r); db.commit(); db.refresh(r)
+    return r
+
+
+def engine_at(path):
+    eng = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(eng)
+    return eng
+
+
+def rows(n, certs):
+    return [(f"cert-{i % certs:06d}", "tsa" if i % 2 else "chain", "ok", f"0xTX_{i:010d}") for i in range(n)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--receipts", type=int, default=100_000)
+    ap.add_argument("--certs", type=int, default=1_000)
+    ap.add_argument("--batch", type=int, default=5_000)
+    ap.add_argument("--old-limit", type=int, default=0, help="旧路径只跑前 N 条（0 表示全部）")
+    args = ap.parse_args()
+    data = rows(args.receipts, args.certs)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        eng = engine_at(os.path.join(tmp, "old.db"))
+        old_n = args.old_limit or len(data)
+        t0 = time.perf_counter()
+        with Session(eng) as db:
+            for r in data[:old_n]:
+                old_add_receipt(db, *r)
+        old = time.perf_counter() - t0
+        eng.dispose()
+
+        eng = engine_at(os.path.join(tmp, "new.db"))
+        t0 = time.perf_counter()
+        with Session(eng) as db:
+            for i in range(0, len(data), args.batch):
+                add_receipts(db, data[i:i + args.batch])
+            written = db.execute(select(func.count()).select_from(Receipt)).scalar()
+        new = time.perf_counter() - t0
+        eng.dispose()
+
+    old_rate = old_n / old
+    print(f"receipts={args.receipts} certs={args.certs} batch={args.batch}")
+    print(f"old path: {old_n} receipts in {old:.2f}s  {old_rate:,.0f} receipts/s"
+          + (f"  (100% ≈ {len(data) / old_rate:.0f}s)" if old_n < len(data) else ""))
+    print(f"new path: {written} receipts in {new:.2f}s  {written / new:,.0f} receipts/s  "
+          f"({(written / new) / old_rate:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+# scripts/bench_endpoints.py
+# -*- coding: utf-8 -*-
+"""
+端点基准：先灌 N 个 cert × M 条回执（scripts/seed_demo.py 的 seed_many），再对 app/main.py 的端点
+逐个压 --seconds 秒（C 个并发客户端，闭环：一个请求回来才发下一个），每个端点报
+请求数、RPS、p50 / p95 / p99、错误数和到该端点为止的峰值 RSS；--json 存结果，--compare 与旧结果对比。
+
+- 默认进程内跑（httpx.ASGITransport，临时库），延迟含客户端开销，适合跨提交对比，不是绝对值；
+  峰值 RSS 取本进程 resource.getrusage（服务 + 客户端，单调不减），Windows 上为 null；
+- --url 压已经起好的服务（此时不灌数据，先用 seed_demo.py --certs 灌同样的 load-* 数据），
+  --pid 给服务进程号时从 /proc/<pid>/status 的 VmHWM 读峰值 RSS；
+- 读端点在前、写端点在后，/api/receipts/clear 放最后（会清掉随机 cert 的回执）；
+- 不压的：/api/tsa/ping（探测外部 TSA）、/api/merkle/anchor（一天一次的批量上链）、
+  /api/certify/bulk（批量接口另见 scripts/bench_bulk.py）；/v1/upgrade25/* 不在 app/main.py 里。
+- --compare 旧结果：任一端点 RPS 降幅或 p99 涨幅超过 --tolerance（默认 0.2）记为回退，退出码 1。
+用法：
+  python scripts/bench_endpoints.py --json bench/base.json
+  python scripts/bench_endpoints.py --json bench/new.json --compare bench/base.json
+  python scripts/bench_endpoints.py --only verify,vault,tsa_mock --concurrency 200 --seconds 10
+  python scripts/bench_endpoints.py --url http://127.0.0.1:8011 --pid 12345 --json bench/server.json
+"""
+import argparse, asyncio, hashlib, json, logging, os, platform, random, subprocess, sys, tempfile, time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from app import rfc3161  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _cert(rnd, args):
+    return f"load-{rnd.randrange(args.certs):06d}"
+
+
+# 名字 -> (方法, 请求构造)；构造函数返回 (path, 关键字参数)，按这个顺序压
+SCENARIOS = {
+    "verify":            ("GET", lambda rnd, a, env: (f"/verify_upgrade/{_cert(rnd, a)}", {})),
+    "vault":             ("GET", lambda rnd, a, env: (f"/vault?cert_id={_cert(rnd, a)}", {})),
+    "api_vault":         ("GET", lambda rnd, a, env: (f"/api/vault?cert_id={_cert(rnd, a)}", {})),
+    "receipts_count":    ("GET", lambda rnd, a, env: (f"/api/receipts/count?cert_id={_cert(rnd, a)}", {})),
+    "receipts_preview":  ("GET", lambda rnd, a, env: (f"/api/receipts/preview?cert_id={_cert(rnd, a)}", {})),
+    "receipts_export":   ("GET", lambda rnd, a, env: (f"/api/receipts/export?cert_id={_cert(rnd, a)}&source=store", {})),
+    "evidence_export":   ("GET", lambda rnd, a, env: (f"/api/evidence/export?case_id=LOAD-{rnd.randrange(a.certs)}", {})),
+    "search":            ("GET", lambda rnd, a, env: (f"/api/search?q=LOAD-{rnd.randrange(a.certs)}", {})),
+    "health":            ("GET", lambda rnd, a, env: ("/health", {})),
+    "tsa_config":        ("GET", lambda rnd, a, env: ("/api/tsa/config", {})),
+    "tsa_endpoints":     ("GET", lambda rnd, a, env: ("/api/tsa/endpoints", {})),
+    "merkle_root":       ("GET", lambda rnd, a, env: ("/api/merkle/root", {})),
+    "tsa_mock":          ("GET", lambda rnd, a, env: (f"/api/tsa/mock?cert_id={_cert(rnd, a)}", {})),
+    "tsa_mock_rfc3161":  ("POST", lambda rnd, a, env: ("/api/tsa/mock", {"content": env["tsq"]})),
+    "chain_mock":        ("GET", lambda rnd, a, env: (f"/api/chain/mock?cert_id={_cert(rnd, a)}", {})),
+    "evidence_update":   ("POST", lambda rnd, a, env: ("/api/evidence/update", {"json": {
+        "cert_id": _cert(rnd, a), "case_id": f"LOAD-{rnd.randrange(a.certs)}", "title": "压测更新"}})),
+    "evidence_hash":     ("POST", lambda rnd, a, env: ("/api/evidence/hash", {"json": {
+        "cert_id": _cert(rnd, a), "file_path": env["file"]}})),
+    "files_hash":        ("POST", lambda rnd, a, env: ("/api/files/hash", {"json": {"files": [env["file"]]}})),
+    "receipts_clear":    ("POST", lambda rnd, a, env: (f"/api/receipts/clear?cert_id={_cert(rnd, a)}", {})),
+}
+
+
+def pct(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p))] if xs else 0.0
+
+
+def peak_rss_mb(pid=None):
+    """pid 为空取本进程（getrusage，Linux 单位 KB，macOS 单位字节）；否则读 /proc/<pid>/status 的 VmHWM"""
+    if pid:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) / 1024
+        except OSError:
+            pass
+        return None
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != "darwin" else kb / 1024 / 1024
+
+
+async def client(c, name, args, env, deadline, lat, errors, rnd):
+    method, build = SCENARIOS[name]
+    while time.perf_counter() < deadline:
+        path, kw = build(rnd, args, env)
+        t0 = time.perf_counter()
+        try:
+            r = await c.request(method, path, **kw)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        lat.append((time.perf_counter() - t0) * 1e3)
+        if not ok:
+            errors.append(path)
+        await asyncio.sleep(0)   # 同 load_test.py：进程内补上网络往返的那次让出
+
+
+async def bench(c, name, args, env):
+    lat, errors = [], []
+    t0 = time.perf_counter()
+    deadline = t0 + args.seconds
+    await asyncio.gather(*(client(c, name, args, env, deadline, lat, errors, random.Random(f"{name}-{i}"))
+                           for i in range(args.concurrency)))
+    elapsed = time.perf_counter() - t0
+    lat.sort()
+    rss = peak_rss_mb(args.pid)
+    return {"requests": len(lat), "rps": round(len(lat) / elapsed, 1), "p50_ms": round(pct(lat, .5), 3),
+            "p95_ms": round(pct(lat, .95), 3), "p99_ms": round(pct(lat, .99), 3), "errors": len(errors),
+            "peak_rss_mb": None if rss is None else round(rss, 1)}
+
+
+async def run(args, names, env):
+    if args.url:
+        transport, base = None, args.url
+    else:
+        from app.main import app
+        transport, base = httpx.ASGITransport(app=app), "http://bench"
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url=base, limits=limits, timeout=30) as c:
+        for name in names:
+            results[name] = r = await bench(c, name, args, env)
+            print(f"{name:<17} {r['requests']:>9} {r['rps']:>9.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+                  f"{r['p99_ms']:>8.1f} {r['errors']:>7} {r['peak_rss_mb'] if r['peak_rss_mb'] is not None else 'n/a':>9}",
+                  flush=True)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, base, tolerance):
+    """逐端点对比；返回回退的端点列表"""
+    regressions = []
+    print(f"\ncompare with {base['meta'].get('commit')} (tolerance {tolerance:.0%})")
+    print(f"{'endpoint':<17} {'rps':>17} {'p99 ms':>19}")
+    for name, new in results.items():
+        old = base["results"].get(name)
+        if old is None:
+            continue
+        d_rps = new["rps"] / old["rps"] - 1 if old["rps"] else 0.0
+        d_p99 = new["p99_ms"] / old["p99_ms"] - 1 if old["p99_ms"] else 0.0
+        bad = d_rps < -tolerance or d_p99 > tolerance
+        if bad:
+            regressions.append(name)
+        print(f"{name:<17} {old['rps']:>7.0f} → {new['rps']:>7.0f} {old['p99_ms']:>8.1f} → {new['p99_ms']:>8.1f}"
+              f"  {d_rps:+.0%} / {d_p99:+.0%}{'  REGRESSION' if bad else ''}")
+    return regressions
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="", help="压已启动的服务；不给则进程内跑")
+    ap.add_argument("--pid", type=int, default=0, help="--url 时服务进程号（读峰值 RSS）")
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--certs", type=int, default=1000)
+    ap.add_argument("--receipts-per-cert", type=int, default=5)
+    ap.add_argument("--only", default="", help="逗号分隔的端点名，默认全部：" + ",".join(SCENARIOS))
+    ap.add_argument("--json", default="", help="结果写到这个文件")
+    ap.add_argument("--compare", default="", help="与这个 JSON 结果对比，有回退时退出码 1")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="RPS 降幅 / p99 涨幅的容忍比例")
+    args = ap.parse_args()
+    logging.disable(logging.INFO)   # app 把根 logger 设成 INFO（httpx / 导出每个请求一行），不计入基准
+
+    names = [n.strip() for n in args.only.split(",") if n.strip()] or list(SCENARIOS)
+    unknown = [n for n in names if n not in SCENARIOS]
+    if unknown:
+        ap.error(f"unknown endpoints: {', '.join(unknown)}")
+
+    tmp = tempfile.TemporaryDirectory()
+    sample = os.path.join(tmp.name, "sample.bin")
+    with open(sample, "wb") as f:
+        f.write(os.urandom(256 * 1024))
+    env = {"file": sample, "tsq": rfc3161.build_tsq(hashlib.sha256(b"bench").digest())}
+    if not args.url:
+        os.environ["DB_PATH"] = os.path.join(tmp.name, "verify_upgrade.db")   # 先于 import app.main
+        from seed_demo import seed_many
+        seed_many(args.certs, args.receipts_per_cert)
+
+    print(f"concurrency={args.concurrency} seconds={args.seconds} certs={args.certs} "
+          f"receipts_per_cert={args.receipts_per_cert} target={args.url or 'in-process'}")
+    print(f"{'endpoint':<17} {'requests':>9} {'rps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'rss MB':>9}")
+    results = asyncio.run(run(args, names, env))
+
+    out = {"meta": {"commit": git_commit(), "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                    "python": platform.python_version(), "platform": platform.platform(),
+                    "target": args.url or "in-process", "concurrency": args.concurrency, "seconds": args.seconds,
+                    "certs": args.certs, "receipts_per_cert": args.receipts_per_cert},
+           "results": results}
+    if args.json:
+        os.makedirs(os.path.dirname(os.path.abspath(args.json)), exist_ok=True)
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(out, f, ensure_ascii=False, indent=2)
+        print(f"saved {args.json}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+
+    if not args.url:
+        from app.main import receipt_writer, sqlite_pool
+        receipt_writer.close()
+        sqlite_pool.close_all()
+    tmp.cleanup()
+    if regressions:
+        print(f"regressions: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# scripts/bench_export.py
+# -*- coding: utf-8 -*-
+"""
+流式导出基准：向临时库写入 N 条回执，然后完整导出一遍，报告耗时与峰值 RSS。
+用法：
+  python scripts/bench_export.py --rows 1000000 --source sqlite
+  python scripts/bench_export.py --rows 1000000 --source sqlite --gzip
+  python scripts/bench_export.py --rows 200000 --source memory
+  python scripts/bench_export.py --rows 1000000 --source sqlite --format parquet
+说明：峰值 RSS 取自 resource.getrusage（Linux 单位 KB），Windows 上不可用时显示 n/a。
+"""
+import argparse, os, sqlite3, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import export as receipts_export   # noqa: E402
+from app.query import compile_query          # noqa: E402
+from app.receipt_store import ReceiptStore   # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    if resource is None:
+        return float("nan")
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 if sys.platform != "darwin" else kb / 1024 / 1024
+
+
+def seed_sqlite(path: str, n: int, certs: int):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE receipts (id INTEGER PRIMARY KEY AUTOINCREMENT, cert_id TEXT NOT NULL,"
+                 " provider TEXT, status TEXT, txid TEXT, created_at TEXT)")
+    conn.execute("CREATE TABLE evidence_meta (cert_id TEXT PRIMARY KEY, case_id TEXT, title TEXT,"
+                 " owner TEXT, source TEXT, notes TEXT, updated_at TEXT)")
+    conn.executemany("INSERT INTO evidence_meta (cert_id, case_id, title, owner) VALUES (?,?,?,?)",
+                     ((f"cert-{c:06d}", f"CASE-{c % 100}", f"title {c}", "bench") for c in range(certs)))
+    batch = 50_000
+    for start in range(0, n, batch):
+        conn.executemany(
+            "INSERT INTO receipts (cert_id, provider, status, txid, created_at) VALUES (?,?,?,?,?)",
+            ((f"cert-{i % certs:06d}", "tsa" if i % 2 else "chain", "ok", f"0xTX_{i:010d}",
+              "2026-10-01 12:00:00") for i in range(start, min(n, start + batch))))
+    conn.commit()
+    conn.close()
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=1_000_000)
+    ap.add_argument("--certs", type=int, default=5_000)
+    ap.add_argument("--source", choices=("sqlite", "memory"), default="sqlite")
+    ap.add_argument("--gzip", action="store_true")
+    ap.add_argument("--format", choices=tuple(receipts_export.FORMATS), default="csv")
+    args = ap.parse_args()
+
+    cq = compile_query("")
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        if args.source == "sqlite":
+            path = os.path.join(tmp, "bench.db")
+            seed_sqlite(path, args.rows, args.certs)
+            conn = sqlite3.connect(path)
+            rows = receipts_export.sqlite_rows(conn, None, cq)
+        else:
+            store = ReceiptStore()
+            for i in range(args.rows):
+                store.append(f"cert-{i % args.certs:06d}", {"provider": "tsa", "status": "ok",
+                                                            "txid": f"0xTX_{i:010d}", "time": "2026-10-01 12:00:00"})
+            rows = receipts_export.memory_rows(store, None, cq, lambda c: None)
+        seeded = time.perf_counter() - t0
+        rss_before = peak_rss_mb()
+
+        if args.format == "ndjson":
+            chunks = receipts_export.ndjson_chunks(rows)
+        elif args.format in receipts_export.COLUMNAR_FORMATS:
+            chunks = receipts_export.columnar_chunks(rows, receipts_export.CSV_HEADER, args.format)
+        else:
+            chunks = receipts_export.csv_chunks(rows)
+        if args.gzip and args.format not in receipts_export.COLUMNAR_FORMATS:
+            chunks = receipts_export.gzip_chunks(chunks)
+        t1 = time.perf_counter()
+        n_bytes = n_chunks = 0
+        for c in chunks:
+            n_bytes += len(c)
+            n_chunks += 1
+        elapsed = time.perf_counter() - t1
+        rss_after = peak_rss_mb()
+
+    print(f"source={args.source} rows={args.rows} format={args.format} gzip={args.gzip}")
+    print(f"seed:    {seeded:.1f}s")
+    print(f"export:  {elapsed:.2f}s  {args.rows / elapsed:,.0f} rows/s  {n_bytes / 1e6:.1f} MB in {n_chunks} chunks")
+    print(f"peak RSS before export: {rss_before:.1f} MB, after: {rss_after:.1f} MB "
+          f"(+{rss_after - rss_before:.1f} MB during export)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# scripts/bench_query.py
+# -*- coding: utf-8 -*-
+"""
+对比旧版逐行解析的 _match_query 与编译后的查询谓词（app/query.py）。
+用法：
+  python scripts/bench_query.py --rows 200000
+"""
+import argparse, os, random, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.query import compile_query, lower_row  # noqa: E402
+from app.receipt_store import ReceiptStore      # noqa: E402
+
+QUERIES = [
+    "provider:tsa",
+    "provider:tsa status:pending",
+    "0xtx_chain",
+    "provider:chain status:pending 0xtx",
+]
+
+
+def legacy_match(item: dict, q: str) -> bool:
+    """旧实现：每行重新 split 查询串，并重新拼接/小写化 blob"""
+    if not q:
+        return True
+    for t in q.split():
+        if ":" in t:
+            k, v = t.split(":", 1)
+            if (item.get(k) or "").lower() != v.lower():
+                return False
+        else:
+            blob = " ".join([str(item.get(k, "")) for k in ("cert_id", "provider", "status", "txid")])
+            if t.lower() not in blob.lower():
+                return False
+    return True
+
+
+def make_rows(n: int, certs: int):
+    rnd = random.Random(42)
+    rows = []
+    for i in range(n):
+        provider = rnd.choice(("tsa", "chain"))
+        status = rnd.choice(("ok", "pending", "failed"))
+        rows.append((f"cert-{i % certs:05d}", {
+            "provider": provider,
+            "status": status,
+            "txid": f"0xTX_{provider.upper()}_{i:08x}",
+            "time": f"2026-10-{1 + i % 28:02d} 12:{i % 60:02d}:00",
+        }))
+    return rows
+
+
+def _timeit(fn):
+    t0 = time.perf_counter()
+    n = fn()
+    return n, time.perf_counter() - t0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=200_000)
+    ap.add_argument("--certs", type=int, default=2_000)
+    args = ap.parse_args()
+
+    rows = make_rows(args.rows, args.certs)
+    views = [dict(item, cert_id=cid) for cid, item in rows]
+    lowered = [lower_row(cid, item) for cid, item in rows]
+    store = ReceiptStore()
+    for cid, item in rows:
+        store.append(cid, item)
+
+    print(f"rows={args.rows} certs={args.certs}")
+    print(f"{'query':40s} {'legacy':>10s} {'compiled':>10s} {'store':>10s}  hits")
+    for q in QUERIES:
+        n1, t1 = _timeit(lambda: sum(1 for v in views if legacy_match(v, q)))
+        cq = compile_query(q)
+        n2, t2 = _timeit(lambda: sum(1 for low in lowered if cq.match(low)))
+        n3, t3 = _timeit(lambda: store.count("", cq.index_terms(), cq.match, cq.time_range()))
+        assert n1 == n2 == n3, (q, n1, n2, n3)
+        print(f"{q:40s} {t1 * 1000:9.1f}ms {t2 * 1000:9.1f}ms {t3 * 1000:9.1f}ms  {n1}")
+
+
+if __name__ == "__main__":
+    main()
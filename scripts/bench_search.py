@@ -0,0 +1,90 @@
+# scripts/bench_search.py
+# -*- coding: utf-8 -*-
+"""
+全文检索基准：N 个 cert 的 evidence_meta（案号 / 中文标题）+ 每 cert R 条回执，
+对比 FTS5（SQLiteStorage.search）与原先逐行 LIKE 扫描的查询耗时，并给出触发器维护索引对写入的影响。
+用法：
+  python scripts/bench_search.py --certs 1000000 --receipts-per-cert 1
+  python scripts/bench_search.py --certs 100000 --queries 200
+"""
+import argparse, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import search                  # noqa: E402
+from app.sqlite_pool import SQLitePool  # noqa: E402
+from app.storage import SQLiteStorage   # noqa: E402
+
+SQL_LIKE_SCAN = """
+    SELECT cert_id FROM evidence_meta
+    WHERE case_id LIKE ?1 OR title LIKE ?1 OR owner LIKE ?1 OR source LIKE ?1 OR notes LIKE ?1
+    LIMIT 20
+"""
+WORDS = ["合同", "扫描件", "聊天记录", "转账凭证", "录音", "照片", "发票", "邮件", "公证书", "判决书"]
+
+
+def load(store, certs, per_cert, batch, with_fts):
+    pool = store.pool
+    conn = pool.conn(create=True)
+    if not with_fts:
+        for name in ("evidence_meta_fts_ai", "evidence_meta_fts_au", "evidence_meta_fts_ad",
+                     "receipts_fts_ai", "receipts_fts_ad"):
+            conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        conn.commit()
+    rnd = random.Random(11)
+    t0 = time.perf_counter()
+    for lo in range(0, certs, batch):
+        ids = range(lo, min(certs, lo + batch))
+        store.write_batch(
+            evidence=[{"cert_id": f"cert-{i:07d}", "case_id": f"沪{2020 + i % 6}民初{i:07d}号",
+                       "title": f"{rnd.choice(WORDS)}{rnd.choice(WORDS)} 第{i}份", "owner": f"user{i % 997}"}
+                      for i in ids],
+            receipts=[(f"cert-{i:07d}", "tsa", "ok", f"0xTX_{i:07d}_{k}", "2026-01-01 00:00:00")
+                      for i in ids for k in range(per_cert)])
+    return (time.perf_counter() - t0)
+
+
+def timed(fn, queries):
+    t0 = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - t0) / len(queries) * 1e3
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--certs", type=int, default=200_000)
+    ap.add_argument("--receipts-per-cert", type=int, default=1)
+    ap.add_argument("--batch", type=int, default=5000)
+    ap.add_argument("--queries", type=int, default=100)
+    args = ap.parse_args()
+
+    rnd = random.Random(5)
+    case_q = [f"民初{rnd.randrange(args.certs):07d}" for _ in range(args.queries)]
+    title_q = [f"{rnd.choice(WORDS)} 第{rnd.randrange(args.certs)}份" for _ in range(args.queries)]
+    tx_q = [f"0xTX_{rnd.randrange(args.certs):07d}" for _ in range(args.queries)]
+    rows = args.certs * (1 + args.receipts_per_cert)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain = SQLiteStorage(SQLitePool(os.path.join(tmp, "plain.db")))
+        t_plain = load(plain, args.certs, args.receipts_per_cert, args.batch, with_fts=False)
+        fts = SQLiteStorage(SQLitePool(os.path.join(tmp, "fts.db")))
+        t_fts = load(fts, args.certs, args.receipts_per_cert, args.batch, with_fts=True)
+        print(f"certs={args.certs} receipts/cert={args.receipts_per_cert}")
+        print(f"write   no-fts {rows / t_plain:>10,.0f} rows/s   fts {rows / t_fts:>10,.0f} rows/s")
+        print(f"size    no-fts {os.path.getsize(os.path.join(tmp, 'plain.db')) / 2**20:>8.1f} MiB   "
+              f"fts {os.path.getsize(os.path.join(tmp, 'fts.db')) / 2**20:>8.1f} MiB")
+
+        conn = plain.pool.conn()
+        like = lambda q: [conn.execute(SQL_LIKE_SCAN, (f"%{t}%",)).fetchall() for t in search.terms(q)]
+        for label, qs in (("case_id", case_q), ("title", title_q), ("txid", tx_q)):
+            hit = sum(1 for q in qs if fts.search(q, 20)[0])
+            print(f"{label:<8}fts {timed(lambda q: fts.search(q, 20), qs):8.2f} ms/q   "
+                  f"like-scan {timed(like, qs[:max(1, len(qs) // 10)]):8.2f} ms/q   hits {hit}/{len(qs)}")
+        print(f"sanity  {search.meta_match(case_q[0])}")
+        plain.pool.close_all()
+        fts.pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
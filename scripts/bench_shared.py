@@ -0,0 +1,86 @@
+# scripts/bench_shared.py
+# -*- coding: utf-8 -*-
+"""
+共享回执（RECEIPTS_SHARED=1）基准：起 N 个进程模拟 uvicorn worker，每个进程循环“写 1 条 + 读 R 次 count_cert”，
+读之前按共享模式追尾；对照组是各进程只用自己的内存 ReceiptStore（默认的单进程模式）。
+报告总吞吐、读延迟 p50 / p99，以及结束时各 worker 的回执数是否一致。
+用法：
+  python scripts/bench_shared.py --workers 4 --seconds 5
+  python scripts/bench_shared.py --workers 1 --reads 20
+"""
+import argparse, multiprocessing as mp, os, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def worker(path, shared, seconds, reads, wid, out):
+    from app.receipt_store import ReceiptStore
+    from app.receipt_writer import ReceiptWriter
+    from app.shared_receipts import SharedReceipts
+    from app.sqlite_pool import SQLitePool
+    from app.storage import SQLiteStorage
+
+    pool = SQLitePool(path)
+    SQLiteStorage(pool)
+    writer = ReceiptWriter(pool, flush_ms=2)
+    sr = SharedReceipts(pool, lambda c, i: writer.submit(c, i, wait=True))
+    local = ReceiptStore()
+    lat, ops, n = [], 0, 0
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        cert = f"cert-{(wid * 7919 + n) % 500:04d}"
+        item = {"provider": "tsa", "status": "ok", "txid": f"w{wid}-{n}", "time": "2025-01-01 00:00:00"}
+        if shared:
+            sr.append(cert, item)
+        else:
+            local.append(cert, item)
+            writer.submit(cert, item)
+        n += 1
+        for _ in range(reads):
+            t0 = time.perf_counter()
+            if shared:
+                sr.sync()
+                sr.store.count_cert(cert)
+            else:
+                local.count_cert(cert)
+            lat.append(time.perf_counter() - t0)
+        ops += 1 + reads
+    writer.close()
+    if shared:
+        time.sleep(0.2)        # 等其它 worker 的最后一批
+        sr.sync(force=True)
+    out.put((wid, ops, n, sorted(lat), len(sr.store) if shared else len(local)))
+
+
+def run(path, workers, shared, seconds, reads):
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(path, shared, seconds, reads, w, q)) for w in range(workers)]
+    for p in procs:
+        p.start()
+    res = [q.get() for _ in procs]
+    for p in procs:
+        p.join()
+    ops = sum(r[1] for r in res)
+    writes = sum(r[2] for r in res)
+    lat = sorted(x for r in res for x in r[3])
+    seen = sorted({r[4] for r in res})
+    pct = lambda p: lat[min(len(lat) - 1, int(len(lat) * p))] * 1e6 if lat else 0
+    mode = "shared" if shared else "local"
+    print(f"{mode:<7}workers={workers} ops/s={ops / seconds:>10,.0f} writes={writes:>7} "
+          f"read p50={pct(0.5):6.1f}µs p99={pct(0.99):7.1f}µs  per-worker rows={seen}")
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--seconds", type=float, default=5)
+    ap.add_argument("--reads", type=int, default=9, help="每写 1 条读几次")
+    args = ap.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        run(os.path.join(tmp, "local.db"), args.workers, False, args.seconds, args.reads)
+        run(os.path.join(tmp, "shared.db"), args.workers, True, args.seconds, args.reads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# scripts/bench_storage.py
+# -*- coding: utf-8 -*-
+"""
+存储后端统一基准：对 app/storage.py 的每个实现跑同一组操作，输出一张对比表。
+  write     write_batch 批量写回执（每批同时写本批 cert 的证据）        rows/s
+  page      page_view(cert, 5)：verify 页的读路径                       µs/次
+  many      get_evidence_many(500 个 cert)                               ms/次
+  export    iter_receipts() 全量流式读出                                 rows/s
+用法：
+  python scripts/bench_storage.py --receipts 200000
+  python scripts/bench_storage.py --backends sqlite,postgres --pg-url postgresql://user:pw@localhost/verify
+postgres（asyncpg）只有给了 --pg-url 才跑；sqlalchemy 默认指向临时目录里的 sqlite 文件
+（测的是 SQLAlchemy 这一层本身的开销），--sa-url 可换成真实库。
+"""
+import argparse, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import storage as st           # noqa: E402
+from app.sqlite_pool import SQLitePool  # noqa: E402
+
+
+def make(backend, tmp, args):
+    if backend == "memory":
+        return st.MemoryStorage()
+    if backend == "sqlite":
+        return st.SQLiteStorage(SQLitePool(os.path.join(tmp, "bench.db")))
+    if backend == "sqlalchemy":
+        return st.SQLAlchemyStorage(args.sa_url or f"sqlite:///{os.path.join(tmp, 'bench_sa.db')}")
+    if not args.pg_url:
+        return None
+    from app.pg_storage import PostgresStorage
+    store = PostgresStorage(args.pg_url)
+    store._run(store.pool.execute("TRUNCATE receipts, evidence_meta, cert_records"))
+    return store
+
+
+def run(store, n, certs, batch, reads):
+    out = {}
+    t0 = time.perf_counter()
+    for lo in range(0, n, batch):
+        hi = min(n, lo + batch)
+        ids = sorted({f"cert-{i % certs:06d}" for i in range(lo, hi)})
+        store.write_batch(
+            evidence=[{"cert_id": c, "sha256": "ab" * 32, "case_id": f"CASE-{hash(c) % 50}", "title": c}
+                      for c in ids],
+            receipts=[(f"cert-{i % certs:06d}", "tsa" if i % 2 else "chain", "ok", f"0xTX_{i:010d}",
+                       "2025-01-01 00:00:00") for i in range(lo, hi)])
+    out["write"] = n / (time.perf_counter() - t0)
+
+    rnd = random.Random(7)
+    sample = [f"cert-{rnd.randrange(certs):06d}" for _ in range(reads)]
+    t0 = time.perf_counter()
+    for c in sample:
+        store.page_view(c, 5)
+    out["page"] = (time.perf_counter() - t0) / reads * 1e6
+
+    groups = [sample[i:i + 500] for i in range(0, len(sample), 500)] or [[]]
+    t0 = time.perf_counter()
+    for g in groups:
+        store.get_evidence_many(g)
+    out["many"] = (time.perf_counter() - t0) / len(groups) * 1e3
+
+    t0 = time.perf_counter()
+    got = sum(1 for _ in store.iter_receipts())
+    out["export"] = got / (time.perf_counter() - t0)
+    assert got == n, (got, n)
+    return out
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--receipts", type=int, default=200_000)
+    ap.add_argument("--certs", type=int, default=10_000)
+    ap.add_argument("--batch", type=int, default=2000)
+    ap.add_argument("--reads", type=int, default=2000)
+    ap.add_argument("--backends", default=",".join(st.BACKENDS))
+    ap.add_argument("--pg-url", default="", help="postgres 后端（asyncpg）的连接串；会清空其中的回执表")
+    ap.add_argument("--sa-url", default="", help="sqlalchemy 后端的连接串")
+    args = ap.parse_args()
+
+    print(f"receipts={args.receipts} certs={args.certs} batch={args.batch} reads={args.reads}")
+    print(f"{'backend':<10}{'write rows/s':>14}{'page µs':>10}{'many ms':>10}{'export rows/s':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in args.backends.split(","):
+            store = make(backend.strip(), tmp, args)
+            if store is None:
+                print(f"{backend:<10}(skipped: --pg-url not given)")
+                continue
+            try:
+                r = run(store, args.receipts, args.certs, args.batch, args.reads)
+            finally:
+                store.close()
+            print(f"{store.name:<10}{r['write']:>14,.0f}{r['page']:>10.1f}{r['many']:>10.2f}{r['export']:>15,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# scripts/bench_verify_page.py
+# -*- coding: utf-8 -*-
+"""
+verify 页延迟随回执量的变化：receipts 逐步灌到 --rows（默认 1000 万），每到一个检查点
+随机取 cert 调 SQLiteStorage.page_view（即 /verify_upgrade/{cert_id} 的那一次往返），报 p50 / p99。
+走 receipts(cert_id, id, provider, status, txid, created_at) 覆盖索引时各检查点应基本持平；
+--narrow 换回 v2 的 (cert_id, id) 窄索引做对照（每条回执多一次回表）。
+用法：
+  python scripts/bench_verify_page.py --rows 10000000
+  python scripts/bench_verify_page.py --rows 1000000 --narrow
+"""
+import argparse, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import storage                 # noqa: E402
+from app.sqlite_pool import SQLitePool  # noqa: E402
+from app.storage import SQLiteStorage   # noqa: E402
+
+
+def checkpoints(rows):
+    out, n = [], 10_000
+    while n < rows:
+        out.append(n)
+        n *= 10
+    return out + [rows]
+
+
+def fill(store, lo, hi, certs, batch):
+    for a in range(lo, hi, batch):
+        store.write_batch(receipts=[(f"cert-{i % certs:07d}", "tsa", "ok", f"0xTX_{i:09d}", "2026-01-01 00:00:00")
+                                    for i in range(a, min(hi, a + batch))])
+
+
+def measure(store, certs, n):
+    rnd = random.Random(n)
+    lat = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        store.page_view(f"cert-{rnd.randrange(certs):07d}", 5)
+        lat.append((time.perf_counter() - t0) * 1e3)
+    lat.sort()
+    return lat[len(lat) // 2], lat[int(len(lat) * 0.99)]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=10_000_000)
+    ap.add_argument("--certs", type=int, default=100_000, help="回执分摊到多少个 cert")
+    ap.add_argument("--batch", type=int, default=20_000)
+    ap.add_argument("--queries", type=int, default=2000)
+    ap.add_argument("--narrow", action="store_true", help="用 v2 的 (cert_id, id) 索引对照")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "verify.db")
+        store = SQLiteStorage(SQLitePool(path))
+        conn = store.pool.conn(create=True)
+        if args.narrow:
+            conn.execute("DROP INDEX IF EXISTS idx_receipts_cert_cover")
+            conn.execute(storage.SQL_CREATE_RECEIPTS_CERT)
+            conn.commit()
+        store.write_batch(evidence=[{"cert_id": f"cert-{i:07d}", "case_id": f"C{i}", "title": "bench"}
+                                    for i in range(args.certs)])
+        print(f"index={'narrow' if args.narrow else 'covering'} certs={args.certs}")
+        print(f"{'receipts':>12} {'p50 ms':>8} {'p99 ms':>8} {'fill rows/s':>12} {'db MiB':>8}")
+        done = 0
+        for cp in checkpoints(args.rows):
+            t0 = time.perf_counter()
+            fill(store, done, cp, args.certs, args.batch)
+            rate = (cp - done) / max(time.perf_counter() - t0, 1e-9)
+            done = cp
+            p50, p99 = measure(store, args.certs, args.queries)
+            print(f"{cp:>12,} {p50:>8.3f} {p99:>8.3f} {rate:>12,.0f} {os.path.getsize(path) / 2**20:>8.1f}", flush=True)
+        store.pool.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+# scripts/load_test.py
+# -*- coding: utf-8 -*-
+"""
+并发压测：C 个客户端（asyncio 任务）持续混合访问 /verify_upgrade/{cert_id} 与 /api/tsa/mock，
+按端点报告吞吐、p50 / p95 / p99 延迟、错误数，以及 DB 执行器的最大排队。
+
+默认进程内跑（httpx.ASGITransport，不走网络，先在临时库里灌 N 个 cert × M 条回执）；
+给了 --url 就压一个已经起好的服务（如 uvicorn app.main:app --port 8011），此时不灌数据。
+进程内模式客户端和服务共用一个事件循环，延迟里含客户端开销，适合前后对比，不是绝对值；
+每个请求之后客户端让出一次事件循环（模拟网络往返），否则一直命中缓存的客户端会独占循环。
+用法：
+  python scripts/load_test.py --clients 500 --seconds 10
+  python scripts/load_test.py --clients 500 --tsa-ratio 0.5 --certs 5000
+  python scripts/load_test.py --url http://127.0.0.1:8011 --clients 500
+"""
+import argparse, asyncio, logging, os, random, sys, tempfile, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+
+def pct(xs, p):
+    return xs[min(len(xs) - 1, int(len(xs) * p))] if xs else 0.0
+
+
+async def client(c, args, deadline, stats, rnd):
+    while time.perf_counter() < deadline:
+        cert = f"load-{rnd.randrange(args.certs):06d}"
+        kind = "tsa_mock" if rnd.random() < args.tsa_ratio else "verify"
+        url = f"/api/tsa/mock?cert_id={cert}" if kind == "tsa_mock" else f"/verify_upgrade/{cert}"
+        t0 = time.perf_counter()
+        try:
+            r = await c.get(url)
+            ok = r.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        lat, errors = stats[kind]
+        lat.append((time.perf_counter() - t0) * 1e3)
+        if not ok:
+            errors.append(url)
+        await asyncio.sleep(0)   # 进程内没有真实 socket：命中缓存的请求全程不让出事件循环，这里补上网络往返的那次让出
+
+
+async def run(args):
+    if args.url:
+        transport, base = None, args.url
+    else:
+        from app.main import app
+        transport, base = httpx.ASGITransport(app=app), "http://load"
+    limits = httpx.Limits(max_connections=args.clients, max_keepalive_connections=args.clients)
+    async with httpx.AsyncClient(transport=transport, base_url=base, limits=limits, timeout=30) as c:
+        stats = {"verify": ([], []), "tsa_mock": ([], [])}
+        t0 = time.perf_counter()
+        deadline = t0 + args.seconds
+        await asyncio.gather(*(client(c, args, deadline, stats, random.Random(i)) for i in range(args.clients)))
+        elapsed = time.perf_counter() - t0
+        health = (await c.get("/health")).json()
+    return stats, elapsed, health
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="", help="压已启动的服务；不给则进程内跑")
+    ap.add_argument("--clients", type=int, default=500)
+    ap.add_argument("--seconds", type=float, default=10)
+    ap.add_argument("--certs", type=int, default=1000)
+    ap.add_argument("--receipts-per-cert", type=int, default=5)
+    ap.add_argument("--tsa-ratio", type=float, default=0.2, help="请求里 /api/tsa/mock 的比例")
+    args = ap.parse_args()
+    logging.disable(logging.INFO)   # app 把根 logger 设成 INFO（httpx / 导出每个请求一行），不计入基准
+
+    tmp = None
+    if not args.url:
+        tmp = tempfile.TemporaryDirectory()
+        os.environ["DB_PATH"] = os.path.join(tmp.name, "verify_upgrade.db")   # 先于 import app.main
+        from seed_demo import seed_many
+        seed_many(args.certs, args.receipts_per_cert)
+
+    stats, elapsed, health = asyncio.run(run(args))
+    print(f"clients={args.clients} seconds={elapsed:.1f} certs={args.certs} tsa_ratio={args.tsa_ratio} "
+          f"target={args.url or 'in-process'}")
+    print(f"{'endpoint':<10} {'requests':>9} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    total = 0
+    for kind, (lat, errors) in stats.items():
+        lat.sort()
+        total += len(lat)
+        print(f"{kind:<10} {len(lat):>9} {len(lat) / elapsed:>8.0f} {pct(lat, .5):>8.1f} {pct(lat, .95):>8.1f} "
+              f"{pct(lat, .99):>8.1f} {len(errors):>7}")
+    print(f"{'total':<10} {total:>9} {total / elapsed:>8.0f}")
+    if "db_executor" in health:
+        print(f"db_executor {health['db_executor']}")
+    if tmp is not None:
+        from app.main import receipt_writer, sqlite_pool
+        receipt_writer.close()
+        sqlite_pool.close_all()
+        tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
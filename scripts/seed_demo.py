@@ -3,11 +3,15 @@
 """
 向本地数据库写入一条 demo 证据与若干回执，便于在
 /verify_upgrade/{cert_id} 页面看到非兜底的真实数据。
+--certs N --receipts-per-cert M 另外批量灌 N 个 cert × M 条回执（压测 / 基准用，见 seed_many）。
+用法：
+  python scripts/seed_demo.py
+  python scripts/seed_demo.py --certs 10000 --receipts-per-cert 5
 """
 
 from datetime import datetime
 from contextlib import contextmanager
-import os, sqlite3
+import argparse, os, sqlite3
 
 # 可选：如果你的环境里本来就装了 SQLAlchemy，保留这个导入用于 SQLAlchemy 分支
 try:
@@ -23,6 +27,11 @@ try:
 except Exception:
     project_get_db = None
 
+try:
+    from app import schema as app_schema  # type: ignore
+except Exception:
+    app_schema = None
+
 @contextmanager
 def get_db():
     # 1) 先试项目内的 get_db（若返回 None 或异常，则继续回退）
@@ -88,6 +97,10 @@ def ensure_tables(db):
     exec_sql(db, DDL_EVIDENCE)
     if hasattr(db, "commit"):
         db.commit()
+    # 本地 sqlite3 分支：补上 app/schema.py 的迁移（receipts 按 cert_id 的覆盖索引等），
+    # 否则 verify 页 / db_check / clear_demo 按 cert_id 查都是全表扫
+    if isinstance(db, sqlite3.Connection) and app_schema is not None:
+        app_schema.ensure(db)
 
 def seed_evidence(db):
     # 若已存在则跳过
@@ -135,7 +148,30 @@ def seed_receipts(db):
     if hasattr(db, "commit"):
         db.commit()
 
+def seed_many(certs: int, per_cert: int, prefix: str = "load"):
+    """
+    批量灌 {prefix}-000000.. 共 certs 个 cert，每个 per_cert 条回执，evidence_meta 带 case_id / title；
+    走 app.main 的存储后端（一批一个事务），DB_PATH 要在调用前设好。
+    scripts/load_test.py、scripts/bench_endpoints.py 用同一套 cert 命名。
+    """
+    from app.main import ensure_evidence_table, storage
+    ensure_evidence_table()
+    for lo in range(0, certs, 5000):
+        ids = range(lo, min(certs, lo + 5000))
+        storage.write_batch(
+            evidence=[{"cert_id": f"{prefix}-{i:06d}", "case_id": f"{prefix.upper()}-{i}", "title": "压测证据"}
+                      for i in ids],
+            receipts=[(f"{prefix}-{i:06d}", "tsa", "ok", f"0xTX_{prefix.upper()}_{i}_{k}", "2026-01-01 00:00:00")
+                      for i in ids for k in range(per_cert)])
+
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--certs", type=int, default=0, help="另外批量灌的 cert 数（0 = 只写 demo）")
+    ap.add_argument("--receipts-per-cert", type=int, default=5)
+    args = ap.parse_args()
+    if args.certs:
+        seed_many(args.certs, args.receipts_per_cert)
+        print(f"✓ 已批量写入 {args.certs} 个 cert × {args.receipts_per_cert} 条回执。")
     with get_db() as db:
         if db is None:
             print("数据库未就绪：get_db() 返回 None（但脚本已运行）。")
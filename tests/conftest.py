@@ -1,3 +1,67 @@
 # 保证 CI 环境下也能从仓库根目录导入 app
 import sys, pathlib
 sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import glob, os, shutil, socket, subprocess, tempfile
+
+import pytest
+
+
+@pytest.fixture
+def isolated_db(tmp_path, monkeypatch):
+    """
+    app.main 的 SQLite（连接池 + 业务库路径）换成 tmp_path 下的新库，并清空验证页缓存；
+    yield 库文件路径，结束时把写入队列刷完、关掉连接、再清一次缓存。
+    """
+    import app.main as main
+    path = tmp_path / "verify.db"
+    monkeypatch.setattr(main.sqlite_pool, "path", path)
+    monkeypatch.setattr(main, "_BIZ_DB_PATH", path)
+    main.sqlite_pool.close_all()
+    main.verify_cache.clear()
+    try:
+        yield path
+    finally:
+        main.receipt_writer.flush(5.0)
+        main.sqlite_pool.close_all()
+        main.verify_cache.clear()
+
+
+def _pg_bin(tool):
+    """PG_BIN 指定的目录 → PATH → Debian/Ubuntu 的 /usr/lib/postgresql/*/bin"""
+    dirs = [os.getenv("PG_BIN", "")] + sorted(glob.glob("/usr/lib/postgresql/*/bin"), reverse=True)
+    for d in dirs:
+        if d and os.path.exists(os.path.join(d, tool)):
+            return os.path.join(d, tool)
+    return shutil.which(tool)
+
+
+@pytest.fixture(scope="session")
+def pg_dsn():
+    """
+    一次性 PostgreSQL：PG_TEST_DSN 给了就直接用；否则 initdb 一个临时实例（随机端口），测试结束删掉。
+    没有 postgres 可执行文件（或以 root 运行，initdb 会拒绝）时跳过。
+    """
+    if os.getenv("PG_TEST_DSN"):
+        yield os.environ["PG_TEST_DSN"]
+        return
+    initdb, pg_ctl = _pg_bin("initdb"), _pg_bin("pg_ctl")
+    if not initdb or not pg_ctl:
+        pytest.skip("postgres binaries not found (set PG_BIN or PG_TEST_DSN)")
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        pytest.skip("initdb refuses to run as root (set PG_TEST_DSN)")
+    tmp = tempfile.mkdtemp(prefix="pgtest-")
+    data = os.path.join(tmp, "data")
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    subprocess.run([initdb, "-D", data, "-U", "postgres", "-A", "trust", "--no-sync"],
+                   check=True, stdout=subprocess.DEVNULL)
+    opts = f"-F -p {port} -k {tmp} -c listen_addresses=127.0.0.1"
+    subprocess.run([pg_ctl, "-D", data, "-o", opts, "-l", os.path.join(tmp, "log"), "-w", "start"],
+                   check=True, stdout=subprocess.DEVNULL)
+    try:
+        yield f"postgresql://postgres@127.0.0.1:{port}/postgres"
+    finally:
+        subprocess.run([pg_ctl, "-D", data, "-m", "immediate", "stop"], stdout=subprocess.DEVNULL)
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+批量登记：NDJSON 清单 → 摘要 / evidence / 回执 / Merkle 批次，按块事务，逐块输出进度。
+运行：
+  py -3 -m pytest -q tests/test_bulk.py
+"""
+import hashlib
+import json
+import sqlite3
+
+import httpx
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import bulk, tsa_client
+from app.tsa_client import TSAClient
+
+client = TestClient(main.app)
+
+
+def _manifest(rows):
+    return "\n".join(r if isinstance(r, str) else json.dumps(r) for r in rows).encode()
+
+
+def test_parse_manifest_reports_bad_lines():
+    lines = [b'{"cert_id": "a", "file_path": "x"}', b"", b"not json", b'{"file_path": "x"}',
+             b'{"cert_id": "b"}', b'{"cert_id": "c", "sha256": "zz"}']
+    out = list(bulk.parse_manifest(lines))
+    assert [(n, err) for n, _, err in out] == [
+        (1, None), (3, out[1][2]), (4, "cert_id required"), (5, "file_path or sha256 required"),
+        (6, "sha256 must be 64 hex chars")]
+    assert out[1][2].startswith("invalid json")
+    assert [len(c) for c in bulk.chunked(range(5), 2)] == [2, 2, 1]
+
+
+def test_parse_manifest_sha256_strict_and_normalized():
+    spaced = "aa " * 16 + "aa" * 8  # 64 字符，bytes.fromhex 会跳过空白
+    lines = [json.dumps({"cert_id": "a", "sha256": spaced}).encode(),
+             json.dumps({"cert_id": "b", "sha256": " " + "AB" * 32 + "\n"}).encode()]
+    out = list(bulk.parse_manifest(lines))
+    assert out[0][1] is None and out[0][2] == "sha256 must be 64 hex chars"
+    assert out[1][2] is None and out[1][1]["sha256"] == "ab" * 32
+
+
+def test_bulk_certify_chunks_and_progress(isolated_db, tmp_path):
+    rows = []
+    for i in range(25):
+        f = tmp_path / f"asset{i}.bin"
+        f.write_bytes(f"asset {i}".encode())
+        rows.append({"cert_id": f"bulk-{i:03d}", "file_path": str(f), "case_id": "CASE-7", "title": f"t{i}"})
+    rows.append({"cert_id": "bulk-known", "sha256": "ab" * 32})
+    rows.append({"cert_id": "bulk-missing", "file_path": str(tmp_path / "nope.bin")})
+    rows.append("{broken")
+    try:
+        r = client.post("/api/certify/bulk", params={"chunk": 10}, content=_manifest(rows))
+        lines = [json.loads(x) for x in r.text.splitlines()]
+        assert r.status_code == 200 and len(lines) == 4          # 3 块进度 + 汇总
+        assert [x["done"] for x in lines[:3]] == [10, 20, 26]
+        final = lines[-1]
+        assert final["final"] and final["done"] == 26 and final["failed"] == 2
+        assert {e.get("cert_id") or e.get("line") for e in final["errors"]} == {"bulk-missing", 28}
+
+        conn = sqlite3.connect(isolated_db)
+        assert conn.execute("SELECT sha256 FROM evidence WHERE cert_id = 'bulk-003'").fetchone()[0] == \
+            hashlib.sha256(b"asset 3").hexdigest()
+        assert conn.execute("SELECT case_id FROM evidence_meta WHERE cert_id = 'bulk-003'").fetchone()[0] == "CASE-7"
+        assert conn.execute("SELECT COUNT(*) FROM receipts WHERE txid LIKE 'merkle:%'").fetchone()[0] == 26
+        conn.close()
+        assert main.merkle_ledger.root()["size"] == 26
+        assert main.merkle_ledger.proof_for("bulk-known")["leaf"]
+        assert "bulk-003" in client.get("/verify_upgrade/bulk-003").text
+    finally:
+        main.app.state.receipts.clear()
+
+
+def test_bulk_certify_with_tsa(isolated_db, monkeypatch):
+    monkeypatch.setattr(tsa_client, "client", TSAClient("http://testserver/api/tsa/mock",
+                                                        transport=httpx.ASGITransport(app=main.app)))
+    rows = [{"cert_id": f"stamp-{i}", "sha256": hashlib.sha256(bytes([i])).hexdigest()} for i in range(8)]
+    try:
+        r = client.post("/api/certify/bulk", params={"tsa": True, "chunk": 5}, content=_manifest(rows))
+        final = json.loads(r.text.splitlines()[-1])
+        assert final["done"] == 8 and final["stamped"] == 8 and final["tsa_failed"] == 0
+        assert client.get("/v1/upgrade25/tsa/token/stamp-3").json()["token"]["imprint"] == rows[3]["sha256"]
+        v = client.post("/v1/upgrade25/tsa/verify", json={}).json()
+        assert v["total"] == 8 and v["verified"] == 8
+    finally:
+        main.app.state.receipts.clear()
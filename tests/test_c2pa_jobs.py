@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+C2PA 写签任务队列：落库、进程池执行、按 (输入 sha256, claim, 签名证书) 去重、结果进回执。
+c2patool 用一个假脚本代替（把输入和 manifest 拼成输出，并记录调用次数）。
+运行：
+  py -3 -m pytest -q tests/test_c2pa_jobs.py
+"""
+import hashlib
+import json
+import sys
+import time
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import c2pa_jobs, schema
+from app.c2pa_jobs import C2PAQueue
+from app.sqlite_pool import SQLitePool
+
+client = TestClient(main.app)
+
+FAKE_TOOL = """#!{python}
+import json, sys, time
+src, args = sys.argv[1], sys.argv[2:]
+manifest, out = args[args.index("-m") + 1], args[args.index("-o") + 1]
+m = json.load(open(manifest, encoding="utf-8"))
+assert m["sign_cert"] and m["private_key"]
+time.sleep(0.05)
+open(out, "wb").write(open(src, "rb").read() + json.dumps(m, sort_keys=True).encode())
+open({log!r}, "a").write(src + "\\n")
+"""
+
+
+def _setup(tmp_path):
+    tool = tmp_path / "c2patool"
+    tool.write_text(FAKE_TOOL.format(python=sys.executable, log=str(tmp_path / "calls.log")))
+    tool.chmod(0o755)
+    (tmp_path / "signer.crt").write_text("CERT")
+    (tmp_path / "signer.key").write_text("KEY")
+    (tmp_path / "claim.json").write_text(json.dumps({"claim_generator": "test"}))
+    return str(tool)
+
+
+def _calls(tmp_path):
+    log = tmp_path / "calls.log"
+    return log.read_text().splitlines() if log.exists() else []
+
+
+def test_queue_runs_in_pool_and_dedups(isolated_db, tmp_path):
+    tool = _setup(tmp_path)
+    q = C2PAQueue(main.sqlite_pool, workers=2, tool=tool, poll=0.05)
+    signer = (str(tmp_path / "signer.crt"), str(tmp_path / "signer.key"))
+    try:
+        ids = []
+        for i in range(3):
+            src = tmp_path / f"v{i}.mp4"
+            src.write_bytes(bytes([i]) * 1000)
+            ids.append(q.submit(str(src), *signer, claim_path=str(tmp_path / "claim.json"))["job_id"])
+        jobs = [q.wait(j) for j in ids]
+        assert [j["status"] for j in jobs] == ["done"] * 3
+        out = tmp_path / "v0-signed.mp4"
+        assert jobs[0]["out_path"] == str(out) and jobs[0]["out_sha256"] == hashlib.sha256(out.read_bytes()).hexdigest()
+
+        again = q.submit(str(tmp_path / "v0.mp4"), *signer, claim_path=str(tmp_path / "claim.json"))
+        assert again == {"job_id": ids[0], "status": "done", "deduped": True}
+        other = q.submit(str(tmp_path / "v0.mp4"), *signer)          # claim 不同 → 新任务
+        assert not other["deduped"] and q.wait(other["job_id"])["status"] == "done"
+        assert len(_calls(tmp_path)) == 4 and q.counts() == {"done": 4}
+    finally:
+        q.close()
+
+
+def test_tool_failure_is_recorded(isolated_db, tmp_path):
+    _setup(tmp_path)
+    q = C2PAQueue(main.sqlite_pool, workers=1, tool=str(tmp_path / "missing-c2patool"), poll=0.05)
+    src = tmp_path / "a.png"
+    src.write_bytes(b"png")
+    try:
+        job = q.wait(q.submit(str(src), str(tmp_path / "signer.crt"), str(tmp_path / "signer.key"))["job_id"])
+        assert job["status"] == "failed" and "c2patool not found" in job["error"]
+        # 失败的任务不参与去重，可以重新提交
+        assert not q.submit(str(src), str(tmp_path / "signer.crt"), str(tmp_path / "signer.key"))["deduped"]
+    finally:
+        q.close()
+
+
+def test_construction_has_no_side_effects(tmp_path):
+    pool = SQLitePool(tmp_path / "c2pa.db")
+    C2PAQueue(pool)
+    assert schema.ensure not in pool.on_connect
+
+
+# 第一次调用时杀掉父进程（进程池里的 worker），模拟 worker 崩溃 → BrokenProcessPool
+KILLER_PREFIX = """#!{python}
+import os, signal
+marker = {marker!r}
+if not os.path.exists(marker):
+    open(marker, "w").close()
+    os.kill(os.getppid(), signal.SIGKILL)
+"""
+
+
+def test_broken_pool_is_rebuilt_and_job_requeued(isolated_db, tmp_path):
+    tool = _setup(tmp_path)
+    body = open(tool).read().split("\n", 1)[1]
+    open(tool, "w").write(KILLER_PREFIX.format(python=sys.executable, marker=str(tmp_path / "killed")) + body)
+    q = C2PAQueue(main.sqlite_pool, workers=1, tool=tool, poll=0.05)
+    signer = (str(tmp_path / "signer.crt"), str(tmp_path / "signer.key"))
+    try:
+        ids = []
+        for i in range(2):
+            src = tmp_path / f"b{i}.mp4"
+            src.write_bytes(bytes([i]) * 100)
+            ids.append(q.submit(str(src), *signer)["job_id"])
+        jobs = [q.wait(j, timeout=60) for j in ids]
+        assert [j["status"] for j in jobs] == ["done", "done"]
+        assert jobs[0]["attempts"] == 2 and jobs[1]["attempts"] == 1
+    finally:
+        q.close()
+
+
+def test_job_that_keeps_breaking_pool_fails(isolated_db, tmp_path):
+    tool = tmp_path / "c2patool"
+    tool.write_text(f"#!{sys.executable}\nimport os, signal\nos.kill(os.getppid(), signal.SIGKILL)\n")
+    tool.chmod(0o755)
+    (tmp_path / "signer.crt").write_text("CERT")
+    (tmp_path / "signer.key").write_text("KEY")
+    src = tmp_path / "c.png"
+    src.write_bytes(b"png")
+    q = C2PAQueue(main.sqlite_pool, workers=1, tool=str(tool), poll=0.05, max_attempts=2)
+    try:
+        job = q.wait(q.submit(str(src), str(tmp_path / "signer.crt"), str(tmp_path / "signer.key"))["job_id"], 60)
+        assert job["status"] == "failed" and job["attempts"] == 2 and "worker process died" in job["error"]
+    finally:
+        q.close()
+
+
+def test_embed_endpoint_returns_job_and_writes_receipt(isolated_db, tmp_path, monkeypatch):
+    tool = _setup(tmp_path)
+    monkeypatch.setattr(c2pa_jobs, "jobs", C2PAQueue(main.sqlite_pool, workers=1, tool=tool, poll=0.05))
+    src = tmp_path / "hello.png"
+    src.write_bytes(b"hello png")
+    body = {"file_path": str(src), "signer_cert_path": str(tmp_path / "signer.crt"),
+            "signer_key_path": str(tmp_path / "signer.key"), "cert_id": "c2pa-cert"}
+    try:
+        t0 = time.perf_counter()
+        r = client.post("/v1/upgrade25/c2pa/embed", json=body)
+        assert r.status_code == 202 and r.json()["status"] == "queued" and time.perf_counter() - t0 < 1.0
+        job_id = r.json()["job_id"]
+        c2pa_jobs.jobs.wait(job_id)
+        j = client.get(f"/v1/upgrade25/c2pa/jobs/{job_id}").json()["job"]
+        assert j["status"] == "done" and j["cert_id"] == "c2pa-cert"
+
+        main.receipt_writer.flush()
+        export = client.get("/api/receipts/export", params={"cert_id": "c2pa-cert", "format": "ndjson"}).text
+        assert f"c2pa:{j['out_sha256']}" in export
+        assert client.post("/v1/upgrade25/c2pa/embed", json=body).json()["deduped"]
+        assert client.get("/v1/upgrade25/c2pa/jobs/999").status_code == 404
+        body["signer_key_path"] = str(tmp_path / "nope.key")
+        assert client.post("/v1/upgrade25/c2pa/embed", json=body).status_code == 404
+    finally:
+        client.post("/api/receipts/clear", params={"cert_id": "c2pa-cert"})
+        c2pa_jobs.jobs.close()
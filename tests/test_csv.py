@@ -8,6 +8,7 @@ CSV 导出最小单测：
 """
 import csv, io, pathlib, importlib.util
 from datetime import datetime, timezone
+import pytest
 from fastapi.testclient import TestClient
 
 def _load_app_main():
@@ -19,13 +20,20 @@ def _load_app_main():
     spec.loader.exec_module(mod)
     return mod
 
+@pytest.fixture
+def app_main(isolated_db, monkeypatch):
+    # 单独加载的 app.main 副本：连接池是共享的（已被 isolated_db 指向临时库），业务库路径和回执写入器是它自己的
+    mod = _load_app_main()
+    monkeypatch.setattr(mod, "_BIZ_DB_PATH", isolated_db)
+    yield mod
+    mod.receipt_writer.close()
+
 def _csv_rows(text: str):
     f = io.StringIO(text)
     reader = csv.reader(f)
     return list(reader)
 
-def test_export_csv_basic():
-    app_main = _load_app_main()
+def test_export_csv_basic(app_main):
     client = TestClient(app_main.app)
 
     cert_id = "csv-smoke"
@@ -39,8 +47,7 @@ def test_export_csv_basic():
     assert len(rows) >= 2, "应至少有表头 + 1 条记录"
     assert len(rows[0]) >= 3, "表头至少包含若干列"
 
-def test_csv_escaping_quotes_commas_newlines():
-    app_main = _load_app_main()
+def test_csv_escaping_quotes_commas_newlines(app_main):
     client = TestClient(app_main.app)
 
     cert_id = "csv-escapes"
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+请求层 DB 执行器（app/db_executor.py）：端点全是 async，阻塞的存储调用在 DB 线程上跑，
+慢写入不再卡住事件循环上的其它请求。
+运行：
+  py -3 -m pytest -q tests/test_db_executor.py
+"""
+import asyncio
+import threading
+import time
+
+import httpx
+from fastapi.routing import APIRoute
+
+import app.main as main
+from app.db_executor import DBExecutor
+
+
+def test_every_endpoint_is_async():
+    sync = [r.path for r in main.app.routes
+            if isinstance(r, APIRoute) and not asyncio.iscoroutinefunction(r.endpoint)]
+    assert sync == []
+
+
+def test_offload_runs_on_db_threads_and_reopens():
+    ex = DBExecutor(max_workers=2)
+
+    @ex.offload
+    def where(x: int) -> str:
+        return f"{threading.current_thread().name}:{x}"
+
+    assert asyncio.run(where(1)).startswith("db") and asyncio.run(where(2)).endswith(":2")
+    ex.close()
+    assert asyncio.run(ex.run(lambda: 5)) == 5           # close 之后再用会重建线程池
+    st = ex.stats()
+    assert st["done"] == 3 and st["running"] == 0 and st["queued"] == 0
+    ex.close()
+
+
+def test_slow_write_does_not_block_loop(isolated_db, monkeypatch):
+    real = main.storage.upsert_evidence
+
+    def slow(rows):
+        time.sleep(0.5)
+        return real(rows)
+
+    monkeypatch.setattr(main.storage, "upsert_evidence", slow)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as c:
+            t0 = time.perf_counter()
+            write = asyncio.create_task(c.post("/api/evidence/update", json={"cert_id": "exec-1", "title": "t"}))
+            await asyncio.sleep(0.05)
+            await c.get("/api/tsa/config")
+            fast = time.perf_counter() - t0
+            assert (await write).json() == {"ok": True}
+            return fast, time.perf_counter() - t0
+
+    fast, slow_total = asyncio.run(scenario())
+    assert fast < 0.3 <= slow_total
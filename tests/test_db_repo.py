@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+app/db.py 仓储层：cert ON CONFLICT DO NOTHING、回执批量 INSERT ... RETURNING、一次 commit。
+运行：
+  py -3 -m pytest -q tests/test_db_repo.py
+"""
+from sqlalchemy import create_engine, event, func, select
+from sqlalchemy.orm import Session
+
+from app import db as repo
+from app.db import Base, CertRecord, Receipt
+
+
+def _session(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'repo.db'}")
+    Base.metadata.create_all(eng)
+    return eng, Session(eng)
+
+
+def test_add_receipts_batches_and_returns_ids(tmp_path):
+    eng, db = _session(tmp_path)
+    stmts, commits = [], []
+    event.listen(eng, "before_cursor_execute", lambda *a: stmts.append(a[2]))
+    event.listen(db, "after_commit", lambda s: commits.append(1))
+    try:
+        rows = [(f"c{i % 3}", "tsa", "ok", f"0x{i}") for i in range(10)]
+        ids = repo.add_receipts(db, rows)
+        assert ids == list(range(1, 11)) and len(commits) == 1
+        assert not any(s.lstrip().upper().startswith("SELECT") for s in stmts)   # 不回读
+
+        assert repo.add_receipt(db, "c1", "chain", "pending", "0xNEW") == 11
+        repo.upsert_certs(db, ["c0", "c9"])
+        assert db.execute(select(func.count()).select_from(CertRecord)).scalar() == 4
+        assert repo.ensure_cert(db, "c2").file_path == "demo/path/to/file.pdf"
+        assert repo.add_receipts(db, []) == []
+    finally:
+        db.close()
+        eng.dispose()
+
+
+def test_last_receipts_and_status_share_query(tmp_path):
+    eng, db = _session(tmp_path)
+    try:
+        repo.add_receipts(db, [("x", "tsa", "ok", f"0x{i}") for i in range(7)])
+        receipts, status = repo.get_receipts_and_status(db, "x", limit=5)
+        assert [r.txid for r in receipts] == ["0x6", "0x5", "0x4", "0x3", "0x2"]   # 同一时间戳按 id 倒序
+        assert status == {"tsa_last_status": "ok", "tsa_last_txid": "0x6"}
+        assert repo.get_last_status_txid(db, "x") == status
+        assert [r.txid for r in repo.get_last_receipts(db, "x", 2)] == ["0x6", "0x5"]
+        assert repo.get_last_status_txid(db, "nope") == {"tsa_last_status": None, "tsa_last_txid": None}
+        assert db.execute(select(func.count()).select_from(Receipt)).scalar() == 7
+    finally:
+        db.close()
+        eng.dispose()
+
+
+def test_verify_page_fallback_reads_once(isolated_db, monkeypatch):
+    # 存储后端读不到时，verify 页回退到 app.db：最近回执和最新状态是同一次查询
+    from contextlib import contextmanager
+    from fastapi.testclient import TestClient
+    import app.main as main
+
+    calls = []
+    row = {"provider": "tsa", "status": "ok", "txid": "0xFALLBACK", "created_at": None}
+    monkeypatch.setattr(main.storage, "available", lambda: False)
+    monkeypatch.setattr(main, "get_db", contextmanager(lambda: (yield None)))
+    monkeypatch.setattr(main, "get_receipts_and_status", lambda db, cert_id, limit=5: calls.append(cert_id) or (
+        [row], {"tsa_last_status": "ok", "tsa_last_txid": "0xFALLBACK"}))
+    assert "0xFALLBACK" in TestClient(main.app).get("/verify_upgrade/fb-1").text
+    assert calls == ["fb-1"]
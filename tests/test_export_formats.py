@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+导出格式：NDJSON / Arrow IPC / Parquet（后两者需要 pyarrow，没装则跳过）。
+运行：
+  py -3 -m pytest -q tests/test_export_formats.py
+"""
+import io
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import export as receipts_export
+
+client = TestClient(main.app)
+
+ROWS = [
+    ("c1", "CASE-1", "标题 \"一\"", "alice", "tsa", "ok", "0xA", "2026-10-01 10:00:00"),
+    ("c2", None, None, None, "chain", "fail", "0xB", "2026-10-02 10:00:00"),
+    ("c3", "CASE-1", "t3", "bob", "tsa", "ok", 42, "2026-10-03 10:00:00"),
+]
+
+
+def test_ndjson_chunks_roundtrip():
+    text = "".join(receipts_export.ndjson_chunks(iter(ROWS), chunk_size=64))
+    lines = [json.loads(x) for x in text.splitlines()]
+    assert [d["cert_id"] for d in lines] == ["c1", "c2", "c3"]
+    assert lines[0]["title"] == "标题 \"一\"" and lines[1]["case_id"] is None
+    assert list(lines[0]) == receipts_export.CSV_HEADER
+
+
+def test_columnar_chunks_arrow_and_parquet():
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    data = b"".join(receipts_export.columnar_chunks(iter(ROWS), receipts_export.CSV_HEADER, "arrow", batch_rows=2))
+    t = pa.ipc.open_stream(data).read_all()
+    assert t.num_rows == 3 and t.column("txid").to_pylist() == ["0xA", "0xB", "42"]
+
+    data = b"".join(receipts_export.columnar_chunks(iter(ROWS), receipts_export.CSV_HEADER, "parquet", batch_rows=2))
+    t = pq.read_table(io.BytesIO(data))
+    assert t.num_rows == 3 and t.column("case_id").to_pylist() == ["CASE-1", None, "CASE-1"]
+
+
+def test_export_endpoints_formats(isolated_db):
+    cert = "fmt-cert"
+    try:
+        client.post("/api/receipts/clear", params={"cert_id": cert})
+        client.post("/api/evidence/update", json={"cert_id": cert, "case_id": "CASE-F", "title": "格式"})
+        main._append_receipt(main.app, cert, {"provider": "tsa", "status": "ok", "txid": "0xF1"})
+
+        r = client.get("/api/receipts/export", params={"cert_id": cert, "format": "ndjson"})
+        assert r.status_code == 200 and r.headers["content-type"].startswith("application/x-ndjson")
+        assert ".ndjson" in r.headers["content-disposition"]
+        row = json.loads(r.text.splitlines()[0])
+        assert row["txid"] == "0xF1" and row["case_id"] == "CASE-F"
+
+        r = client.get("/api/evidence/export", params={"case_id": "CASE-F", "format": "ndjson"})
+        assert [json.loads(x)["cert_id"] for x in r.text.splitlines()] == [cert]
+
+        assert client.get("/api/receipts/export", params={"format": "xlsx"}).status_code == 400
+
+        if receipts_export.columnar_available():
+            import pyarrow.parquet as pq
+            r = client.get("/api/evidence/export", params={"format": "parquet"})
+            assert r.status_code == 200 and "content-encoding" not in r.headers
+            assert pq.read_table(io.BytesIO(r.content)).column("title").to_pylist() == ["格式"]
+    finally:
+        client.post("/api/receipts/clear", params={"cert_id": cert})
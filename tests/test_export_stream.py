@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+流式导出：分块输出、gzip、全部 / case_id 范围、sqlite 数据源。
+运行：
+  py -3 -m pytest -q tests/test_export_stream.py
+"""
+import csv, gzip, io
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import export as receipts_export
+from app.query import compile_query
+
+client = TestClient(main.app)
+
+
+def _rows(text):
+    return list(csv.reader(io.StringIO(text.lstrip("\ufeff"))))
+
+
+def test_csv_chunks_are_bounded_and_gzip_roundtrips():
+    rows = ((f"c{i}", "", "", "", "tsa", "ok", f"0x{i:08d}", "2026-10-01 00:00:00") for i in range(5000))
+    chunks = list(receipts_export.csv_chunks(rows, chunk_size=4096))
+    assert len(chunks) > 10
+    assert max(len(c) for c in chunks) < 4096 + 200
+    text = "".join(chunks)
+    assert text.startswith("\ufeff") and len(_rows(text)) == 5001
+
+    packed = b"".join(receipts_export.gzip_chunks(iter(chunks)))
+    assert gzip.decompress(packed).decode("utf-8") == text
+    assert receipts_export.accepts_gzip("gzip, deflate")
+    assert not receipts_export.accepts_gzip("gzip;q=0, br")
+
+
+def test_export_all_certs_and_gzip_header(isolated_db):
+    for c in ("exp-a", "exp-b"):
+        client.get(f"/api/tsa/mock?cert_id={c}")
+    r = client.get("/api/receipts/export?all=1&q=exp-", headers={"Accept-Encoding": "gzip"})
+    assert r.status_code == 200 and r.headers.get("content-encoding") == "gzip"
+    certs = {row[0] for row in _rows(r.text)[1:]}
+    assert {"exp-a", "exp-b"} <= certs
+
+    r = client.get("/api/receipts/export?cert_id=exp-a", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in r.headers
+    assert {row[0] for row in _rows(r.text)[1:]} == {"exp-a"}
+
+
+def test_sqlite_source_by_case_id(isolated_db):
+    for c in ("k1", "k2", "k3"):
+        client.post("/api/evidence/update", json={"cert_id": c, "case_id": "CASE-7" if c != "k3" else "X",
+                                                   "title": f"标题 {c}"})
+    conn = main.sqlite_pool.conn()
+    conn.executemany(
+        "INSERT INTO receipts (cert_id, provider, status, txid, created_at) VALUES (?,?,?,?,?)",
+        [(c, "tsa" if i % 2 else "chain", "ok", f"0x{c}{i}", "2026-10-01 00:00:00")
+         for c in ("k1", "k2", "k3") for i in range(4)])
+    conn.commit()
+
+    r = client.get("/api/receipts/export?case_id=CASE-7&source=sqlite&q=provider:tsa")
+    data = _rows(r.text)
+    assert data[0] == receipts_export.CSV_HEADER
+    assert sorted(row[6] for row in data[1:]) == ["0xk11", "0xk13", "0xk21", "0xk23"]
+    assert {row[1] for row in data[1:]} == {"CASE-7"} and data[1][2] == "标题 k1"
+
+    with main.sqlite_pool.reader() as rc:
+        got = list(receipts_export.sqlite_rows(rc, None, compile_query("-status:ok"), batch=2))
+    assert got == []
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+"""
+文件摘要服务：多算法一遍读、并发批量、按 (path, size, mtime, inode) 缓存。
+运行：
+  py -3 -m pytest -q tests/test_hashing.py
+"""
+import hashlib
+import os
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.hashing import DigestCache, FileHasher
+
+client = TestClient(main.app)
+
+
+def _write(path, data: bytes):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_multi_algo_one_pass_matches_hashlib(tmp_path):
+    data = os.urandom(300_000)
+    p = _write(tmp_path / "a.bin", data)
+    h = FileHasher(max_workers=2, chunk_size=64 * 1024)   # 多个分块
+    d = h.digest(p, ["SHA256", "sha512", "md5"])
+    assert d == {"sha256": hashlib.sha256(data).hexdigest(),
+                 "sha512": hashlib.sha512(data).hexdigest(),
+                 "md5": hashlib.md5(data).hexdigest()}
+
+
+def test_cache_hit_and_invalidation_on_change(tmp_path, monkeypatch):
+    p = _write(tmp_path / "b.bin", b"v1" * 1000)
+    h = FileHasher(cache=DigestCache())
+    reads = []
+    orig = h._compute
+    monkeypatch.setattr(h, "_compute", lambda path, algos: reads.append(path) or orig(path, algos))
+
+    first = h.sha256(p)
+    assert h.sha256(p) == first and len(reads) == 1          # 未变：不再读盘
+    h.digest(p, ["sha256", "sha1"])                          # 新算法：再读一次，合并进缓存
+    h.digest(p, ["sha1"])
+    assert len(reads) == 2
+
+    _write(tmp_path / "b.bin", b"v2" * 1000)
+    os.utime(p, ns=(1, 1))                                    # mtime 变了
+    assert h.sha256(p) == hashlib.sha256(b"v2" * 1000).hexdigest() and len(reads) == 3
+
+
+def test_digest_many_concurrent_and_errors(tmp_path):
+    files = {str(_write(tmp_path / f"f{i}.bin", bytes([i]) * (10_000 + i))): i for i in range(12)}
+    h = FileHasher(max_workers=4, chunk_size=4096)
+    try:
+        out = h.digest_many(list(files) + [str(tmp_path / "missing.bin")])
+    finally:
+        h.close()
+    for p, i in files.items():
+        assert out[p]["sha256"] == hashlib.sha256(bytes([i]) * (10_000 + i)).hexdigest()
+    assert "error" in out[str(tmp_path / "missing.bin")]
+
+
+def test_evidence_hash_endpoint(isolated_db, tmp_path):
+    p = _write(tmp_path / "asset.pdf", b"%PDF-1.7 demo")
+    r = client.post("/api/evidence/hash", json={"cert_id": "hash-cert", "file_path": p, "algos": ["sha512"]})
+    d = r.json()
+    assert d["ok"] and d["digests"]["sha256"] == hashlib.sha256(b"%PDF-1.7 demo").hexdigest()
+    assert "sha512" in d["digests"]
+    assert d["digests"]["sha256"] in client.get("/verify_upgrade/hash-cert").text
+    assert client.post("/api/evidence/hash", json={"cert_id": "x", "file_path": p, "algos": ["nope"]}).status_code == 400
+    # XOF（hexdigest 要给长度）不当文件摘要算法：400 而不是 500
+    assert client.post("/api/files/hash", json={"files": [p], "algos": ["shake_128"]}).status_code == 400
+    assert client.post("/api/evidence/hash", json={"cert_id": "x", "file_path": p, "algos": ["shake_256"]}).status_code == 400
+    assert client.post("/v1/upgrade25/tsa/query", json={"file_path": p, "hash_algo": "shake_128"}).status_code == 400
+    assert client.post("/api/evidence/hash", json={"cert_id": "x", "file_path": p + ".missing"}).status_code == 404
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+Merkle 日根：增量追加与 RFC 6962 递归定义一致；任意历史 size 的证明都能校验；
+锚定一批只上链一次，verify 页 / 接口能拿到证明。
+运行：
+  py -3 -m pytest -q tests/test_merkle.py
+"""
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.merkle import MerkleLedger, MerkleTree, leaf_hash, node_hash, verify_proof
+from app.sqlite_pool import SQLitePool
+
+client = TestClient(main.app)
+
+
+def _mth(leaves):
+    # RFC 6962 2.1 的递归定义，作为对照
+    if len(leaves) == 1:
+        return leaves[0]
+    k = 1
+    while k * 2 < len(leaves):
+        k *= 2
+    return node_hash(_mth(leaves[:k]), _mth(leaves[k:]))
+
+
+def test_incremental_root_and_proofs_match_reference():
+    leaves = [leaf_hash(f"leaf-{i}".encode()) for i in range(37)]
+    t = MerkleTree()
+    for i, h in enumerate(leaves):
+        t.append_hashes([h])
+        assert t.root() == _mth(leaves[: i + 1])
+    for size in (1, 2, 3, 7, 8, 20, 37):
+        root = t.root(size)
+        assert root == _mth(leaves[:size])
+        for i in range(size):
+            leaf, path = t.proof(i, size)
+            assert leaf == leaves[i] and verify_proof(leaf, path, root)
+            assert len(path) <= size.bit_length()
+    leaf, path = t.proof(5, 20)
+    assert not verify_proof(leaf, path, t.root())
+
+
+def test_anchor_batch_and_proof_endpoint(isolated_db, monkeypatch):
+    calls = []
+    monkeypatch.setattr(main.merkle_ledger, "anchor_fn", lambda root, day, size: calls.append(size) or "0xROOT")
+    certs = [f"mk-{i}" for i in range(5)]
+    try:
+        main.ensure_evidence_table()                      # 建库
+        for c in certs:
+            j = client.get("/api/chain/mock", params={"cert_id": c}).json()
+            assert j["tx"].startswith("merkle:") and j["merkle"]["index"] == certs.index(c)
+
+        p = client.get("/api/merkle/proof", params={"cert_id": "mk-3"}).json()
+        assert p["verified"] and not p["anchored"] and p["size"] == 5
+
+        a = client.post("/api/merkle/anchor").json()
+        assert a["anchored"] and a["anchor"]["size"] == 5 and calls == [5]
+        assert client.post("/api/merkle/anchor").json()["anchored"] is False   # 没有新叶子不重复上链
+
+        client.get("/api/chain/mock", params={"cert_id": "mk-late"})
+        p = client.get("/api/merkle/proof", params={"cert_id": "mk-3"}).json()
+        assert p["anchored"] and p["txid"] == "0xROOT" and p["size"] == 5 and p["verified"]
+        assert p["root"] == a["anchor"]["root"]
+
+        page = client.get("/verify_upgrade/mk-3").text
+        assert "Merkle 日根锚定" in page and "0xROOT" in page
+        assert client.get("/api/merkle/proof", params={"cert_id": "nope"}).status_code == 404
+    finally:
+        for c in certs + ["mk-late"]:
+            client.post("/api/receipts/clear", params={"cert_id": c})
+
+
+def test_two_ledgers_share_one_db(tmp_path):
+    # 两个 worker 各有一份 MerkleLedger，追加同一天的树：下标接着对方的往后排，根与证明都一致
+    a, b = (MerkleLedger(SQLitePool(tmp_path / "m.db")) for _ in range(2))
+    anchored = []
+    a.anchor_fn = b.anchor_fn = lambda root, day, size: anchored.append(size) or "0xTX"
+    day = "2026-01-01"
+    assert a.add("c0", "d0", day) == (day, 0)
+    assert b.add("c1", "d1", day) == (day, 1)
+    assert a.add_many([("c2", "d2"), ("c3", "d3")], day) == (day, 2)
+    assert b.add("c4", "d4", day) == (day, 4)
+    leaves = [leaf_hash(f"c{i}:d{i}".encode()) for i in range(5)]
+    assert a.root(day)["root"] == b.root(day)["root"] == _mth(leaves).hex()
+    assert b.proof_for("c2")["verified"] and a.proof_for("c4")["verified"]
+    assert a.anchor(day)["size"] == 5 and b.anchor(day) is None and anchored == [5]
+    a.pool.close_all()
+    b.pool.close_all()
+
+
+def test_anchor_fn_runs_outside_write_lock(tmp_path):
+    # 链 provider 很慢：等它的时候别的写入方照常写；期间被别的 worker 抢先锚定了就不再重复写记录
+    a, b = (MerkleLedger(SQLitePool(tmp_path / "m.db")) for _ in range(2))
+    other = SQLitePool(tmp_path / "m.db")
+    day = "2026-01-02"
+    a.add_many([(f"c{i}", f"d{i}") for i in range(3)], day)
+
+    def slow_chain(root, day, size):
+        with other.transaction() as conn:
+            conn.execute("PRAGMA busy_timeout = 100")
+            conn.execute("INSERT INTO receipts (cert_id, provider, status, txid, created_at) VALUES ('x','chain','ok','0x','')")
+        b.anchor_fn = lambda *args: "0xB"
+        assert b.anchor(day)["size"] == 3              # 另一个 worker 抢先锚定同一个 size
+        return "0xA"
+
+    a.anchor_fn = slow_chain
+    try:
+        assert a.anchor(day) is None
+        assert [r["txid"] for r in a.anchors(day)] == ["0xB"] and a.root(day)["anchored_size"] == 3
+    finally:
+        for p in (a.pool, b.pool, other):
+            p.close_all()
+
@@ -2,7 +2,7 @@ from fastapi.testclient import TestClient
 from app.main import app
 client = TestClient(app)
 
-def test_health_ok():
+def test_health_ok(isolated_db):
     r = client.get("/health")
     j = r.json()
     assert r.status_code == 200
@@ -18,7 +18,7 @@ def test_health_ok():
 def test_tsa_config():
     assert client.get("/api/tsa/config").status_code == 200
 
-def test_export_and_clear():
+def test_export_and_clear(isolated_db):
     cert="demo-cert"
     for _ in range(5):
         client.get(f"/api/tsa/mock?cert_id={cert}")
@@ -34,7 +34,7 @@ def test_tsa_config_env_override(monkeypatch):
     assert r.status_code == 200
     data = r.json()
     assert data["effective"]["endpoint"] == "http://test.local/api/tsa/mock"
-def test_receipts_export_and_clear(monkeypatch):
+def test_receipts_export_and_clear(isolated_db):
     # 写入两条
     client.get("/api/tsa/mock?cert_id=demo-cert")
     client.get("/api/chain/mock?cert_id=demo-cert")
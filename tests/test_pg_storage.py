@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+app/pg_storage.py：receipts 按月分区、每个分区都有 idx_receipts_cert_time、批量写走 COPY。
+需要 asyncpg 和一次性 PostgreSQL（conftest.pg_dsn），缺哪个就跳过；分区命名的纯函数不依赖数据库。
+运行：
+  py -3 -m pytest -q tests/test_pg_storage.py
+  PG_TEST_DSN=postgresql://postgres@127.0.0.1:5432/postgres py -3 -m pytest -q tests/test_pg_storage.py
+"""
+import pytest
+
+from app import pg_storage
+from app.pg_storage import month_bounds, parse_partition, partition_name
+
+
+def test_partition_names_and_bounds():
+    assert partition_name((2025, 1)) == "receipts_y2025m01"
+    assert parse_partition("receipts_y2025m01") == (2025, 1)
+    assert parse_partition("receipts_default") is None
+    assert month_bounds((2024, 12)) == ("2024-12-01", "2025-01-01")
+
+
+@pytest.fixture
+def pg(pg_dsn):
+    pytest.importorskip("asyncpg")
+    s = pg_storage.PostgresStorage(pg_dsn, min_size=1, max_size=4)
+    s._run(s.pool.execute("TRUNCATE receipts, evidence_meta, cert_records"))
+    yield s
+    s.close()
+
+
+def test_receipts_partitioned_by_month_with_index(pg):
+    rows = [(f"c{i % 4}", "tsa", "ok", f"tx{i}", f"2025-{m:02d}-15 12:00:00")
+            for i, m in enumerate([1, 2, 2, 3] * 50)]
+    copies = []
+    real_copy = pg_storage.asyncpg.Connection.copy_records_to_table
+
+    async def spy(self, table, **kw):
+        copies.append((table, len(kw["records"])))
+        return await real_copy(self, table, **kw)
+
+    pg_storage.asyncpg.Connection.copy_records_to_table = spy
+    try:
+        assert pg.write_batch(evidence=[{"cert_id": "c0", "case_id": "K"}], receipts=rows) == 200
+    finally:
+        pg_storage.asyncpg.Connection.copy_records_to_table = real_copy
+    assert copies == [("receipts", 200)]                                    # 一次 COPY
+
+    parts = {"receipts_y2025m01", "receipts_y2025m02", "receipts_y2025m03"}
+    assert parts <= set(pg.partitions())
+    idx = pg._run(pg.pool.fetch("SELECT tablename, indexdef FROM pg_indexes WHERE tablename = ANY($1::text[])",
+                                sorted(parts)))
+    cert_time = {r["tablename"] for r in idx if "(cert_id, created_at DESC)" in r["indexdef"]}
+    assert cert_time == parts
+    assert pg._run(pg.pool.fetchval("SELECT COUNT(*) FROM receipts_y2025m02")) == 100
+    assert [r["created_at"][:7] for r in pg.recent_receipts("c3", 2)] == ["2025-03", "2025-03"]
+    assert pg.count_receipts() == 200 and len(list(pg.iter_receipts(["c0"]))) == 50
+
+    # 第二个实例（另一个 worker）看到已有分区，不重复建
+    other = pg_storage.PostgresStorage(pg.dsn, min_size=1, max_size=2)
+    try:
+        assert other._months >= {(2025, 1), (2025, 2), (2025, 3)}
+        other.add_receipts([("c9", "chain", "pending", "tx-x", "2025-02-01 00:00:00")])
+    finally:
+        other.close()
+    assert pg.count_receipts("c9") == 1
+
+
+def test_refuses_unpartitioned_receipts(pg, pg_dsn):
+    pg._run(pg.pool.execute("DROP TABLE receipts; CREATE TABLE receipts (id serial primary key, cert_id text)"))
+    try:
+        with pytest.raises(RuntimeError, match="not partitioned"):
+            pg_storage.PostgresStorage(pg_dsn, min_size=1, max_size=1)
+    finally:
+        pg._run(pg.pool.execute("DROP TABLE receipts"))
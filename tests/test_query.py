@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+查询编译器单测：等值 / 子串 / 取反 / OR / 时间范围，以及 LRU 缓存与索引下推。
+运行：
+  py -3 -m pytest -q tests/test_query.py
+"""
+from app.query import compile_query, lower_row
+from app.receipt_store import ReceiptStore
+
+ROWS = [
+    ("c1", {"provider": "tsa", "status": "ok", "txid": "0xA1", "time": "2026-09-30 23:59:59"}),
+    ("c1", {"provider": "chain", "status": "pending", "txid": "0xA2", "time": "2026-10-01 08:00:00"}),
+    ("c2", {"provider": "tsa", "status": "failed", "txid": "0xB1", "time": "2026-10-02T12:00:00"}),
+]
+
+
+def _hits(q):
+    cq = compile_query(q)
+    return [r[1]["txid"] for r in ROWS if cq.match(lower_row(*r))]
+
+
+def test_basic_terms():
+    assert _hits("") == ["0xA1", "0xA2", "0xB1"]
+    assert _hits("provider:TSA") == ["0xA1", "0xB1"]
+    assert _hits("provider:tsa status:ok") == ["0xA1"]
+    assert _hits("0xa") == ["0xA1", "0xA2"]
+    assert _hits("c2") == ["0xB1"]
+
+
+def test_negation_or_and_time_range():
+    assert _hits("-status:failed") == ["0xA1", "0xA2"]
+    assert _hits("status:ok OR status:failed") == ["0xA1", "0xB1"]
+    assert _hits("provider:chain | -provider:tsa") == ["0xA2"]
+    assert _hits("created_at>2026-10-01") == ["0xA2", "0xB1"]
+    assert _hits("created_at>=2026-10-01 created_at<2026-10-02") == ["0xA2"]
+    assert _hits("time<=2026-10-02T12:00:00 provider:tsa") == ["0xA1", "0xB1"]
+
+
+def test_parse_once_and_index_pushdown():
+    assert compile_query("provider:tsa  status:ok") is compile_query("provider:tsa  status:ok")
+    cq = compile_query("provider:tsa -status:failed created_at>2026-10-01")
+    assert cq.index_terms() == {"provider": "tsa"}
+    assert cq.time_range() == ("2026-10-01", None)
+    assert compile_query("provider:tsa OR status:ok").index_terms() == {}
+
+    s = ReceiptStore()
+    for cert_id, item in ROWS:
+        s.append(cert_id, item)
+    got = s.select("", cq.index_terms(), cq.match, cq.time_range())
+    assert [r["txid"] for r in got] == []
+    cq = compile_query("created_at>2026-09-30")
+    got = s.select("", cq.index_terms(), cq.match, cq.time_range())
+    assert [r["txid"] for r in got] == ["0xA1", "0xA2", "0xB1"]
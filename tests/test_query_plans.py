@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+查询计划回归：对 app 下发的每一条 SQL（各模块的 SQL_* 常量 + 动态拼出的 upsert + scripts/ 里的裸 SQL）
+在迁移到最新版本的库上跑 EXPLAIN QUERY PLAN，出现对真实表的 SCAN 就失败。
+本来就要读全表的语句（全量导出 / 全量计数 / 批量核验全部令牌 …）列在 FULL_SCAN_OK 里，写明原因。
+新加的 SQL_* 常量会自动进这里，不用手工登记。
+运行：
+  py -3 -m pytest -q tests/test_query_plans.py
+"""
+import re
+import sqlite3
+
+import pytest
+
+from app import c2pa_jobs, export, merkle, receipt_writer, schema, search, shared_receipts, storage, upgrade25
+
+MODULES = (storage, export, search, shared_receipts, upgrade25, merkle, receipt_writer, c2pa_jobs, schema)
+
+# 有意的全表扫描：语句的语义就是“全部”
+FULL_SCAN_OK = {
+    "SQL_COUNT_RECEIPTS_ALL",       # /health 的总数，走的是最窄的索引
+    "SQL_EXPORT_RECEIPTS_ALL",      # 全量导出
+    "SQL_EXPORT_EVIDENCE_ALL",      # 全量导出（按主键索引顺序流式读）
+    "SQL_VERIFY_TOKENS_ALL",        # 不指定 cert 的批量核验
+    "SQL_COUNT_C2PA_JOBS",          # 按状态计数，覆盖索引
+    "SQL_FTS_EXISTS",               # sqlite_master，只在迁移里跑
+    "SQL_SELECT_APPLIED",           # schema_migrations，几行
+}
+
+# scripts/ 里直接写在代码里的 SQL（db_check.py / clear_demo.py / seed_demo.py）
+SCRIPT_SQL = {
+    "db_check.count_receipts": "SELECT count(*) FROM receipts WHERE cert_id=?",
+    "db_check.count_evidence": "SELECT count(*) FROM evidence WHERE cert_id=?",
+    "clear_demo.delete_receipts": "DELETE FROM receipts WHERE cert_id=?",
+    "clear_demo.delete_evidence": "DELETE FROM evidence WHERE cert_id=?",
+    "seed_demo.exists": "SELECT 1 FROM evidence WHERE cert_id=:cid",
+}
+
+_SKIP = ("CREATE", "DROP", "PRAGMA", "ALTER")
+
+
+def _statements():
+    out = {}
+    for mod in MODULES:
+        for name, sql in vars(mod).items():
+            if name.startswith("SQL_") and isinstance(sql, str) and not sql.lstrip().upper().startswith(_SKIP):
+                out[name] = sql.replace("{marks}", "?,?").replace("{table}", "evidence_fts")
+    meta_cols = tuple(storage.META_FIELDS)
+    out["_upsert_sql(evidence_meta)"] = storage._upsert_sql("evidence_meta", meta_cols, "updated_at")
+    out["_upsert_sql(evidence)"] = storage._upsert_sql("evidence", tuple(storage.EVIDENCE_FIELDS), "created_at")
+    out.update(SCRIPT_SQL)
+    return out
+
+
+STATEMENTS = _statements()
+
+
+@pytest.fixture(scope="module")
+def conn(tmp_path_factory):
+    c = sqlite3.connect(tmp_path_factory.mktemp("plans") / "verify.db")
+    schema.migrate(c)
+    yield c
+    c.close()
+
+
+def _plan(conn, sql):
+    named = re.findall(r":(\w+)", sql)
+    numbered = [int(n) for n in re.findall(r"\?(\d+)", sql)]
+    if named:
+        args = {n: None for n in named}
+    else:
+        args = [None] * (max(numbered) if numbered else sql.count("?"))
+    return [r[3] for r in conn.execute("EXPLAIN QUERY PLAN " + sql, args)]
+
+
+def _table_scans(plan):
+    """SCAN 的对象是真实表（不是子查询 / 常量行 / FTS 虚表）的那些行"""
+    derived = {m.group(1) for line in plan for m in [re.match(r"(?:CO-ROUTINE|MATERIALIZE) (\w+)", line)] if m}
+    bad = []
+    for line in plan:
+        m = re.match(r"SCAN (\w+)", line)
+        if m and m.group(1) not in derived and m.group(1) != "CONSTANT" and "VIRTUAL TABLE" not in line:
+            bad.append(line)
+    return bad
+
+
+def test_statements_collected():
+    assert {"SQL_VERIFY_PAGE", "SQL_COUNT_RECEIPTS_CERT", "SQL_TAIL_RECEIPTS", "SQL_SEARCH_EXACT"} <= set(STATEMENTS)
+    assert FULL_SCAN_OK <= set(STATEMENTS), "FULL_SCAN_OK 里有已经不存在的常量"
+
+
+@pytest.mark.parametrize("name", sorted(STATEMENTS))
+def test_no_table_scan(conn, name):
+    plan = _plan(conn, STATEMENTS[name])
+    bad = _table_scans(plan)
+    if name in FULL_SCAN_OK:
+        assert bad, f"{name} 不再全表扫描了，从 FULL_SCAN_OK 里删掉"
+    else:
+        assert not bad, f"{name} 退化成了全表扫描：{plan}"
+
+
+def test_per_cert_reads_use_covering_indexes(conn):
+    """verify 页 / 按 cert 计数 / 按 cert 导出只读 receipts 的覆盖索引；按案号导出不再临时排序"""
+    for name in ("SQL_VERIFY_PAGE", "SQL_COUNT_RECEIPTS_CERT", "SQL_EXPORT_RECEIPTS_CERT"):
+        plan = " | ".join(_plan(conn, STATEMENTS[name]))
+        assert re.search(r"SEARCH \w+ USING COVERING INDEX idx_receipts_cert_cover", plan), (name, plan)
+    plan = _plan(conn, STATEMENTS["SQL_EXPORT_EVIDENCE_CASE"])
+    assert any("idx_evidence_meta_case_cert" in line for line in plan)
+    assert not any("TEMP B-TREE" in line for line in plan), plan
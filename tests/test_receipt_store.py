@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+ReceiptStore 单测：二级索引、计数、清理后索引一致性。
+运行：
+  py -3 -m pytest -q tests/test_receipt_store.py
+"""
+from app.receipt_store import ReceiptStore
+
+
+def _item(provider, status, txid, t):
+    return {"provider": provider, "status": status, "txid": txid, "time": t}
+
+
+def _seed():
+    s = ReceiptStore()
+    s.append("c1", _item("tsa", "ok", "0xA1", "2026-10-01 10:00:00"))
+    s.append("c1", _item("chain", "pending", "0xA2", "2026-10-01 10:00:01"))
+    s.append("c2", _item("tsa", "ok", "0xB1", "2026-10-01 09:59:59"))
+    s.append("c2", _item("TSA", "failed", "0xB2", "2026-10-01 10:00:02"))
+    return s
+
+
+def test_index_lookup_and_count():
+    s = _seed()
+    assert len(s) == 4
+    assert s.count("c1") == 2
+    assert s.count(eq={"provider": "tsa"}) == 3          # 索引值大小写不敏感
+    assert s.count("c2", {"provider": "tsa", "status": "ok"}) == 1
+    rows = s.select(eq={"txid": "0xa2"})
+    assert [r["cert_id"] for r in rows] == ["c1"]
+    assert rows[0]["created_at"] == "2026-10-01 10:00:01"
+
+
+def test_time_order_and_clear():
+    s = _seed()
+    newest_first = [s.view(rid)["txid"] for rid in s.iter_by_time()]
+    assert newest_first == ["0xB2", "0xA2", "0xA1", "0xB1"]
+
+    assert s.clear("c2") == 2
+    assert s.count(eq={"provider": "tsa"}) == 1
+    assert [s.view(rid)["txid"] for rid in s.iter_by_time(reverse=False)] == ["0xA1", "0xA2"]
+    assert s.clear() == 2 and len(s) == 0
+
+
+def test_trim_expire_and_bytes():
+    s = _seed()
+    base = s.approx_bytes()
+    assert base > 0
+    assert s.trim("c1", 1) == 1 and [r["txid"] for r in s.rows("c1")] == ["0xA2"]     # 留最新的
+    assert s.count(eq={"provider": "tsa"}) == 2 and s.approx_bytes() < base
+    assert s.expire("2026-10-01 10:00:00") == {"c2": 1}
+    assert [r["txid"] for r in s.rows("c2")] == ["0xB2"]
+    assert [s.view(i)["txid"] for i in s.iter_by_time()] == ["0xB2", "0xA2"]
+    s.clear()
+    assert len(s) == 0 and s.approx_bytes() == 0 and s.certs() == []
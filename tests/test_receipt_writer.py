@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+ReceiptWriter 单测：批量落盘、flush 持久性、关闭时排空（关闭后 flush / 并发 submit 不挂住）。
+运行：
+  py -3 -m pytest -q tests/test_receipt_writer.py
+"""
+import threading
+import time
+
+from app.receipt_writer import ReceiptWriter
+from app.sqlite_pool import SQLitePool
+
+
+def _pool(tmp_path):
+    p = SQLitePool(tmp_path / "w.db")
+    with p.transaction(create=True) as c:
+        c.execute("CREATE TABLE receipts (id INTEGER PRIMARY KEY AUTOINCREMENT, cert_id TEXT,"
+                  " provider TEXT, status TEXT, txid TEXT, created_at TEXT)")
+    return p
+
+
+def _count(p):
+    return p.conn().execute("SELECT count(*) FROM receipts").fetchone()[0]
+
+
+def _item(i):
+    return {"provider": "tsa", "status": "ok", "txid": f"0x{i}", "time": "2026-10-01 00:00:00"}
+
+
+def test_batches_and_drain_on_close(tmp_path):
+    p = _pool(tmp_path)
+    flushed = set()
+    w = ReceiptWriter(p, batch_size=100, flush_ms=1000, on_flush=flushed.update)
+    for i in range(250):
+        w.submit(f"c{i % 3}", _item(i))
+    w.close()
+    assert _count(p) == 250
+    assert w.batches >= 3 and w.written == 250
+    assert flushed == {"c0", "c1", "c2"}
+    # 关闭后仍可写（同步退化）
+    w.submit("c9", _item(999))
+    assert _count(p) == 251
+
+
+def test_flush_durability_and_explicit_flush(tmp_path):
+    p = _pool(tmp_path)
+    w = ReceiptWriter(p, batch_size=1000, flush_ms=20, durability="flush")
+    w.submit("c1", _item(1))          # 返回时所在批次已提交
+    assert _count(p) == 1
+
+    w2 = ReceiptWriter(p, batch_size=1000, flush_ms=5000)
+    for i in range(10):
+        w2.submit("c2", _item(i))
+    assert w2.flush(timeout=5)
+    assert _count(p) == 11
+    w.close(); w2.close()
+
+
+def test_flush_after_close_and_submit_racing_close(tmp_path):
+    p = _pool(tmp_path)
+    w = ReceiptWriter(p, flush_ms=5)
+    w.submit("c1", _item(1))
+    w.close()
+    t0 = time.monotonic()
+    assert w.flush() and time.monotonic() - t0 < 1       # 后台线程已退出：立即返回，不再挂住
+
+    # 并发 submit(wait=True) 与 close()：每条要么进了 _STOP 之前的队列，要么走同步写，不会被落下
+    w2 = ReceiptWriter(p, flush_ms=1)
+    start = threading.Barrier(9)
+
+    def producer(k):
+        start.wait()
+        for i in range(50):
+            w2.submit(f"r{k}", _item(i), wait=True)
+
+    threads = [threading.Thread(target=producer, args=(k,)) for k in range(8)]
+    for t in threads:
+        t.start()
+    start.wait()
+    w2.close()
+    for t in threads:
+        t.join(5)
+    assert not any(t.is_alive() for t in threads)
+    assert _count(p) == 1 + 8 * 50 and w2.pending() == 0
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+内存回执保留策略：每 cert 条数上限、按时间过期、总量超限时按 LRU 移出冷 cert，访问时从存储读回。
+运行：
+  py -3 -m pytest -q tests/test_retention.py
+"""
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.receipt_store import ReceiptStore
+from app.retention import Retention, RetentionPolicy
+
+client = TestClient(main.app)
+
+
+def _item(txid, t="2026-10-01 10:00:00"):
+    return {"provider": "tsa", "status": "ok", "txid": txid, "time": t}
+
+
+def test_per_cert_cap_and_age():
+    store = ReceiptStore()
+    r = Retention(RetentionPolicy(max_per_cert=2, max_age_s=3600))
+    old = (datetime.utcnow() - timedelta(hours=2)).strftime("%Y-%m-%d %H:%M:%S")
+    store.append("stale", _item("0xOLD", old))
+    now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+    for i in range(5):
+        store.append("c1", _item(f"0x{i}", now))
+        r.after_write(store, ["c1", "stale"])
+    assert [x["txid"] for x in store.rows("c1")] == ["0x3", "0x4"]
+    assert store.count_cert("stale") == 0
+    st = r.stats(store)
+    assert st["trimmed_rows"] == 3 and st["expired_rows"] == 1 and st["rows"] == 2
+
+
+def test_lru_eviction_and_reload():
+    persisted = {}
+    store = ReceiptStore()
+
+    def persist(timeout=None):
+        for c in store.certs():
+            persisted[c] = store.rows(c)
+
+    r = Retention(RetentionPolicy(max_total=10),
+                  loader=lambda c, limit: [{k: x[k] for k in ("provider", "status", "txid", "time")}
+                                           for x in persisted.get(c, [])][-limit:],
+                  persist=persist)
+    for c in ("hot", "cold", "warm"):
+        for i in range(4):
+            store.append(c, _item(f"{c}-{i}"))
+            r.after_write(store, [c])
+        r.on_access(store, "hot")                 # hot 一直被读，不该被移出
+    st = r.stats(store)
+    assert store.count_cert("cold") == 0 and store.count_cert("hot") == 4
+    assert st["evictions"] == 1 and st["evicted_rows"] == 4 and st["evicted_certs"] == 1
+
+    r.on_access(store, "cold")                    # 透明读回
+    assert [x["txid"] for x in store.rows("cold")] == [f"cold-{i}" for i in range(4)]
+    assert r.stats(store)["reloads"] == 1 and len(store) <= 10
+
+
+def test_no_eviction_when_flush_times_out():
+    store = ReceiptStore()
+    timeouts = []
+    r = Retention(RetentionPolicy(max_total=3), loader=lambda c, limit: [],
+                  persist=lambda timeout: timeouts.append(timeout) or False, persist_timeout=0.5)
+    for i in range(5):
+        store.append(f"c{i}", _item(f"0x{i}"))
+        r.after_write(store, [f"c{i}"])
+    st = r.stats(store)
+    assert len(store) == 5 and st["evictions"] == 0 and st["persist_timeouts"] == 2   # 没落库的不移出
+    assert timeouts == [0.5, 0.5]
+
+
+def test_evicted_without_storage_is_dropped():
+    store = ReceiptStore()
+    r = Retention(RetentionPolicy(max_total=3), durable=lambda: False)
+    for i in range(4):
+        store.append(f"c{i}", _item(f"0x{i}"))
+        r.after_write(store, [f"c{i}"])
+    st = r.stats(store)
+    assert st["dropped_rows"] == 2 and st["evicted_certs"] == 0 and len(store) == 2
+
+
+def test_endpoints_reload_from_sqlite(isolated_db, monkeypatch):
+    main.ensure_evidence_table()
+    retention = Retention(RetentionPolicy(max_total=6), loader=main._reload_receipts,
+                          persist=main.receipt_writer.flush, durable=main.storage.available)
+    monkeypatch.setattr(main, "receipt_retention", retention)
+    main.app.state.receipts = ReceiptStore()
+    try:
+        for cert in ("ret-a", "ret-b", "ret-c"):
+            for _ in range(3):
+                client.get("/api/tsa/mock", params={"cert_id": cert})
+        mem = client.get("/health").json()["receipts_memory"]
+        assert mem["evictions"] >= 1 and mem["rows"] <= 6 and mem["approx_bytes"] > 0
+        assert main.app.state.receipts.count_cert("ret-a") == 0                 # 最冷的被移出
+        assert client.get("/api/receipts/count", params={"cert_id": "ret-a"}).json()["count"] == 3
+        assert client.get("/health").json()["receipts_memory"]["reloads"] == 1
+
+        assert client.post("/api/receipts/clear", params={"cert_id": "ret-b"}).json()["ok"]
+        assert client.get("/api/receipts/count", params={"cert_id": "ret-b"}).json()["count"] == 0
+    finally:
+        main.receipt_writer.flush()
+        main.app.state.receipts = ReceiptStore()
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+RFC3161：TSQ 与 `openssl ts -query` 逐字节一致；能解析 openssl 自建 TSA 签出的 TSR；
+/v1/upgrade25 的 query → submit → verify 全流程不调用 openssl。
+运行：
+  py -3 -m pytest -q tests/test_rfc3161.py
+"""
+import base64
+import hashlib
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import rfc3161
+
+client = TestClient(main.app)
+
+HELLO_SHA256 = hashlib.sha256(b"hello\n").digest()
+OPENSSL_NONCE = 0x9C7C2C0C00D5D493
+# openssl ts -query -data hello.txt -sha256 -cert
+OPENSSL_TSQ = base64.b64decode(
+    "MEQCAQEwMTANBglghkgBZQMEAgEFAAQgWJG1tSLV3whtD/CxEPvZ0hu0/HFjrzTQgoai6Eb2vgMCCQCcfCwMANXUkwEB/w==")
+# openssl ts -reply（自签 TSA 证书，CN=Test TSA,O=Day25；证书在 certificates 里出现两次）
+OPENSSL_TSR = base64.b64decode(
+    "MIIGiDADAgEAMIIGfwYJKoZIhvcNAQcCoIIGcDCCBmwCAQMxDzANBglghkgBZQMEAgEFADCBnwYLKoZIhvcNAQkQAQSggY8E"
+    "gYwwgYkCAQEGBCoDBAEwMTANBglghkgBZQMEAgEFAAQgWJG1tSLV3whtD/CxEPvZ0hu0/HFjrzTQgoai6Eb2vgMCAQIYDzIw"
+    "MjYxMDE3MjMwOTM1WjADAgEBAgkAnHwsDADV1JOgJ6QlMCMxETAPBgNVBAMMCFRlc3QgVFNBMQ4wDAYDVQQKDAVEYXkyNaCC"
+    "BC4wggITMIIBfKADAgECAhQy/B0Dfa+hgUS1uFFejy57OpBVBTANBgkqhkiG9w0BAQsFADAjMREwDwYDVQQDDAhUZXN0IFRT"
+    "QTEOMAwGA1UECgwFRGF5MjUwHhcNMjYxMDE3MjMwOTM1WhcNMzYxMDE0MjMwOTM1WjAjMREwDwYDVQQDDAhUZXN0IFRTQTEO"
+    "MAwGA1UECgwFRGF5MjUwgZ8wDQYJKoZIhvcNAQEBBQADgY0AMIGJAoGBAKhbOFHudP2fX9IBX0M27F5fZ8vgicF+2C3/Tj+E"
+    "cZAy0CU/9k88HY/AmVae1A/Tv8ETxhFuSpv4u98QkJq8AhXXankNIWZXysZTNV07pkGX8x13LeGYDjOKMBXT5g1lkDX0eoeG"
+    "18Dz+TTthCScNKXSNn/mYPUqjYaX1OXHLaUDAgMBAAGjRDBCMBYGA1UdJQEB/wQMMAoGCCsGAQUFBwMIMAkGA1UdEwQCMAAw"
+    "HQYDVR0OBBYEFKwy6cJTwLF3PAL9Krf7l1qX25rxMA0GCSqGSIb3DQEBCwUAA4GBAIATNdn33FEuKJ8Tr3kJQdZ9XT742j0D"
+    "uGgfvPWRzlJ2WnKqbnRe6FvwWxDHnip23egUWh8odiomkyP/0jbwxhcWGZO1luA0IxIwJQLTC1hTvg6btIFpUAip7A9I4hLO"
+    "sFNRbwvMt3RIFGT/l3MHVQdW6vTc542Dr+sUfkdezLN2MIICEzCCAXygAwIBAgIUMvwdA32voYFEtbhRXo8uezqQVQUwDQYJ"
+    "KoZIhvcNAQELBQAwIzERMA8GA1UEAwwIVGVzdCBUU0ExDjAMBgNVBAoMBURheTI1MB4XDTI2MTAxNzIzMDkzNVoXDTM2MTAx"
+    "NDIzMDkzNVowIzERMA8GA1UEAwwIVGVzdCBUU0ExDjAMBgNVBAoMBURheTI1MIGfMA0GCSqGSIb3DQEBAQUAA4GNADCBiQKB"
+    "gQCoWzhR7nT9n1/SAV9DNuxeX2fL4InBftgt/04/hHGQMtAlP/ZPPB2PwJlWntQP07/BE8YRbkqb+LvfEJCavAIV12p5DSFm"
+    "V8rGUzVdO6ZBl/Mddy3hmA4zijAV0+YNZZA19HqHhtfA8/k07YQknDSl0jZ/5mD1Ko2Gl9Tlxy2lAwIDAQABo0QwQjAWBgNV"
+    "HSUBAf8EDDAKBggrBgEFBQcDCDAJBgNVHRMEAjAAMB0GA1UdDgQWBBSsMunCU8CxdzwC/Sq3+5dal9ua8TANBgkqhkiG9w0B"
+    "AQsFAAOBgQCAEzXZ99xRLiifE695CUHWfV0++No9A7hoH7z1kc5Sdlpyqm50Xuhb8FsQx54qdt3oFFofKHYqJpMj/9I28MYX"
+    "FhmTtZbgNCMSMCUC0wtYU74Om7SBaVAIqewPSOISzrBTUW8LzLd0SBRk/5dzB1UHVur03OeNg6/rFH5HXsyzdjGCAYAwggF8"
+    "AgEBMDswIzERMA8GA1UEAwwIVGVzdCBUU0ExDjAMBgNVBAoMBURheTI1AhQy/B0Dfa+hgUS1uFFejy57OpBVBTANBglghkgB"
+    "ZQMEAgEFAKCBmDAaBgkqhkiG9w0BCQMxDQYLKoZIhvcNAQkQAQQwHAYJKoZIhvcNAQkFMQ8XDTI2MTAxNzIzMDkzNVowKwYL"
+    "KoZIhvcNAQkQAgwxHDAaMBgwFgQU/lDjLwngctOeIHz7oElYjn+T0lAwLwYJKoZIhvcNAQkEMSIEIH5f4Z0FLmjlgwTZJBJX"
+    "wEAeyDALajIyzh9KwaSywRdcMA0GCSqGSIb3DQEBAQUABIGAaky2oDSgTptKGJkdYMf/KoPYGqVXylVFXIcX+JCrP6gcraLK"
+    "bCHayGKf/gTVYZKQj8Q4vPUcfGDFqcZg5TOPcPDGu336s+hUxD2FLEaHiUlLAeWHOfi3HzGn6mV6XMrFn7zLfl7KxT3vc6kU"
+    "fG2W60JYqsgm73T5d6nqNPze/bE="
+)
+
+
+def test_tsq_matches_openssl():
+    assert rfc3161.build_tsq(HELLO_SHA256, "sha256", nonce=OPENSSL_NONCE, cert_req=True) == OPENSSL_TSQ
+    q = rfc3161.parse_tsq(OPENSSL_TSQ)
+    assert q["digest"] == HELLO_SHA256 and q["nonce"] == OPENSSL_NONCE and q["cert_req"]
+
+
+def test_parse_openssl_tsr_and_cached_chain():
+    rfc3161.parse_cert_chain.cache_clear()
+    t = rfc3161.parse_tsr(OPENSSL_TSR).as_dict()
+    assert t["status"] == "granted" and t["policy"] == "1.2.3.4.1" and t["serial"] == "2"
+    assert t["gen_time"] == "2026-10-17T23:09:35+00:00" and t["nonce"] == OPENSSL_NONCE
+    assert t["tsa"] == "CN=Test TSA,O=Day25" and t["imprint"] == HELLO_SHA256.hex()
+    assert [c["sha256"][:16] for c in t["certs"]] == ["f78edb745c84eb78"]   # 去重后只剩一张
+    rfc3161.parse_tsr(OPENSSL_TSR)
+    assert rfc3161.parse_cert_chain.cache_info().hits == 1
+
+    assert rfc3161.verify_tsr(OPENSSL_TSR, HELLO_SHA256.hex(), nonce=OPENSSL_NONCE)["ok"]
+    assert rfc3161.verify_tsr(OPENSSL_TSR, "00" * 32)["reason"] == "message imprint mismatch"
+    assert rfc3161.verify_tsr(OPENSSL_TSR, HELLO_SHA256, nonce=1)["reason"] == "nonce mismatch"
+    assert rfc3161.verify_tsr(OPENSSL_TSR[:-5], HELLO_SHA256)["reason"].startswith("malformed")
+
+
+def test_mock_tsr_roundtrip_and_rejection():
+    tsq = rfc3161.build_tsq(hashlib.sha512(b"x").digest(), "sha512", nonce=7)
+    t = rfc3161.parse_tsr(rfc3161.build_tsr(tsq, serial=0xABC, tsa_name="mock"))
+    assert (t.hash_algo, t.serial, t.nonce, t.tsa) == ("sha512", 0xABC, 7, "CN=mock")
+    rejected = rfc3161.der_seq(rfc3161.der_seq(rfc3161.der_int(2)))
+    assert rfc3161.verify_tsr(rejected, b"")["reason"] == "status rejection"
+
+
+def test_malformed_tsr_raises_der_error():
+    for bad in ("30 05 3003020100",            # granted，但没有 timeStampToken
+                "30 00",                       # 空 SEQUENCE
+                "30 02 3000",                  # 空 PKIStatusInfo
+                "30 07 3003020100 3000"):      # 空 timeStampToken
+        try:
+            rfc3161.parse_tsr(bytes.fromhex(bad))
+            raise AssertionError(bad)
+        except rfc3161.DERError:
+            pass
+
+
+def test_malformed_tsq_rejected_with_400():
+    r = rfc3161
+    alg = r.der_seq(r.der_oid(r.HASH_OIDS["sha256"]), r.der(r.T_NULL, b""))
+    bad = [
+        r.der_seq(r.der_int(1)),                                                   # 没有 messageImprint
+        r.der_seq(r.der_int(1), r.der_seq(r.der_seq())),                           # imprint 只有一个元素
+        r.der_seq(r.der_int(1), r.der_seq(r.der_seq(), r.der(r.T_OCTETS, b""))),   # 空 AlgorithmIdentifier
+        r.der_seq(r.der_int(1), r.der_seq(alg, r.der(r.T_OCTETS, b"\0" * 31))),    # 摘要长度不对
+        r.der_seq(r.der_int(1), r.der_seq(alg, r.der(r.T_OCTETS, b"\0" * 32)), r.der(r.T_BOOL, b"")),   # 空 BOOLEAN
+    ]
+    for tsq in bad:
+        try:
+            r.parse_tsq(tsq)
+            raise AssertionError(tsq.hex())
+        except r.DERError:
+            pass
+        assert client.post("/api/tsa/mock", content=tsq).status_code == 400
+    for chain in ("3000", "30023000", "30053003020100"):                        # 缺字段的证书
+        try:
+            r.parse_cert_chain(bytes.fromhex(chain))
+            raise AssertionError(chain)
+        except r.DERError:
+            pass
+
+
+def test_upgrade25_query_submit_verify(isolated_db, tmp_path):
+    asset = tmp_path / "asset.bin"
+    asset.write_bytes(b"asset-bytes")
+    cert = "tsr-cert"
+    try:
+        assert client.post("/api/evidence/hash", json={"cert_id": cert, "file_path": str(asset)}).json()["ok"]
+        q = client.post("/v1/upgrade25/tsa/query", json={"file_path": str(asset)}).json()
+        assert q["digest"] == hashlib.sha256(b"asset-bytes").hexdigest()
+
+        tsr = rfc3161.build_tsr(base64.b64decode(q["tsq_b64"]), serial=42)
+        s = client.post("/v1/upgrade25/tsa/submit",
+                        json={"cert_id": cert, "tsr_b64": base64.b64encode(tsr).decode(), "tsq_b64": q["tsq_b64"]}).json()
+        assert s["ok"] and s["verified"] and s["token"]["serial"] == "2a"
+        assert client.get(f"/v1/upgrade25/tsa/token/{cert}").json()["token"]["nonce"] == q["nonce"]
+        main.receipt_writer.flush()           # 回执历史是后台批量落盘的
+        assert "tsr:2a" in client.get(f"/verify_upgrade/{cert}").text
+
+        # 别的 cert 的回执不能挂到这张证书上
+        other = client.post("/v1/upgrade25/tsa/submit",
+                            json={"cert_id": cert, "tsr_b64": base64.b64encode(OPENSSL_TSR).decode()})
+        assert other.status_code == 422
+        for bad in ("30053003020100", "3000"):       # 只有 granted 状态 / 空结构：400，不落库
+            r = client.post("/v1/upgrade25/tsa/submit",
+                            json={"cert_id": "tsr-empty", "tsr_b64": base64.b64encode(bytes.fromhex(bad)).decode()})
+            assert r.status_code == 400
+
+        v = client.post("/v1/upgrade25/tsa/verify", json={}).json()
+        assert (v["total"], v["verified"], v["failed"]) == (1, 1, 0)
+        main.sqlite_pool.conn().execute("UPDATE evidence SET sha256 = ? WHERE cert_id = ?", ("00" * 32, cert))
+        main.sqlite_pool.conn().commit()
+        v = client.post("/v1/upgrade25/tsa/verify", json={"cert_ids": [cert]}).json()
+        assert v["failed"] == 1 and v["failures"][0]["reason"] == "message imprint mismatch"
+    finally:
+        client.post("/api/receipts/clear", params={"cert_id": cert})
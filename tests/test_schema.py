@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+表结构迁移（app/schema.py）：版本记在 schema_migrations，每个版本只跑一次；老库补记版本不丢数据；
+请求路径上没有 DDL / 写事务。app/db.py 的 init_db 只补表补列，不再 drop_all。
+运行：
+  py -3 -m pytest -q tests/test_schema.py
+"""
+import sqlite3
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+import app.main as main
+from app import db as models
+from app import schema
+from app.sqlite_pool import SQLitePool
+
+client = TestClient(main.app)
+
+
+def _indexes(conn, table):
+    return {r[1] for r in conn.execute(f"PRAGMA index_list({table})")}
+
+
+def test_fresh_db_gets_every_version_once(tmp_path, monkeypatch):
+    pool = SQLitePool(tmp_path / "v.db")
+    schema.attach(pool)
+    schema.attach(pool)                                   # 重复 attach 不会重复挂钩子
+    try:
+        conn = pool.conn(create=True)
+        versions = [v for v, _, _ in schema._migrations()]
+        assert [r[0] for r in conn.execute("SELECT version FROM schema_migrations ORDER BY version")] == versions
+        assert schema.status(conn) == {"version": versions[-1], "pending": []}
+        assert _indexes(conn, "receipts") == {"idx_receipts_cert_cover"}           # v2 的窄索引被 v9 取代
+        assert "idx_evidence_meta_case_cert" in _indexes(conn, "evidence_meta")
+
+        # 之后的新连接只读版本表，不再进迁移
+        monkeypatch.setattr(schema, "migrate", lambda c: pytest.fail("migrated twice"))
+        other = SQLitePool(tmp_path / "v.db")
+        schema.attach(other)
+        other.conn()
+        other.close_all()
+    finally:
+        pool.close_all()
+
+
+def test_legacy_db_keeps_data(tmp_path):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)                          # 迁移子系统之前的库：有表有数据，没有版本表
+    conn.execute("CREATE TABLE receipts (id INTEGER PRIMARY KEY AUTOINCREMENT, cert_id TEXT NOT NULL, "
+                 "provider TEXT, status TEXT, txid TEXT, created_at TEXT)")
+    conn.execute("CREATE TABLE evidence_meta (cert_id TEXT PRIMARY KEY, case_id TEXT, title TEXT, owner TEXT, "
+                 "source TEXT, notes TEXT, updated_at TEXT)")
+    conn.execute("INSERT INTO receipts (cert_id, provider, status, txid) VALUES ('old', 'tsa', 'ok', '0xOLDTX')")
+    conn.execute("INSERT INTO evidence_meta (cert_id, case_id, title) VALUES ('old', 'CASE-OLD', '旧卷宗')")
+    conn.commit()
+    conn.close()
+
+    pool = SQLitePool(path)
+    schema.attach(pool)
+    try:
+        c = pool.conn()
+        assert c.execute("SELECT txid FROM receipts").fetchall() == [("0xOLDTX",)]
+        assert not schema.pending(c) and "idx_receipts_cert_cover" in _indexes(c, "receipts")
+        from app.storage import SQLiteStorage
+        assert SQLiteStorage(pool).search("旧卷宗")[0][0][0] == "old"              # FTS 补建并灌了老数据
+        assert schema.migrate(c) == []
+    finally:
+        pool.close_all()
+
+
+def test_request_path_has_no_ddl(isolated_db, monkeypatch):
+    seen = []
+
+    def trace(stmt):
+        # 回执后台写入线程不在请求路径上（别的用例 exec 出来的 app 模块也各有一个，会晚到）
+        if threading.current_thread().name != "receipt-writer":
+            seen.append(stmt)
+
+    monkeypatch.setattr(main.sqlite_pool, "on_connect",
+                        [lambda c: c.set_trace_callback(trace), *main.sqlite_pool.on_connect])
+    main.ensure_evidence_table()
+    client.post("/api/evidence/update", json={"cert_id": "sch-1", "case_id": "S", "title": "t"})
+    client.get("/verify_upgrade/sch-1")
+    assert any(s.lstrip().upper().startswith("CREATE") for s in seen)       # 第一次连接时迁移
+    seen.clear()
+    main.verify_cache.clear()
+    assert client.get("/verify_upgrade/sch-1").status_code == 200
+    assert client.get("/health").json()["db"]["schema"]["pending"] == []
+    writes = [s for s in seen if s.lstrip().upper().startswith(("CREATE", "INSERT", "UPDATE", "BEGIN"))]
+    assert writes == []
+
+
+def test_init_db_adds_columns_without_dropping(tmp_path):
+    eng = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with eng.begin() as conn:                              # 老版本的 cert_records：缺 sha256 等列
+        conn.execute(text("CREATE TABLE cert_records (id INTEGER PRIMARY KEY, cert_id VARCHAR(255) UNIQUE NOT NULL)"))
+        conn.execute(text("INSERT INTO cert_records (cert_id) VALUES ('keep-me')"))
+    models.init_db(eng)
+    models.init_db(eng)                                    # 再跑一次什么都不做
+    with eng.connect() as conn:
+        assert conn.execute(text("SELECT cert_id, sha256 FROM cert_records")).fetchall() == [("keep-me", None)]
+        assert conn.execute(text("SELECT COUNT(*) FROM receipts")).scalar() == 0
+    eng.dispose()
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+全文检索（app/search.py）：FTS5 随 evidence_meta / receipts 的写入增量更新，/api/search 与 Vault 检索框。
+运行：
+  py -3 -m pytest -q tests/test_search.py
+"""
+import sqlite3
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import search
+from app.sqlite_pool import SQLitePool
+from app.storage import SQLiteStorage
+
+client = TestClient(main.app)
+
+
+def test_endpoints_keep_index_current(isolated_db):
+    client.post("/api/evidence/update", json={"cert_id": "fts-1", "case_id": "京仲-2026-118",
+                                              "title": "采购合同原件", "owner": "alice"})
+    client.post("/api/evidence/update", json={"cert_id": "fts-2", "case_id": "京仲-2026-119",
+                                              "title": "聊天记录截图"})
+    res = client.get("/api/search", params={"q": "京仲-2026"}).json()
+    assert res["ok"] and {r["cert_id"] for r in res["rows"]} == {"fts-1", "fts-2"}
+    assert client.get("/api/search", params={"q": "合同 alice"}).json()["rows"][0]["title"] == "采购合同原件"
+
+    # 改标题：旧词不再命中，新词命中
+    client.post("/api/evidence/update", json={"cert_id": "fts-1", "case_id": "京仲-2026-118", "title": "补充协议"})
+    assert client.get("/api/search", params={"q": "采购合同"}).json()["rows"] == []
+    assert client.get("/api/search", params={"q": "补充协议"}).json()["rows"][0]["cert_id"] == "fts-1"
+
+    # 回执：txid 前缀，刚入队的也能搜到
+    tx = client.get("/api/tsa/mock", params={"cert_id": "fts-2"}).json()["tx"]
+    row = client.get("/api/search", params={"q": tx[:-4]}).json()["rows"][0]
+    assert row["cert_id"] == "fts-2" and row["matched"] == ["receipts"] and row["case_id"] == "京仲-2026-119"
+
+    page = client.get("/vault", params={"s": "聊天记录"}).text
+    assert 'href="/vault?cert_id=fts-2"' in page and "京仲-2026-119" in page
+    assert "没有找到" in client.get("/vault", params={"s": "没有这个词"}).text
+
+
+def test_index_built_for_existing_rows(tmp_path):
+    path = tmp_path / "old.db"
+    conn = sqlite3.connect(path)                          # 升级前的库：只有源表，没有 FTS
+    conn.execute("CREATE TABLE evidence_meta (cert_id TEXT PRIMARY KEY, case_id TEXT, title TEXT, owner TEXT, "
+                 "source TEXT, notes TEXT, updated_at TEXT)")
+    conn.executemany("INSERT INTO evidence_meta (cert_id, case_id, title) VALUES (?, ?, ?)",
+                     [(f"old-{i}", f"CASE-{i:04d}", f"历史卷宗 {i}") for i in range(50)])
+    conn.commit()
+    conn.close()
+
+    pool = SQLitePool(path)
+    store = SQLiteStorage(pool)
+    try:
+        hits, more = store.search("CASE-0042")
+        assert [h[0] for h in hits] == ["old-42"] and not more
+        assert len(store.search("历史卷宗", limit=10)[0]) == 10 and store.search("历史卷宗", limit=10)[1]
+        search.rebuild_search_index(pool.conn())
+        assert store.search("CASE-0042")[0][0][0] == "old-42"
+    finally:
+        pool.close_all()
+
+
+def test_query_building():
+    assert search.meta_match('ab 案卷号 "x"y') == '"案卷号" AND """x""y"'      # 短词跳过，引号转义
+    assert search.meta_match("ab") is None
+    assert search.receipt_match("0xab - tsa") == '"0xab" * AND "tsa" *'
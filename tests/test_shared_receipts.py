@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+多 worker 共享回执：各进程按 receipts.id 追尾同一个 SQLite（WAL），清空经 receipt_clears 重放。
+“另一个 worker”用独立的 SQLitePool（独立连接，等同另一个进程）或真正的子进程模拟。
+运行：
+  py -3 -m pytest -q tests/test_shared_receipts.py
+"""
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.merkle import MerkleLedger
+from app.receipt_writer import ReceiptWriter
+from app.shared_receipts import SharedReceipts
+from app.sqlite_pool import SQLitePool
+from app.storage import SQLiteStorage
+
+client = TestClient(main.app)
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def _worker(path):
+    """一个 worker 的全套：自己的连接池 / 写入器 / 共享回执副本"""
+    pool = SQLitePool(path)
+    SQLiteStorage(pool)                       # 注册建表钩子
+    writer = ReceiptWriter(pool, flush_ms=5)
+    shared = SharedReceipts(pool, lambda c, i: writer.submit(c, i, wait=True))
+    return pool, writer, shared
+
+
+def _item(txid, provider="tsa"):
+    return {"provider": provider, "status": "ok", "txid": txid, "time": "2025-01-01 00:00:00"}
+
+
+def test_workers_see_each_others_receipts_and_clears(tmp_path):
+    (pa, wa, a), (pb, wb, b) = _worker(tmp_path / "v.db"), _worker(tmp_path / "v.db")
+    try:
+        for i in range(3):
+            a.append("c1", _item(f"a{i}"))
+        b.append("c2", _item("b0", "chain"))                                   # 写完追尾，顺带拿到 a 的
+        assert b.store.count_cert("c1") == 3
+        assert a.store.count_cert("c2") == 0 and a.sync() == {"c2"}            # a 下次读时才追到
+        assert len(a.store) == len(b.store) == 4
+
+        assert b.clear("c1") == 3
+        a.append("c1", _item("a-after"))                                       # 清空之后的回执保留
+        a.sync(), b.sync()
+        assert [r["txid"] for r in a.store.rows("c1")] == [r["txid"] for r in b.store.rows("c1")] == ["a-after"]
+        assert a.clear() == 2 and b.sync() == {None} and len(b.store) == 0
+
+        # 新 worker 冷启动：从头重放，结果与存量 worker 一致
+        pc, wc, c = _worker(tmp_path / "v.db")
+        c.sync()
+        assert len(c.store) == 0 and c.stats()["last_id"] == a.stats()["last_id"]
+        wc.close(), pc.close_all()
+    finally:
+        for w, p in ((wa, pa), (wb, pb)):
+            w.close()
+            p.close_all()
+
+
+def test_anchor_by_another_worker_invalidates_pages(tmp_path):
+    (pa, wa, a), (pb, wb, b) = _worker(tmp_path / "v.db"), _worker(tmp_path / "v.db")
+    la, lb = MerkleLedger(pa), MerkleLedger(pb)
+    try:
+        lb.add("c1", "d1")
+        la.add("c2", "d2")                                                     # 下标接着 b 的往后排
+        a.sync(), b.sync()
+        assert la.anchor()["size"] == 2
+        assert b.sync() == {None}                                              # 一批 cert 同时变成已锚定
+        assert b.sync() == set() and lb.proof_for("c1")["anchored"]
+    finally:
+        for w, p in ((wa, pa), (wb, pb)):
+            w.close()
+            p.close_all()
+
+
+def test_receipts_written_by_another_process(tmp_path):
+    path = tmp_path / "v.db"
+    pool, writer, shared = _worker(path)
+    try:
+        shared.sync()
+        script = textwrap.dedent(f"""
+            import sys; sys.path.insert(0, {str(ROOT)!r})
+            from tests.test_shared_receipts import _worker, _item
+            pool, writer, shared = _worker({str(path)!r})
+            for i in range(50):
+                shared.append("proc-" + str(i % 5), _item("p" + str(i)))
+            shared.clear("proc-0")
+            writer.close()
+        """)
+        subprocess.run([sys.executable, "-c", script], check=True, cwd=ROOT, timeout=60)
+        changed = shared.sync()
+        assert {f"proc-{i}" for i in range(5)} <= changed
+        assert len(shared.store) == 40 and shared.store.count_cert("proc-0") == 0
+    finally:
+        writer.close()
+        pool.close_all()
+
+
+def test_endpoints_in_shared_mode(isolated_db, monkeypatch):
+    shared = SharedReceipts(main.sqlite_pool, lambda c, i: main.receipt_writer.submit(c, i, wait=True),
+                            on_change=lambda certs: [main._invalidate_cert(c) for c in certs])
+    monkeypatch.setattr(main, "shared_receipts", shared)
+    pool, writer, other = _worker(isolated_db)
+    try:
+        client.get("/api/tsa/mock", params={"cert_id": "sh-1"})
+        assert client.get("/api/receipts/count", params={"cert_id": "sh-1"}).json()["count"] == 1   # 读自己写的
+
+        page = client.get("/verify_upgrade/sh-1").text
+        other.append("sh-1", _item("0xFROM_OTHER_WORKER", "chain"))
+        assert client.get("/api/receipts/count", params={"cert_id": "sh-1"}).json()["count"] == 2
+        fresh = client.get("/verify_upgrade/sh-1").text                                      # 缓存已失效
+        assert fresh != page and "0xFROM_OTHER_WORKER" in fresh
+        assert client.get("/health").json()["receipts_shared"]["rows"] == 2
+
+        assert client.post("/api/receipts/clear", params={"cert_id": "sh-1"}).json()["cleared"] == 2
+        other.sync()
+        assert other.store.count_cert("sh-1") == 0
+    finally:
+        writer.close()
+        pool.close_all()
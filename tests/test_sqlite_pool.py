@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+SQLitePool 单测：线程内复用、WAL、文件不存在时不创建。
+运行：
+  py -3 -m pytest -q tests/test_sqlite_pool.py
+"""
+import threading
+
+from app.sqlite_pool import SQLitePool
+
+
+def test_missing_file_not_created(tmp_path):
+    p = SQLitePool(tmp_path / "none.db")
+    assert p.conn() is None
+    with p.transaction() as c:
+        assert c is None
+    assert not (tmp_path / "none.db").exists()
+
+
+def test_reuse_per_thread_and_pragmas(tmp_path):
+    p = SQLitePool(tmp_path / "x.db")
+    c1 = p.conn(create=True)
+    assert p.conn() is c1
+    assert c1.execute("PRAGMA journal_mode").fetchone()[0].lower() == "wal"
+    assert c1.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+    with p.transaction() as c:
+        c.execute("CREATE TABLE t (v INTEGER)")
+        c.execute("INSERT INTO t VALUES (1)")
+
+    other = {}
+    t = threading.Thread(target=lambda: other.setdefault("c", p.conn()))
+    t.start(); t.join()
+    assert other["c"] is not c1
+    assert other["c"].execute("SELECT count(*) FROM t").fetchone()[0] == 1
+    p.close_all()
+
+
+def test_close_all_defers_connection_in_transaction(tmp_path):
+    p = SQLitePool(tmp_path / "y.db")
+    inside, release, seen = threading.Event(), threading.Event(), {}
+
+    def writer():
+        with p.transaction(create=True) as c:
+            c.execute("CREATE TABLE t (v INTEGER)")
+            inside.set()
+            release.wait(5)
+            c.execute("INSERT INTO t VALUES (1)")   # close_all 之后仍在用这条连接
+            seen["c"] = c
+        seen["after"] = p.conn()
+
+    t = threading.Thread(target=writer)
+    t.start()
+    assert inside.wait(5)
+    p.close_all()
+    release.set()
+    t.join()
+    assert seen["after"] is not seen["c"]                   # 事务结束后旧连接已关，再取是新的
+    assert seen["after"].execute("SELECT v FROM t").fetchall() == [(1,)]
+    p.close_all()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+app/storage.py：同一组用例跑 memory / sqlite / sqlalchemy（指向临时 sqlite 文件）/ postgres（asyncpg，
+一次性实例，见 conftest.pg_dsn；没有 postgres 时跳过）四种实现，
+外加 main 按 STORAGE_BACKEND 切换后端后端点行为不变。
+运行：
+  py -3 -m pytest -q tests/test_storage.py
+"""
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import storage as st
+from app.query import compile_query
+from app.sqlite_pool import SQLitePool
+
+
+def _pg_storage(dsn):
+    pytest.importorskip("asyncpg")
+    from app.pg_storage import PostgresStorage
+    s = PostgresStorage(dsn, min_size=1, max_size=4)
+    s._run(s.pool.execute("TRUNCATE receipts, evidence_meta, cert_records"))
+    return s
+
+
+@pytest.fixture(params=["memory", "sqlite", "sqlalchemy", "postgres"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        s = st.MemoryStorage()
+    elif request.param == "sqlite":
+        pool = SQLitePool(tmp_path / "store.db")
+        s = st.SQLiteStorage(pool)
+        pool.conn(create=True)          # 建库是显式动作（启动迁移 / 保存证据 / 批量登记）
+    elif request.param == "sqlalchemy":
+        s = st.SQLAlchemyStorage(f"sqlite:///{tmp_path / 'sa.db'}")
+    else:
+        s = _pg_storage(request.getfixturevalue("pg_dsn"))
+    yield s
+    s.close()
+    if request.param == "sqlite":
+        pool.close_all()
+
+
+def test_write_batch_and_reads(store):
+    store.write_batch(
+        evidence=[{"cert_id": "c1", "file_path": "/a.bin", "sha256": "aa" * 32, "case_id": "K", "title": "A"},
+                  {"cert_id": "c2", "sha256": "bb" * 32}],
+        receipts=[("c1", "chain", "pending", f"tx{i}", f"2025-01-0{i + 1} 00:00:00") for i in range(3)]
+                 + [("c2", "tsa", "ok", "tsr:1", "2025-01-09 00:00:00")])
+    assert store.count_receipts() == 4 and store.count_receipts("c1") == 3
+    assert [r["txid"] for r in store.recent_receipts("c1", 2)] == ["tx2", "tx1"]      # 新的在前
+
+    ev, hist = store.page_view("c1", 5)
+    assert ev["sha256"] == "aa" * 32 and ev["case_id"] == "K" and ev["title"] == "A"
+    assert [h["txid"] for h in hist] == ["tx2", "tx1", "tx0"]
+    assert store.page_view("nope") == (None, [])
+
+    # 只写给出的字段：补 notes 不清掉 title / sha256
+    store.upsert_evidence([{"cert_id": "c1", "notes": "n"}])
+    ev = store.get_evidence("c1")
+    assert ev["notes"] == "n" and ev["title"] == "A" and ev["sha256"] == "aa" * 32
+    assert set(store.get_evidence_many(["c1", "c2", "c3"])) == {"c1", "c2"}
+    assert store.cert_ids_for_case("K") == ["c1"]
+
+
+def test_sqlite_receipts_do_not_create_db(tmp_path):
+    from app.receipt_writer import ReceiptWriter
+    pool = SQLitePool(tmp_path / "late.db")
+    s = st.SQLiteStorage(pool)
+    w = ReceiptWriter(pool, sink=s.add_receipts)
+    try:
+        assert s.add_receipts([("c1", "tsa", "ok", "tx", "2025-01-01 00:00:00")]) == 0
+        w.submit("c1", {"provider": "tsa", "status": "ok", "txid": "tx2"}, wait=True)
+        assert not (tmp_path / "late.db").exists() and w.written == 0 and w.dropped == 1
+        s.upsert_evidence([{"cert_id": "c1", "title": "t"}])           # 保存证据照常建库
+        assert (tmp_path / "late.db").exists() and s.add_receipts([("c1", "tsa", "ok", "tx", "")]) == 1
+    finally:
+        w.close()
+        pool.close_all()
+
+
+def test_iter_receipts_and_evidence(store):
+    store.write_batch(evidence=[{"cert_id": f"c{i}", "case_id": "K", "title": f"t{i}"} for i in range(3)],
+                      receipts=[(f"c{i % 3}", "tsa" if i % 2 else "chain", "ok", f"tx{i}", "2025-01-01 00:00:00")
+                                for i in range(9)])
+    rows = list(store.iter_receipts())
+    assert len(rows) == 9 and rows[0][:2] == ("c0", "K") and rows[0][6] == "tx0"
+    assert [r[6] for r in store.iter_receipts(["c1"])] == ["tx1", "tx4", "tx7"]
+    assert {r[4] for r in store.iter_receipts(None, compile_query("provider:tsa"))} == {"tsa"}
+    ev = list(store.iter_evidence("K"))
+    assert [r[0] for r in ev] == ["c0", "c1", "c2"] and ev[0][2] == "t0"
+
+
+def test_search_ranks_business_fields(store):
+    store.write_batch(evidence=[{"cert_id": "s1", "case_id": "沪民初-2025-0042", "title": "合同扫描件"},
+                                {"cert_id": "s2", "case_id": "K-7", "title": "沪民初案卷目录", "notes": "合同"},
+                                {"cert_id": "s3", "case_id": "K-8", "title": "照片"}])
+    hits, more = store.search("沪民初")
+    assert [h[0] for h in hits] == ["s1", "s2"] and not more                         # 案号命中排在标题前
+    assert [h[0] for h in store.search("合同扫描")[0]] == ["s1"]
+    assert store.search("s3")[0][0][0] == "s3"                                       # cert_id 精确命中
+    assert store.search("不存在的词") == ([], False)
+    assert [h[0] for h in store.search("沪民初", limit=1, offset=1)[0]] == ["s2"]
+
+
+def test_main_endpoints_on_memory_backend(isolated_db, monkeypatch):
+    monkeypatch.setattr(main, "storage", st.MemoryStorage())
+    monkeypatch.setattr(main.receipt_writer, "sink", main.storage.add_receipts)
+    main.verify_cache.clear()
+    client = TestClient(main.app)
+    try:
+        client.post("/api/evidence/update", json={"cert_id": "mem-1", "case_id": "MEM", "title": "内存"})
+        client.get("/api/tsa/mock", params={"cert_id": "mem-1"})
+        main.receipt_writer.flush()
+        assert main.storage.count_receipts("mem-1") == 1
+        assert client.get("/health").json()["db"]["storage"] == "memory"
+        page = client.get("/verify_upgrade/mem-1").text
+        assert "内存" in page and "MEM" in page
+        export = client.get("/api/receipts/export",
+                            params={"case_id": "MEM", "source": "store", "format": "ndjson"}).text
+        assert '"mem-1"' in export and '"MEM"' in export
+    finally:
+        client.post("/api/receipts/clear", params={"cert_id": "mem-1"})
+        main.verify_cache.clear()
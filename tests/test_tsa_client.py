@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+"""
+异步 TSA 客户端：重试 / 熔断 / 并发上限 / 并发 ping；以 /api/tsa/mock 作为本地 TSA 替身。
+运行：
+  py -3 -m pytest -q tests/test_tsa_client.py
+"""
+import asyncio
+import base64
+import hashlib
+
+import httpx
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app import rfc3161, tsa_client
+from app.tsa_client import CircuitOpenError, TSAClient, TSAError
+
+client = TestClient(main.app)
+MOCK = "http://testserver/api/tsa/mock"
+
+
+def _tsq():
+    return rfc3161.build_tsq(hashlib.sha256(b"doc").digest(), "sha256", nonce=99)
+
+
+def test_submit_against_local_mock():
+    async def run():
+        c = TSAClient(MOCK, transport=httpx.ASGITransport(app=main.app))
+        try:
+            return await asyncio.gather(*(c.submit(_tsq()) for _ in range(5)))
+        finally:
+            await c.aclose()
+    tsrs = asyncio.run(run())
+    assert all(rfc3161.verify_tsr(t, hashlib.sha256(b"doc").digest(), nonce=99)["ok"] for t in tsrs)
+    assert len({rfc3161.parse_tsr(t).serial for t in tsrs}) == 5
+
+
+def test_retry_backoff_and_no_retry_on_4xx():
+    calls = []
+
+    def flaky(request):
+        calls.append(request.url.path)
+        if request.url.path == "/bad":
+            return httpx.Response(400)
+        return httpx.Response(503) if len(calls) < 3 else httpx.Response(200, content=b"TSR")
+
+    async def run():
+        c = TSAClient("http://tsa/ok", retries=3, backoff=0.001, transport=httpx.MockTransport(flaky))
+        assert await c.submit(b"q") == b"TSR"
+        assert len(calls) == 3
+        try:
+            await c.submit(b"q", "http://tsa/bad")
+        except TSAError as e:
+            assert e.status == 400
+        assert calls.count("/bad") == 1
+        await c.aclose()
+    asyncio.run(run())
+
+
+def test_circuit_breaker_opens_and_half_opens():
+    state = {"up": False, "calls": 0}
+
+    def handler(request):
+        state["calls"] += 1
+        return httpx.Response(200, content=b"ok") if state["up"] else httpx.Response(500)
+
+    async def run():
+        c = TSAClient("http://tsa/x", retries=0, breaker_threshold=2, breaker_reset=0.05,
+                      transport=httpx.MockTransport(handler))
+        for _ in range(2):
+            try:
+                await c.submit(b"q")
+            except TSAError:
+                pass
+        try:
+            await c.submit(b"q")
+            raise AssertionError("breaker should be open")
+        except CircuitOpenError:
+            pass
+        assert state["calls"] == 2 and c.breaker("http://tsa/x").state == "open"
+        await asyncio.sleep(0.06)
+        state["up"] = True
+        assert await c.submit(b"q") == b"ok"                      # half-open 探测成功 → closed
+        assert c.breaker("http://tsa/x").state == "closed"
+        await c.aclose()
+    asyncio.run(run())
+
+
+def test_cancelled_probe_releases_half_open_breaker():
+    async def handler(request):
+        await asyncio.sleep(1.0)
+        return httpx.Response(200, content=b"ok")
+
+    async def run():
+        c = TSAClient("http://tsa/x", retries=0, breaker_reset=0.0, transport=httpx.MockTransport(handler))
+        b = c.breaker("http://tsa/x")
+        b.opened_at = 0.0                                      # 直接进 half_open
+        probe = asyncio.ensure_future(c.submit(b"q"))
+        await asyncio.sleep(0.01)
+        assert not b.allow()                                  # 探测进行中，别的请求不放行
+        probe.cancel()                                        # 被对冲取消
+        await asyncio.gather(probe, return_exceptions=True)
+        assert b.state == "half_open" and b.allow()           # 名额已让出，下一个探测能发
+        assert len(c.stats("http://tsa/x")) == 0
+        await c.aclose()
+    asyncio.run(run())
+
+
+def test_per_endpoint_concurrency_cap():
+    live = {"now": 0, "peak": 0}
+
+    async def slow(request):
+        live["now"] += 1
+        live["peak"] = max(live["peak"], live["now"])
+        await asyncio.sleep(0.01)
+        live["now"] -= 1
+        return httpx.Response(200, content=b"ok")
+
+    async def run():
+        c = TSAClient("http://tsa/x", per_endpoint=2, transport=httpx.MockTransport(slow))
+        await asyncio.gather(*(c.submit(b"q") for _ in range(10)))
+        await c.aclose()
+    asyncio.run(run())
+    assert live["peak"] == 2
+
+
+def test_ping_returns_first_success_concurrently():
+    async def handler(request):
+        if request.url.host == "slow":
+            await asyncio.sleep(1.0)
+            return httpx.Response(200)
+        return httpx.Response(200 if request.url.host == "fast" else 404)
+
+    async def run():
+        c = TSAClient(transport=httpx.MockTransport(handler))
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        hit = await c.ping(["http://slow/", "http://down/", "http://fast/"], timeout=2.0)
+        assert hit == {"url": "http://fast/", "status": 200} and loop.time() - t0 < 0.5
+        assert await c.ping(["http://down/"]) is None
+        await c.aclose()
+    asyncio.run(run())
+
+
+def test_stamp_endpoint_uses_async_client(isolated_db, tmp_path, monkeypatch):
+    monkeypatch.setattr(tsa_client, "client", TSAClient(MOCK, transport=httpx.ASGITransport(app=main.app)))
+    monkeypatch.delenv("TSA_ENDPOINT", raising=False)
+    asset = tmp_path / "a.bin"
+    asset.write_bytes(b"stamp me")
+    try:
+        r = client.post("/v1/upgrade25/tsa/stamp", json={"cert_id": "stamp-cert", "file_path": str(asset)})
+        j = r.json()
+        assert r.status_code == 200 and j["ok"] and j["token"]["imprint"] == hashlib.sha256(b"stamp me").hexdigest()
+        assert j["token"]["tsa"] == "CN=verify-upgrade mock TSA"
+        assert client.get("/v1/upgrade25/tsa/token/stamp-cert").json()["ok"]
+        ssrf = client.post("/v1/upgrade25/tsa/stamp", json={"cert_id": "stamp-cert", "digest": "00" * 32,
+                                                             "endpoint": "http://169.254.169.254/latest"})
+        assert ssrf.status_code == 400 and "TSA_ENDPOINTS" in ssrf.json()["error"]
+
+        bad = client.post("/api/tsa/mock", content=b"not der")
+        assert bad.status_code == 400
+        tsr = client.post("/api/tsa/mock", content=_tsq()).content
+        assert base64.b64encode(tsr) and rfc3161.parse_tsr(tsr).nonce == 99
+    finally:
+        client.post("/api/receipts/clear", params={"cert_id": "stamp-cert"})
+
+
+def test_endpoint_stats_and_ranking():
+    c = TSAClient(endpoints=["http://a/", "http://b/", "http://c/"], hedge_after=0.3, hedge_min_samples=5)
+    for i in range(10):
+        c.stats("http://a/").record(0.20 + i * 0.001, True)
+        c.stats("http://b/").record(0.10, i % 2 == 0)        # 稍快但一半失败
+    assert c.ranked() == ["http://c/", "http://a/", "http://b/"]   # 没样本的先试
+    c.stats("http://c/").record(0.01, True)
+    assert c.ranked()[0] == "http://c/" and c.hedge_delay("http://c/") == 0.3   # 样本不够用默认
+    assert abs(c.hedge_delay("http://a/") - 0.209) < 1e-9
+    snap = {r["endpoint"]: r for r in c.report()}
+    assert snap["http://b/"]["error_rate"] == 0.5 and snap["http://a/"]["p50_ms"] == 205.0
+
+
+def test_hedged_submit_bounds_tail_latency():
+    hits = []
+
+    async def handler(request):
+        hits.append(request.url.host)
+        if request.url.host == "slow":
+            await asyncio.sleep(2.0)
+        elif request.url.host == "down":
+            return httpx.Response(503)
+        return httpx.Response(200, content=request.url.host.encode())
+
+    async def run():
+        c = TSAClient(endpoints=["http://slow/", "http://fast/"], hedge_after=0.05,
+                      transport=httpx.MockTransport(handler))
+        c.stats("http://fast/").record(0.5, True)           # 历史上 fast 较慢，先发 slow
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        out = await c.submit_hedged(b"q")
+        assert out == [("http://fast/", b"fast")] and loop.time() - t0 < 0.5
+        assert len(c.stats("http://slow/")) == 0             # 被取消的慢请求没有结果，不计样本
+
+        both = await c.submit_hedged(b"q", ["http://down/", "http://fast/", "http://other/"], want=2)
+        assert sorted(ep for ep, _ in both) == ["http://fast/", "http://other/"]
+        try:
+            await c.submit_hedged(b"q", ["http://down/"])
+            raise AssertionError("should fail")
+        except TSAError as e:
+            assert "all TSA endpoints failed" in str(e)
+        await c.aclose()
+    asyncio.run(run())
+
+
+def test_stamp_stores_one_receipt_per_tsa(isolated_db, monkeypatch):
+    mirror = "http://mirror/api/tsa/mock"
+    monkeypatch.setattr(tsa_client, "client", TSAClient(
+        endpoints=[MOCK, mirror], transport=httpx.ASGITransport(app=main.app)))
+    try:
+        r = client.post("/v1/upgrade25/tsa/stamp", json={"cert_id": "multi-cert", "digest": "ab" * 32, "redundancy": 2})
+        j = r.json()
+        assert r.status_code == 200 and len(j["tokens"]) == 2
+        assert {t["endpoint"] for t in j["tokens"]} == {MOCK, mirror}
+        main.receipt_writer.flush()
+        body = client.get("/api/receipts/export", params={"cert_id": "multi-cert", "format": "ndjson"}).text
+        assert all(f"tsr:{t['serial']}" in body for t in j["tokens"])
+        rows = client.get("/api/tsa/endpoints").json()["endpoints"]
+        assert {row["endpoint"] for row in rows} == {MOCK, mirror} and all(row["samples"] for row in rows)
+    finally:
+        client.post("/api/receipts/clear", params={"cert_id": "multi-cert"})
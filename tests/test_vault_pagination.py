@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Vault 键集分页：游标前后翻页要与“全量排序再切片”的结果一致。
+运行：
+  py -3 -m pytest -q tests/test_vault_pagination.py
+"""
+from fastapi.testclient import TestClient
+
+from app.main import app, _append_receipt
+from app.receipt_store import ReceiptStore
+
+client = TestClient(app)
+
+
+def _seed_store(n=53):
+    s = ReceiptStore()
+    for i in range(n):
+        s.append(f"c{i % 3}", {
+            "provider": "tsa" if i % 2 else "chain",
+            "status": "ok",
+            "txid": f"0x{(i * 7919) % 1000:04d}",
+            # 有意制造相同时间，验证 (值, id) 作为并列键
+            "time": f"2026-10-01 10:{i // 2:02d}:00",
+        })
+    return s
+
+
+def _walk(s, sort, reverse, size, **flt):
+    out, after = [], None
+    while True:
+        rows, keys, more = s.page(sort, reverse, after, size, **flt)
+        out.extend(r["id"] for r in rows)
+        if not more:
+            return out
+        after = keys[-1]
+
+
+def test_keyset_matches_full_sort():
+    s = _seed_store()
+    for sort in ("created_at", "txid", "provider"):
+        for reverse in (True, False):
+            expect = sorted(range(1, 54), key=lambda rid: (s._low[rid][sort], rid), reverse=reverse)
+            assert _walk(s, sort, reverse, 10) == expect
+            sel = [rid for rid in expect if s.view(rid)["cert_id"] == "c1"]
+            assert _walk(s, sort, reverse, 4, cert_id="c1") == sel
+
+
+def test_cert_page_seeks_per_cert_index():
+    s = _seed_store(300)
+    # 带 cert_id（+ 不够窄的等值条件）翻页只沿该 cert 的有序索引走，不再捞出整个 cert 的候选集
+    s.candidates = None
+    for reverse in (True, False):
+        expect = sorted((rid for rid in range(1, 301) if s.view(rid)["cert_id"] == "c2"
+                         and s.view(rid)["provider"] == "tsa"),
+                        key=lambda rid: (s._low[rid]["txid"], rid), reverse=reverse)
+        assert _walk(s, "txid", reverse, 7, cert_id="c2", eq={"provider": "TSA"}) == expect
+    s.trim("c2", 10)
+    assert len(_walk(s, "created_at", True, 3, cert_id="c2")) == 10
+
+
+def test_count_cache_follows_writes():
+    s = _seed_store(30)
+    calls = []
+    match = lambda row: calls.append(1) or row["provider"] == "tsa"
+    assert s.count("c0", match=match, cache_key="provider:tsa") == 5
+    n = len(calls)
+    assert s.count("c0", match=match, cache_key="provider:tsa") == 5 and len(calls) == n
+    s.append("c1", {"provider": "tsa", "status": "ok", "txid": "0x1", "time": "2026-10-01 11:00:00"})
+    assert s.count("c0", match=match, cache_key="provider:tsa") == 5 and len(calls) == n   # 别的 cert 写入不影响
+    s.append("c0", {"provider": "tsa", "status": "ok", "txid": "0x2", "time": "2026-10-01 11:00:01"})
+    assert s.count("c0", match=match, cache_key="provider:tsa") == 6
+    s.clear("c0")
+    assert s.count("c0", match=match, cache_key="provider:tsa") == 0
+
+
+def test_vault_json_cursors_roundtrip(isolated_db):
+    cert = "page-cert"
+    for i in range(12):
+        _append_receipt(app, cert, {"provider": "tsa", "status": "ok",
+                                    "txid": f"0xPG{i:02d}", "time": f"2026-10-02 08:00:{i:02d}"})
+    j1 = client.get(f"/api/vault?cert_id={cert}&size=5").json()
+    assert j1["total"] == 12 and j1["prev"] is None
+    assert [r["txid"] for r in j1["rows"]] == [f"0xPG{i:02d}" for i in (11, 10, 9, 8, 7)]
+
+    j2 = client.get(f"/api/vault?cert_id={cert}&size=5&cursor={j1['next']}").json()
+    assert [r["txid"] for r in j2["rows"]] == [f"0xPG{i:02d}" for i in (6, 5, 4, 3, 2)]
+
+    back = client.get(f"/api/vault?cert_id={cert}&size=5&cursor={j2['prev']}").json()
+    assert back["rows"] == j1["rows"] and back["prev"] is None
+
+    fast = client.get(f"/api/vault?cert_id={cert}&size=5&cursor={j1['next']}&total=false").json()
+    assert fast["total"] is None and fast["rows"] == j2["rows"]
+
+    r = client.get(f"/vault?cert_id={cert}&size=5&page=3")
+    assert r.status_code == 200 and "0xPG01" in r.text and "0xPG02" not in r.text
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Verify 页缓存：ETag / Last-Modified 返回 304，写路径让缓存失效。
+运行：
+  py -3 -m pytest -q tests/test_verify_cache.py
+"""
+from fastapi.testclient import TestClient
+
+import app.main as main
+from app.page_cache import PageCache
+
+client = TestClient(main.app)
+
+
+def test_page_cache_token_guards_stale_store():
+    c = PageCache(ttl=60)
+    entry, token = c.lookup("k")
+    assert entry is None
+    c.invalidate("k")                     # 构建期间被失效
+    c.store("k", "old", token)
+    assert c.lookup("k")[0] is None
+
+    entry, token = c.lookup("k")
+    e1 = c.store("k", "body", token)
+    assert c.lookup("k")[0] is e1
+    c.invalidate("k")
+    e2 = c.store("k", "body", c.lookup("k")[1])
+    assert e2.etag == e1.etag and e2.last_modified == e1.last_modified
+
+
+def test_pruned_generation_does_not_revive_stale_token():
+    c = PageCache(ttl=60, max_entries=2)
+    _, token = c.lookup("k")
+    c.invalidate("k")                     # 构建期间被失效……
+    for i in range(5):                    # ……随后 k 的代数记录被裁掉
+        c.invalidate(f"other{i}")
+    c.store("k", "stale", token)
+    assert c.lookup("k")[0] is None
+
+    c.store("a", "v1", c.lookup("a")[1])
+    _, token = c.lookup("a")              # 过期重建时拿的 token
+    c.invalidate("a")
+    for k in ("b", "c"):                  # LRU 淘汰 a，连同它的代数记录
+        c.store(k, k, c.lookup(k)[1])
+    c.store("a", "stale", token)
+    assert c.lookup("a")[0] is None
+
+
+def test_verify_page_304_and_invalidation(isolated_db):
+    cert = "cache-cert"
+    assert client.post("/api/evidence/update", json={"cert_id": cert, "title": "初版标题"}).json()["ok"]
+    r1 = client.get(f"/verify_upgrade/{cert}")
+    assert r1.status_code == 200 and "初版标题" in r1.text
+    etag = r1.headers["etag"]
+
+    r2 = client.get(f"/verify_upgrade/{cert}", headers={"If-None-Match": etag})
+    assert r2.status_code == 304 and r2.headers["etag"] == etag
+    r3 = client.get(f"/verify_upgrade/{cert}", headers={"If-Modified-Since": r1.headers["last-modified"]})
+    assert r3.status_code == 304
+
+    client.post("/api/evidence/update", json={"cert_id": cert, "title": "新标题", "case_id": "CASE-9"})
+    r4 = client.get(f"/verify_upgrade/{cert}", headers={"If-None-Match": etag})
+    assert r4.status_code == 200 and "CASE-9" in r4.text and r4.headers["etag"] != etag
+
+    main.sqlite_pool.conn().execute(
+        "INSERT INTO receipts (cert_id, provider, status, txid, created_at) VALUES (?,?,?,?,?)",
+        (cert, "tsa", "ok", "0xJOINED", "2026-10-01 10:00:00"))
+    main.sqlite_pool.conn().commit()
+    client.post(f"/api/receipts/clear?cert_id={cert}")   # 任一写路径都会失效
+    assert "0xJOINED" in client.get(f"/verify_upgrade/{cert}").text